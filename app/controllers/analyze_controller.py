@@ -1,119 +1,129 @@
-from fastapi import UploadFile, HTTPException, Depends, Request, BackgroundTasks
-from typing import List
+from fastapi import HTTPException, Depends, Request, BackgroundTasks
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from sqlalchemy.orm import Session
-from app.services.analyze_service import analyze_images
+from app.services.analyze_service import analyze_images_coalesced, analyze_images_stream
 from ..models.detection_model import PlantDetection
-from app.controllers.otp_controller import decode_access_token
-from app.utils.s3_uploader import upload_to_s3
-from app.config.db import get_db
+from app.controllers.otp_controller import get_current_mobile_async
+from app.controllers.product_controller import search_products_coalesced
+from app.utils.s3_uploader import upload_to_s3, object_url
+from app.utils.upload_reader import read_image_form, SpooledImage, MAX_IMAGE_BYTES, IMAGE_EXTENSIONS
+from app.services.job_queue import analyze_jobs
+from app.services.health import detection_writes
+from app.services.detection_analytics import analytics_rows, record_detections
+from app.services.admission import ADMISSION_MAX_QUEUED_BYTES
+from app.services.metrics import STAGE_SECONDS, timed
+from app.config.db import get_db, SessionLocal
 from uuid import uuid4
 import time
 import asyncio
+import json
 import os
+import logging
 
+logger = logging.getLogger(__name__)
 
+# Fire-and-forget tasks (S3 uploads, batch saves): the event loop only keeps weak
+# references, so they are held here until done
+_background_tasks: set = set()
+
+
+def run_in_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+@timed("db_write")
 def save_to_database_background(db: Session, detection_data: dict):
     """Background task to save detection to database"""
+    ok = False
     try:
         detection = PlantDetection(**detection_data)
         db.add(detection)
+        # Ids for the analytics side table, read before the commit expires the object
+        db.flush()
+        analytics = analytics_rows([detection])
         db.commit()
-        print("✅ Detection saved to database (background)")
+        ok = True
+        logger.info("✅ Detection saved to database (background)")
+        record_detections(db, analytics)
     except Exception as e:
-        print(f"❌ Background DB save failed: {e}")
+        logger.error("❌ Background DB save failed: %s", e)
         db.rollback()
+    finally:
+        detection_writes.done(1, ok)
 
 
-async def handle_analyze(
-    images: List[UploadFile], 
-    request: Request, 
-    db: Session = Depends(get_db),
-    background_tasks: BackgroundTasks = None
-):
-    """
-    OPTIMIZED: Parallel processing for faster response
-    - AI analysis runs first (priority)
-    - S3 upload runs in background
-    - Database save runs in background
-    """
-    
-    start_time = time.time()
-    
-    # 1. Authentication
-    authorization = request.headers.get("Authorization")
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(401, "Invalid authorization header")
-    
-    token = authorization.split(" ")[1]
-    payload = decode_access_token(token)
-    
-    if not payload:
-        raise HTTPException(401, "Invalid or expired token")
-    
-    mobile = payload.get("sub")
-    if not mobile:
-        raise HTTPException(401, "Invalid token payload")
-
-    if not 1 <= len(images) <= 2:
+@timed("image_read")
+async def read_uploads(request: Request) -> List[SpooledImage]:
+    """Stream the form's 1-2 images into spools; nothing is left open if any image is rejected."""
+    uploaded_images, _ = await read_image_form(request, max_files=2)
+    if not uploaded_images:
         raise HTTPException(400, "Upload 1-2 images")
+    return uploaded_images
 
-    auth_time = time.time() - start_time
 
-    # 2. Read images into memory
-    read_start = time.time()
-    image_bytes_list = []
-    filenames = []
-    content_types = []
-    
-    for img in images:
-        if img.content_type not in ("image/jpeg", "image/png", "image/webp"):
-            raise HTTPException(400, f"Invalid type: {img.content_type}")
-        
-        data = await img.read()
-        if len(data) > 10 * 1024 * 1024:
-            raise HTTPException(400, "Image too large (max 10MB)")
-        
-        image_bytes_list.append(data)
-        filenames.append(img.filename)
-        content_types.append(img.content_type)
-    
-    read_time = time.time() - read_start
+def close_uploads(uploaded_images: List[SpooledImage], keep: int = None):
+    for idx, uploaded in enumerate(uploaded_images):
+        if idx != keep:
+            uploaded.close()
 
-    # 3. Run AI analysis (PRIORITY - don't wait for S3)
-    analysis_start = time.time()
-    result = await analyze_images(image_bytes_list)
-    
-    if "error" in result:
-        raise HTTPException(500, result["error"])
-    
-    analysis_time = time.time() - analysis_start
 
-    # 4. S3 upload in background (non-blocking)
+@timed("db_write")
+def save_detections_background(db: Session, detections: List[dict]):
+    """Background task to bulk-save many detections in one commit"""
+    ok = False
+    try:
+        rows = [PlantDetection(**detection_data) for detection_data in detections]
+        db.add_all(rows)
+        db.flush()
+        analytics = analytics_rows(rows)
+        db.commit()
+        ok = True
+        logger.info("✅ %d detections saved to database (background)", len(detections))
+        record_detections(db, analytics)
+    except Exception as e:
+        logger.error("❌ Background bulk DB save failed: %s", e)
+        db.rollback()
+    finally:
+        detection_writes.done(len(detections), ok)
+
+
+def start_image_upload(result: dict, uploaded_images: List[SpooledImage]) -> str:
+    """
+    Fire-and-forget S3 upload of the selected image; other images are closed.
+    Returns the (placeholder) image URL.
+    """
     selected_idx = result.get('_metadata', {}).get('selected_image_index', 0)
-    selected_image_bytes = image_bytes_list[selected_idx]
-    selected_filename = filenames[selected_idx]
-    selected_content_type = content_types[selected_idx]
-    
-    filename = f"plant_detections/{uuid4()}_{selected_filename}"
-    
+    selected_image = uploaded_images[selected_idx]
+    close_uploads(uploaded_images, keep=selected_idx)
+
+    # Never derived from the client's multipart filename: uuid + sniffed type only
+    filename = f"plant_detections/{uuid4()}{IMAGE_EXTENSIONS.get(selected_image.content_type, '')}"
+
     # Placeholder URL (S3 upload happens in background)
-    bucket_name = os.getenv("AWS_BUCKET_NAME")
-    region = os.getenv("AWS_REGION")
-    image_url = f"https://{bucket_name}.s3.{region}.amazonaws.com/{filename}"
-    
+    image_url = object_url(filename)
+
     # Start S3 upload asynchronously (don't wait)
     async def upload_in_background():
         try:
-            await upload_to_s3(selected_image_bytes, filename, selected_content_type)
-            print(f"✅ S3 upload completed: {filename}")
+            with STAGE_SECONDS.labels("s3_upload").time():
+                await upload_to_s3(selected_image.stream(), filename, selected_image.content_type)
+            logger.info("✅ S3 upload completed: %s", filename)
         except Exception as e:
-            print(f"❌ S3 upload failed: {e}")
-    
+            logger.error("❌ S3 upload failed: %s", e)
+        finally:
+            selected_image.close()
+
     # Fire and forget
-    asyncio.create_task(upload_in_background())
-    
-    # 5. Database save in background
-    detection_data = {
+    run_in_background(upload_in_background())
+    return image_url
+
+
+def build_detection_data(mobile: str, result: dict, image_url: str) -> dict:
+    return {
         "mobile": mobile,
         "common_name": result.get("common_name"),
         "scientific_name": result.get("scientific_name"),
@@ -126,22 +136,330 @@ async def handle_analyze(
         "treatment": result.get("treatment"),
         "image": image_url
     }
-    
+
+
+def persist_detection(
+    result: dict,
+    uploaded_images: List[SpooledImage],
+    mobile: str,
+    db: Session,
+    background_tasks: BackgroundTasks = None
+) -> str:
+    """
+    Fire-and-forget S3 upload of the selected image + background DB save.
+    Returns the (placeholder) image URL.
+    """
+    image_url = start_image_upload(result, uploaded_images)
+    detection_data = build_detection_data(mobile, result, image_url)
+
+    detection_writes.add(1)
     if background_tasks:
         background_tasks.add_task(save_to_database_background, db, detection_data)
     else:
         # Fallback: save synchronously
         save_to_database_background(db, detection_data)
-    
+
+    return image_url
+
+
+async def recommend_products(result: dict) -> List[dict]:
+    """
+    Ranked products for every entry in disease_scientific_name (same order),
+    looked up concurrently against the cached catalog index.
+    """
+    plant = result.get("scientific_name") or ""
+    diseases = [d for d in result.get("disease_scientific_name") or [] if isinstance(d, str) and d.strip()]
+    unique_diseases = list(dict.fromkeys(diseases))
+    matches = await asyncio.gather(*[search_products_coalesced(disease, plant) for disease in unique_diseases])
+    by_disease = dict(zip(unique_diseases, matches))
+    return [{"disease_scientific_name": disease, "products": by_disease[disease]} for disease in diseases]
+
+
+async def run_analysis(
+    uploaded_images: List[SpooledImage],
+    mobile: str,
+    db: Session,
+    background_tasks: BackgroundTasks = None,
+    timing: dict = None,
+    start_time: float = None
+):
+    """
+    Analysis + persistence + product recommendation stage of /analyze, shared by the
+    synchronous and job modes. Takes ownership of `uploaded_images` (closed once no longer needed).
+    """
+    start_time = start_time or time.time()
+    timing = timing or {}
+
+    # 3. Run AI analysis (PRIORITY - don't wait for S3)
+    analysis_start = time.time()
+    try:
+        result = await analyze_images_coalesced(uploaded_images)
+    except BaseException:
+        # Cancellation (client gone) included: the uploads are ours to close
+        close_uploads(uploaded_images)
+        raise
+
+    if "error" in result:
+        close_uploads(uploaded_images)
+        raise HTTPException(500, result["error"])
+
+    analysis_time = time.time() - analysis_start
+
+    # 4. Product lookup runs alongside S3 upload + database save
+    lookup_start = time.time()
+    lookup_task = asyncio.create_task(recommend_products(result))
+
+    image_url = persist_detection(result, uploaded_images, mobile, db, background_tasks)
+
+    try:
+        recommended_products = await lookup_task
+    except Exception as e:
+        logger.error("❌ Product lookup failed: %s", e)
+        recommended_products = []
+    lookup_time = time.time() - lookup_start
+
     total_time = time.time() - start_time
-    
+
     # Add timing to response
     result['_timing'] = {
         'total_seconds': round(total_time, 2),
-        'auth': round(auth_time, 2),
-        'image_read': round(read_time, 2),
+        **timing,
         'ai_analysis': round(analysis_time, 2),
+        'product_lookup': round(lookup_time, 3),
         'note': 'S3 upload and DB save run in background'
     }
-    
-    return {"message": "Detection saved", "data": {**result, "image": image_url}}
\ No newline at end of file
+
+    return {"message": "Detection saved", "data": {**result, "image": image_url, "recommended_products": recommended_products}}
+
+
+async def handle_analyze(
+    request: Request,
+    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks = None
+):
+    """
+    OPTIMIZED: Parallel processing for faster response
+    - AI analysis runs first (priority)
+    - S3 upload runs in background
+    - Database save runs in background
+    """
+
+    start_time = time.time()
+
+    # 1. Authentication
+    mobile = await get_current_mobile_async(request)
+
+    auth_time = time.time() - start_time
+
+    # 2. Read images in chunks (sniffed format, early size abort, spooled to disk when large)
+    read_start = time.time()
+    uploaded_images = await read_uploads(request)
+    read_time = time.time() - read_start
+
+    timing = {'auth': round(auth_time, 2), 'image_read': round(read_time, 2)}
+    return await run_analysis(uploaded_images, mobile, db, background_tasks, timing, start_time)
+
+
+# Batch mode limits
+BATCH_MAX_PLANTS = int(os.getenv("BATCH_MAX_PLANTS", 50))
+BATCH_UPSTREAM_CONCURRENCY = int(os.getenv("BATCH_UPSTREAM_CONCURRENCY", 8))
+# Largest /analyze/batch body worth parsing (checked by the upload-size middleware).
+# Admission 413s anything over its queued-bytes budget before this limit is seen, so a
+# batch is capped by that budget too (256MB by default: ~12 full-size 2-image plants).
+MAX_BATCH_REQUEST_BYTES = min(BATCH_MAX_PLANTS * 2 * MAX_IMAGE_BYTES + 256 * 1024, ADMISSION_MAX_QUEUED_BYTES)
+
+# Shared by every batch request in this process
+batch_upstream_limiter = asyncio.Semaphore(BATCH_UPSTREAM_CONCURRENCY)
+
+
+def parse_group_sizes(groups: Optional[str], image_count: int) -> List[int]:
+    """
+    "2,1,2" -> images per plant, in upload order. Defaults to one image per plant.
+    """
+    if not groups:
+        sizes = [1] * image_count
+    else:
+        try:
+            sizes = [int(size) for size in groups.split(",")]
+        except ValueError:
+            raise HTTPException(400, "groups must be comma-separated image counts, e.g. 2,1,2")
+
+    if any(not 1 <= size <= 2 for size in sizes):
+        raise HTTPException(400, "Each plant needs 1-2 images")
+    if sum(sizes) != image_count:
+        raise HTTPException(400, f"groups account for {sum(sizes)} images but {image_count} were uploaded")
+    if not 1 <= len(sizes) <= BATCH_MAX_PLANTS:
+        raise HTTPException(400, f"Upload 1-{BATCH_MAX_PLANTS} plants per batch")
+    return sizes
+
+
+def save_detections_in_new_session(detections: List[dict]):
+    db = SessionLocal()
+    try:
+        save_detections_background(db, detections)
+    finally:
+        db.close()
+
+
+async def handle_analyze_batch(request: Request):
+    """
+    BATCH: Many plants in one request, streamed back as NDJSON in completion order.
+    - One auth, uploads read once
+    - Preprocessing runs in parallel threads, upstream calls under a shared limiter
+    - All detections persisted in one bulk commit once the batch finishes
+    """
+    start_time = time.time()
+    mobile = await get_current_mobile_async(request)
+
+    uploaded_images, fields = await read_image_form(request, max_files=2 * BATCH_MAX_PLANTS)
+    try:
+        sizes = parse_group_sizes(fields.get("groups"), len(uploaded_images))
+    except HTTPException:
+        close_uploads(uploaded_images)
+        raise
+
+    plants = []
+    offset = 0
+    for size in sizes:
+        plants.append(uploaded_images[offset:offset + size])
+        offset += size
+
+    async def analyze_plant(idx: int, plant_images: List[SpooledImage]):
+        try:
+            result = await analyze_images_coalesced(plant_images, limiter=batch_upstream_limiter)
+        except asyncio.CancelledError:
+            close_uploads(plant_images)
+            raise
+        except Exception as e:
+            result = {"error": f"Analysis failed: {str(e)}"}
+
+        if "error" in result:
+            close_uploads(plant_images)
+            return idx, result
+
+        image_url = start_image_upload(result, plant_images)
+        result['_timing'] = {'total_seconds': round(time.time() - start_time, 2)}
+        return idx, {**result, "image": image_url}
+
+    async def result_stream():
+        tasks = [asyncio.create_task(analyze_plant(idx, plant)) for idx, plant in enumerate(plants)]
+        detections = []
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                idx, data = await next_done
+                if "error" in data:
+                    failed += 1
+                    yield json.dumps({"plant": idx, "error": data["error"]}) + "\n"
+                else:
+                    detections.append(build_detection_data(mobile, data, data["image"]))
+                    yield json.dumps({"plant": idx, "data": data}) + "\n"
+
+            yield json.dumps({"summary": {
+                "plants": len(plants),
+                "succeeded": len(detections),
+                "failed": failed,
+                "total_seconds": round(time.time() - start_time, 2),
+            }}) + "\n"
+        finally:
+            # Client gone mid-batch: stop paying for the remaining analyses
+            for task in tasks:
+                task.cancel()
+            if detections:
+                detection_writes.add(len(detections))
+                run_in_background(asyncio.to_thread(save_detections_in_new_session, detections))
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
+# Upper bound for GET /analyze/jobs/{id}?wait=
+MAX_JOB_WAIT_SECONDS = 30
+
+
+async def submit_analyze_job(request: Request):
+    """
+    JOB MODE: Validate + spool uploads, queue the analysis and return a job id immediately.
+    The queued job runs the same run_analysis pipeline as handle_analyze.
+    """
+    start_time = time.time()
+    mobile = await get_current_mobile_async(request)
+
+    # Backpressure before any image body is read
+    analyze_jobs.reject_if_full()
+
+    read_start = time.time()
+    uploaded_images = await read_uploads(request)
+    timing = {'image_read': round(time.time() - read_start, 2)}
+
+    async def run():
+        db = SessionLocal()
+        background_tasks = BackgroundTasks()
+        try:
+            response = await run_analysis(uploaded_images, mobile, db, background_tasks, timing, start_time)
+            await background_tasks()
+            return response
+        finally:
+            db.close()
+
+    job = analyze_jobs.submit(mobile, run, cleanup=lambda: close_uploads(uploaded_images))
+    return {"job_id": job.id, "status": job.status, "poll_url": f"/analyze/jobs/{job.id}"}
+
+
+async def get_analyze_job(job_id: str, mobile: str, wait: float = 0):
+    """Job status/result; `wait` long-polls up to MAX_JOB_WAIT_SECONDS for completion."""
+    job = analyze_jobs.get(job_id, mobile)
+    await analyze_jobs.wait(job, min(max(wait, 0), MAX_JOB_WAIT_SECONDS))
+    return job.to_dict()
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def handle_analyze_stream(request: Request):
+    """
+    STREAMING: Server-sent events variant of handle_analyze.
+    received -> preprocessed -> plant -> result -> products (or error)
+    The stream outlives the request's dependencies, so the detection is saved in a
+    session of its own (same as the batch mode).
+    """
+    start_time = time.time()
+
+    # Auth and upload validation fail fast with regular HTTP errors
+    mobile = await get_current_mobile_async(request)
+    uploaded_images = await read_uploads(request)
+
+    async def event_stream():
+        persisted = False
+        try:
+            yield _sse("received", {"images": len(uploaded_images)})
+
+            result = None
+            async for event, data in analyze_images_stream(uploaded_images):
+                if event == "result":
+                    result = data
+                elif event == "error":
+                    yield _sse("error", data)
+                    return
+                else:
+                    yield _sse(event, data)
+
+            image_url = start_image_upload(result, uploaded_images)
+            persisted = True
+            detection_writes.add(1)
+            # Saved before "result" goes out: a client leaving right after it keeps its history
+            await asyncio.to_thread(save_detections_in_new_session, [build_detection_data(mobile, result, image_url)])
+            result['_timing'] = {'total_seconds': round(time.time() - start_time, 2)}
+            yield _sse("result", {**result, "image": image_url})
+
+            products = await recommend_products(result)
+            yield _sse("products", products)
+        finally:
+            if not persisted:
+                close_uploads(uploaded_images)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
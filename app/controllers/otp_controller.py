@@ -1,16 +1,32 @@
 import time
 import random 
 import os
+import hashlib
+import threading
+import logging
 import requests
+from collections import OrderedDict
 from jose import jwt
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from app.config.db import SessionLocal
-from app.models.otp_model import OTP
+from app.models.otp_model import OTP, TokenVersion
+from app.services.metrics import CACHE_EVENTS, timed
+
+logger = logging.getLogger(__name__)
 
 # JWT Configuration (merged from jwt_handler.py)
 SECRET_KEY = os.getenv("JWT_SECRET")
 ALGORITHM = "HS256"
+# Optional token lifetime; unset keeps the historical non-expiring tokens
+JWT_EXPIRE_SECONDS = int(os.getenv("JWT_EXPIRE_SECONDS", 0))
+
+# Verified-token cache. The TTL also bounds how long a logout handled by another
+# worker / instance takes to reach this one (versions are re-checked on every miss).
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 4096))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
 
 # OTP SMS Configuration
 E2A_API_KEY = os.getenv("E2A_API_KEY")
@@ -29,11 +45,37 @@ def get_db():
 
 
 def create_access_token(data: dict):
-    """Persistent JWT token without expiry."""
-    encoded_jwt = jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
+    """JWT token; persistent unless JWT_EXPIRE_SECONDS is configured."""
+    to_encode = dict(data)
+    if JWT_EXPIRE_SECONDS > 0:
+        to_encode["exp"] = int(time.time()) + JWT_EXPIRE_SECONDS
+    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def current_token_version(mobile: str, db: Session = None) -> int:
+    """Version a token for `mobile` must carry to be valid (shared through the database)."""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        row = db.get(TokenVersion, mobile)
+        return row.version if row else 0
+    finally:
+        if own_session:
+            db.close()
+
+
+def bump_token_version(mobile: str, db: Session) -> int:
+    """Invalidate every token issued to `mobile` so far, in every process."""
+    updated = db.query(TokenVersion).filter(TokenVersion.mobile == mobile).update(
+        {TokenVersion.version: TokenVersion.version + 1}, synchronize_session=False
+    )
+    if not updated:
+        db.add(TokenVersion(mobile=mobile, version=1))
+    db.commit()
+    return current_token_version(mobile, db)
+
+
 def decode_access_token(token: str):
     """Decode and validate JWT token."""
     try:
@@ -43,6 +85,190 @@ def decode_access_token(token: str):
         return None
 
 
+class VerifiedTokenCache:
+    """
+    Bounded LRU of sha256(token) -> verified payload.
+    - Entries live at most `ttl` seconds and never past the token's `exp` claim
+    - A miss decodes the JWT and checks its "ver" claim against the user's current
+      token version (tokens without the claim are version 0), so a logout anywhere
+      takes effect here within `ttl`, and at once in the process that handled it
+    """
+
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def _lookup(self, key: str, now: float):
+        """Fresh cached payload or None (expired entries are dropped); caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            payload, expires_at = entry
+            if now < expires_at:
+                self._entries.move_to_end(key)
+                return payload
+            del self._entries[key]
+        return None
+
+    def cached(self, token: str):
+        """Cached payload (counted as a hit) or None, without decoding: safe on the event loop."""
+        with self._lock:
+            payload = self._lookup(self.digest(token), time.time())
+            if payload is not None:
+                self.hits += 1
+                _token_cache_hits.inc()
+            return payload
+
+    def get(self, token: str):
+        """
+        Verified payload or None. A miss decodes the JWT and queries the user's token
+        version (blocking: call from a thread when on the event loop). Database errors
+        propagate as SQLAlchemyError.
+        """
+        key = self.digest(token)
+        now = time.time()
+        with self._lock:
+            payload = self._lookup(key, now)
+            if payload is not None:
+                self.hits += 1
+                _token_cache_hits.inc()
+                return payload
+            self.misses += 1
+            _token_cache_misses.inc()
+
+        payload = decode_access_token(token)
+        if not payload:
+            return None
+        if payload.get("ver", 0) != current_token_version(payload.get("sub", "")):
+            return None
+
+        expires_at = now + self.ttl
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return payload
+
+    def peek(self, token: str):
+        """
+        Who is asking, not whether they may: the cached payload, else a signature-checked
+        decode without the version lookup. Nothing is cached or counted (admission keys).
+        """
+        with self._lock:
+            payload = self._lookup(self.digest(token), time.time())
+        return payload if payload is not None else decode_access_token(token)
+
+    def forget_user(self, mobile: str):
+        """Drop every cached token of `mobile` (after its token version changed)."""
+        with self._lock:
+            for key in [key for key, (payload, _) in self._entries.items() if payload.get("sub") == mobile]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+token_cache = VerifiedTokenCache()
+
+_token_cache_hits = CACHE_EVENTS.labels("auth_token", "hit")
+_token_cache_misses = CACHE_EVENTS.labels("auth_token", "miss")
+
+
+def get_bearer_token(request: Request, allow_query: bool = False):
+    """Bearer token from the Authorization header; ?token= only where `allow_query`."""
+    authorization = request.headers.get("Authorization")
+    if authorization:
+        if not authorization.startswith("Bearer "):
+            raise HTTPException(401, "Invalid authorization header")
+        return authorization.split(" ")[1]
+    return request.query_params.get("token") if allow_query else None
+
+
+def _require_token(token: str) -> str:
+    if not token:
+        raise HTTPException(401, "Invalid authorization header")
+    return token
+
+
+def _mobile_from_payload(payload) -> str:
+    if not payload:
+        raise HTTPException(401, "Invalid or expired token")
+    mobile = payload.get("sub")
+    if not mobile:
+        raise HTTPException(401, "Invalid token payload")
+    return mobile
+
+
+def _mobile_from_token(token: str) -> str:
+    try:
+        payload = token_cache.get(_require_token(token))
+    except SQLAlchemyError as e:
+        # The token may well be valid: unavailable, not unauthorized
+        logger.error("❌ Token version lookup failed: %s", e)
+        raise HTTPException(503, "Authentication temporarily unavailable")
+    return _mobile_from_payload(payload)
+
+
+@timed("auth")
+def get_current_mobile(request: Request) -> str:
+    """
+    Reusable auth dependency: `mobile: str = Depends(get_current_mobile)`.
+    Verified tokens are served from `token_cache` instead of a full JWT decode.
+    """
+    return _mobile_from_token(get_bearer_token(request))
+
+
+@timed("auth")
+def get_current_mobile_allow_query(request: Request) -> str:
+    """get_current_mobile that also accepts ?token= (GET /history links only)."""
+    return _mobile_from_token(get_bearer_token(request, allow_query=True))
+
+
+@timed("auth")
+async def get_current_mobile_async(request: Request) -> str:
+    """
+    get_current_mobile for async handlers: cache hits are answered on the event loop,
+    misses (JWT decode + token version query) run in the threadpool.
+    """
+    token = _require_token(get_bearer_token(request))
+    payload = token_cache.cached(token)
+    if payload is not None:
+        return _mobile_from_payload(payload)
+    return await run_in_threadpool(_mobile_from_token, token)
+
+
+def revoke_user_tokens(mobile: str, db: Session):
+    """Logout: every token issued to `mobile` so far stops working, in every process."""
+    bump_token_version(mobile, db)
+    token_cache.forget_user(mobile)
+
+
 class OTPController:
     @staticmethod
     def send_otp(mobile: str, db: Session):
@@ -97,8 +323,8 @@ class OTPController:
             db.delete(otp_entry)  
             db.commit()
 
-            # Generate JWT token
-            token = create_access_token({"sub": mobile})
+            # Generate JWT token at the user's current version (bumped by logout)
+            token = create_access_token({"sub": mobile, "ver": current_token_version(mobile, db)})
 
             return {
                 "message": "OTP verified successfully",
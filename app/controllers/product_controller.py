@@ -1,15 +1,20 @@
 import os
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from sqlalchemy.orm import Session
 from app.config.db import get_db
 from app.models.product_model import Product
-from app.services.match_utils import fuzzy_lookup, normalize, tokenize_scientific_name
-from app.services.product_cache import get_cached_products
-from typing import List, Dict, Any
+from app.services.match_utils import fuzzy_lookup, canonicalize, score_matrix
+from app.services.product_cache import get_cached_products, get_product_index, get_name_matrix_index, get_typeahead_index, find_products_by_disease
+from app.services.single_flight import SingleFlight
+from app.services.catalog_response import catalog_responses, etag_matches, CATALOG_FIELDS
+from app.services.metrics import timed
+from app.config.logging_config import should_trace
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 from difflib import SequenceMatcher
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 SCORE_CUTOFF = int(os.getenv("FUZZY_SCORE_CUTOFF", 85))
@@ -42,6 +47,172 @@ def get_all_products():
             detail=f"Error fetching products: {str(e)}"
         )
 
+def parse_catalog_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Comma-separated projection -> canonical field tuple (None = every field)."""
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested.difference(CATALOG_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(CATALOG_FIELDS)}")
+    return tuple(field for field in CATALOG_FIELDS if field in requested)
+
+def get_catalog_response(fields: Optional[str], offset: int, limit: Optional[int],
+                         accept_encoding: str, if_none_match: Optional[str]) -> Response:
+    """
+    Catalog body serialized once per catalog version (gzip when accepted), with a
+    strong ETag; a matching If-None-Match gets an empty 304.
+    """
+    if not get_cached_products():
+        raise HTTPException(status_code=404, detail="No products found")
+
+    body = catalog_responses.get(parse_catalog_fields(fields), offset, limit)
+    content, etag, encoding = body.select(accept_encoding)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+        "X-Total-Count": str(body.total),
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type="application/json", headers=headers)
+
+@timed("product_search")
+def search_products(disease_scientific_name: str, plant_scientific_name: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Rank cached products against a (disease, plant) pair using the combined
+    token + fuzzy score from match_utils. Returns up to `limit` products, best first.
+    """
+    # Canonicalize search terms ("P. infestans" -> "phytophthora infestans")
+    norm_disease = canonicalize(disease_scientific_name)
+    norm_plant = canonicalize(plant_scientific_name)
+
+    logger.info("Searching for disease: %s, plant: %s", norm_disease, norm_plant)
+
+    matched_products = []
+    # Catalog names are canonicalized once per cache load (see product_cache.PRODUCT_INDEX)
+    for product, product_disease, product_plant in get_product_index():
+        # Calculate match scores
+        disease_score = fuzzy_lookup(norm_disease, (product_disease,), score_cutoff=60)
+        plant_score = fuzzy_lookup(norm_plant, (product_plant,), score_cutoff=60)
+
+        if disease_score and plant_score:
+            disease_match = disease_score[0][1]
+            plant_match = plant_score[0][1]
+            
+            # Combined weighted score
+            total_score = (disease_match * 0.6) + (plant_match * 0.4)
+            
+            if total_score >= 60:  # Lower threshold for better matching
+                matched_products.append({
+                    "product": product,
+                    "score": total_score,
+                    "match_details": {
+                        "disease_match": disease_match,
+                        "plant_match": plant_match
+                    }
+                })
+
+    # Sort by score and take top matches
+    matched_products.sort(key=lambda x: x['score'], reverse=True)
+    return [match['product'] for match in matched_products[:limit]]
+
+# Pairs scored per block in batch search (bounds the pairs x products score matrix)
+BATCH_SEARCH_BLOCK = 256
+
+
+@timed("product_search_batch")
+def search_products_batch(pairs: List[Tuple[str, str]], limit: int = 5) -> List[List[Dict[str, Any]]]:
+    """
+    Batch form of search_products with identical scoring semantics:
+    - Pairs are canonicalized and deduplicated
+    - Each distinct query is scored once against each distinct catalog name (score_matrix)
+    - Per-product scores are gathered from those matrices and ranked per pair
+    Returns one ranked product list per input pair, in input order.
+    """
+    index = get_name_matrix_index()
+    normalized = [(canonicalize(disease), canonicalize(plant)) for disease, plant in pairs]
+    unique_pairs = list(dict.fromkeys(normalized))
+    if not index.products or not unique_pairs:
+        return [[] for _ in pairs]
+
+    disease_queries = list(dict.fromkeys(disease for disease, _ in unique_pairs))
+    plant_queries = list(dict.fromkeys(plant for _, plant in unique_pairs))
+    disease_scores = score_matrix(disease_queries, index.disease_names, score_cutoff=60)
+    plant_scores = score_matrix(plant_queries, index.plant_names, score_cutoff=60)
+
+    disease_row = {q: i for i, q in enumerate(disease_queries)}
+    plant_row = {q: i for i, q in enumerate(plant_queries)}
+
+    ranked: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for start in range(0, len(unique_pairs), BATCH_SEARCH_BLOCK):
+        block = unique_pairs[start:start + BATCH_SEARCH_BLOCK]
+        # (pairs in block) x (products) score matrices
+        per_disease = disease_scores[[disease_row[d] for d, _ in block]][:, index.disease_pos]
+        per_plant = plant_scores[[plant_row[p] for _, p in block]][:, index.plant_pos]
+        total = per_disease * 0.6 + per_plant * 0.4
+        total[(per_disease < 0) | (per_plant < 0) | (total < 60)] = -np.inf
+
+        for row, pair in enumerate(block):
+            scores = total[row]
+            candidates = np.flatnonzero(scores > -np.inf)
+            # Stable sort keeps catalog order among ties, as in search_products
+            order = candidates[np.argsort(-scores[candidates], kind="stable")][:limit]
+            ranked[pair] = [index.products[i] for i in order]
+
+    return [list(ranked[pair]) for pair in normalized]
+
+TYPEAHEAD_FIELDS = ("plant", "disease")
+
+
+@timed("typeahead")
+def typeahead(query: str, field: str = "all", limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+    """
+    Autocomplete over distinct plant / disease scientific names.
+    Prefix matches on any word start; falls back to fuzzy matching when nothing matches.
+    """
+    fields = TYPEAHEAD_FIELDS if field == "all" else (field,)
+
+    results, total = [], 0
+    for name_field in fields:
+        count, matches = get_typeahead_index(name_field).prefix(query, limit + offset)
+        total += count
+        results.extend((key, name, name_field) for key, name in matches)
+    match = "prefix"
+
+    if not results:
+        match = "fuzzy"
+        for name_field in fields:
+            count, matches = get_typeahead_index(name_field).fuzzy(query, limit + offset)
+            total += count
+            results.extend((-score, name, name_field) for score, name in matches)
+
+    # Prefix: matched word start, alphabetically; fuzzy: best score first
+    results.sort(key=lambda item: item[0])
+    page = results[offset:offset + limit]
+    return {
+        "query": query,
+        "field": field,
+        "match": match,
+        "total": total,
+        "results": [{"name": name, "field": name_field} for _, name, name_field in page],
+    }
+
+# Identical concurrent searches share one catalog scan
+search_flight = SingleFlight("search")
+
+
+async def search_products_coalesced(disease_scientific_name: str, plant_scientific_name: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """search_products keyed on the canonical query; runs off the event loop."""
+    key = (canonicalize(disease_scientific_name), canonicalize(plant_scientific_name), limit)
+    matches = await search_flight.do(
+        key, lambda: asyncio.to_thread(search_products, disease_scientific_name, plant_scientific_name, limit)
+    )
+    return list(matches)
+
 @router.get("/products/search", response_model=List[Dict[str, Any]])
 async def get_products_by_scientific_name(disease_scientific_name: str, plant_scientific_name: str):
     """
@@ -50,7 +221,9 @@ async def get_products_by_scientific_name(disease_scientific_name: str, plant_sc
     2. Then try token-based matching
     3. Finally fall back to fuzzy matching
     """
-    logger.info(f"Starting product search with disease: {disease_scientific_name}, plant: {plant_scientific_name}")
+    logger.info("Starting product search with disease: %s, plant: %s", disease_scientific_name, plant_scientific_name)
+    # Per-product trace lines only for a sampled fraction of searches, and only at DEBUG
+    trace = should_trace(logger)
     
     try:
         if not disease_scientific_name and not plant_scientific_name:
@@ -61,34 +234,31 @@ async def get_products_by_scientific_name(disease_scientific_name: str, plant_sc
             logger.warning("Product cache is empty. Search service is unavailable.")
             raise HTTPException(status_code=503, detail="Product service is temporarily unavailable.")
 
-        logger.info(f"Searching products for disease '{disease_scientific_name}' and plant '{plant_scientific_name}'")
-        logger.info(f"Total products in cache: {len(all_products)}")
+        logger.debug("Searching %d cached products", len(all_products))
 
-        # Normalize input
-        norm_disease = normalize(disease_scientific_name)
-        norm_plant = normalize(plant_scientific_name)
+        # Canonicalize input
+        norm_disease = canonicalize(disease_scientific_name)
+        norm_plant = canonicalize(plant_scientific_name)
         
         # Track matches at different confidence levels
         exact_matches = []
         strong_matches = []
         fuzzy_matches = []
 
-        logger.info(f"Normalized search terms - Disease: {norm_disease}, Plant: {norm_plant}")
+        logger.debug("Normalized search terms - Disease: %s, Plant: %s", norm_disease, norm_plant)
 
-        for product in all_products:
-            product_disease = normalize(product.get("disease_scientific_name", ""))
-            product_plant = normalize(product.get("scientific_name", ""))
-            
-            # Try exact matches first (case-insensitive)
-            logger.info(f"\nChecking product:")
-            logger.info(f"Product Name: {product.get('product_name')}")
-            logger.info(f"Scientific Name: {product.get('scientific_name')}")
-            logger.info(f"Disease: {product.get('disease')}")
-            logger.info(f"Disease Scientific Name: {product.get('disease_scientific_name')}")
+        # Catalog names were canonicalized when the cache was loaded (products without
+        # both names can't reach any score threshold, so the index leaves them out)
+        for product, product_disease, product_plant in get_product_index():
             
+            if trace:
+                logger.debug("Checking product", extra={"product": product.get("name"), "scientific_name": product.get("scientific_name"),
+                                                        "disease": product.get("disease"), "disease_scientific_name": product.get("disease_scientific_name")})
+
             # First try exact match
             if norm_disease == product_disease and norm_plant == product_plant:
-                logger.info(f"✅ EXACT MATCH - Score: 100")
+                if trace:
+                    logger.debug("✅ EXACT MATCH - Score: 100")
                 exact_matches.append({
                     "product": product,
                     "score": 100,
@@ -103,16 +273,13 @@ async def get_products_by_scientific_name(disease_scientific_name: str, plant_sc
             # Calculate weighted score
             combined_score = (disease_score * WEIGHT_DISEASE + plant_score * WEIGHT_PLANT)
             
-            logger.info(f"Matching scores:")
-            logger.info(f"Disease match: {disease_score:.2f}% ({norm_disease} vs {product_disease})")
-            logger.info(f"Plant match: {plant_score:.2f}% ({norm_plant} vs {product_plant})")
-            logger.info(f"Combined score: {combined_score:.2f}%")
+            if trace:
+                logger.debug("Matching scores", extra={"disease_match": round(disease_score, 2), "plant_match": round(plant_score, 2),
+                                                       "combined": round(combined_score, 2), "product_disease": product_disease, "product_plant": product_plant})
 
             if combined_score >= 85:  # Strong match
-                logger.info(f"Found strong match: {product.get('product_name')} (Score: {combined_score:.2f})")
                 strong_matches.append({"product": product, "score": combined_score})
             elif combined_score >= 70:  # Fuzzy match
-                logger.info(f"Found fuzzy match: {product.get('product_name')} (Score: {combined_score:.2f})")
                 fuzzy_matches.append({"product": product, "score": combined_score})
             
             # Fall back to fuzzy matching for remaining cases
@@ -132,15 +299,14 @@ async def get_products_by_scientific_name(disease_scientific_name: str, plant_sc
         # Sort by score and take top matches
         top_results = sorted(all_matches, key=lambda x: x["score"], reverse=True)[:5]
 
-        logger.info(f"Search results - Exact: {len(exact_matches)}, Strong: {len(strong_matches)}, Fuzzy: {len(fuzzy_matches)}")
+        logger.info("Search results - Exact: %d, Strong: %d, Fuzzy: %d", len(exact_matches), len(strong_matches), len(fuzzy_matches))
 
         if not top_results:
-            logger.warning(f"No products found matching disease '{disease_scientific_name}' and plant '{plant_scientific_name}'")
+            logger.warning("No products found matching disease '%s' and plant '%s'", disease_scientific_name, plant_scientific_name)
             raise HTTPException(status_code=404, detail="No matching products found.")
 
         # Return full product details
         matched_products = []
-        logger.info("\nFinal matches:")
         for match in top_results:
             product = match["product"]
             product_details = {
@@ -153,9 +319,8 @@ async def get_products_by_scientific_name(disease_scientific_name: str, plant_sc
                 "disease_scientific_name": product.get("disease_scientific_name", "N/A"),
                 "plant_scientific_name": product.get("scientific_name", "N/A")
             }
-            logger.info(f"\nMatch {product_details['id']}:")
-            for key, value in product_details.items():
-                logger.info(f"{key}: {value}")
+            if trace:
+                logger.debug("Final match", extra=product_details)
             matched_products.append(product_details)
 
         return matched_products
@@ -167,11 +332,15 @@ async def get_products_by_scientific_name(disease_scientific_name: str, plant_sc
         )
 
 @router.get("/products/by-disease/{disease_name}", response_model=List[Dict[str, Any]])
-def get_products_by_disease(disease_name: str, db: Session = Depends(get_db)):
+def get_products_by_disease(disease_name: str, limit: Optional[int] = None, offset: int = 0):
+    """
+    Products whose common disease name contains `disease_name` (case-insensitive),
+    served from the in-memory trigram index instead of an ILIKE table scan.
+    """
     try:
-        safe_disease_name = disease_name.replace('%', '\\%').replace('_', '\\_')
-        products = db.query(Product).filter(Product.disease_common_name.ilike(f"%{safe_disease_name}%")).all()
-        return [p.to_dict() for p in products]
+        products = find_products_by_disease(disease_name)
+        end = None if limit is None else offset + limit
+        return products[offset:end]
     except Exception as e:
         logger.error(f"Error fetching products by disease '{disease_name}': {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Internal server error.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Internal server error.")
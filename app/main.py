@@ -1,83 +1,136 @@
 import os
+import asyncio
+import logging
+from app.config.logging_config import setup_logging
+
+# Before the app imports below: several of them log while loading (YOLO, OpenAI client)
+setup_logging()
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 from app.routes.analyze_routes import router as analyze_router
 from app.routes.product_routes import router as product_router
 from app.routes.otp_routes import router as otp_routes
 from app.routes.history_routes import router as history_router
+from app.routes.debug_routes import router as debug_router
+from app.routes.analytics_routes import router as analytics_router
 from app.config.db import Base, engine
 from app.models.product_model import Product
 from app.services.product_import_service import ProductImportService
-from app.services.product_cache import load_products_into_cache
+from app.services.product_cache import load_products_into_cache, get_catalog_stats
+from app.controllers.otp_controller import token_cache
+from app.utils.upload_reader import MAX_IMAGE_BYTES, UploadLimitMiddleware
+from app.controllers.analyze_controller import MAX_BATCH_REQUEST_BYTES
+from app.services.job_queue import analyze_jobs
+from app.services.upstream_guard import upstream_breaker, upstream_hedge
+from app.services import analyze_service
+from app.services.analyze_service import analyze_flight
+from app.controllers.product_controller import search_flight
+from app.services.admission import AdmissionMiddleware, analyze_admission
+from app.services.health import stats_snapshot, deep_probe
+from app.services.metrics import render_metrics
+from app.services.profiler import ProfilingMiddleware, profiling_enabled
 from fastapi.middleware.cors import CORSMiddleware
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    print("\n" + "="*60)
-    print("🚀 STARTING APPLICATION")
-    print("="*60)
-    
-    print("📊 Creating database tables...")
+logger = logging.getLogger(__name__)
+
+# Set once tables, product import and catalog cache are ready. Workers forked by
+# app/server.py inherit a prepared master process and go straight to serving.
+application_prepared = False
+
+def prepare_application():
+    """Create tables, import Product_List.xlsx and load the catalog cache."""
+    global application_prepared
+    logger.info("📊 Creating database tables...")
     try:
         Base.metadata.create_all(bind=engine)
-        print("✅ Database tables ready")
+        logger.info("✅ Database tables ready")
     except Exception as db_error:
-        print(f"❌ Error creating database tables: {str(db_error)}")
+        logger.error("❌ Error creating database tables: %s", db_error)
         raise
     
-    print("\n📦 Checking product database...")
+    logger.info("📦 Checking product database...")
     try:
         excel_path = "Product_List.xlsx"
         parent_excel_path = os.path.join(os.path.dirname(os.getcwd()), "Product_List.xlsx")
         
         if os.path.exists(excel_path):
-            print(f"✅ Found Product_List.xlsx in current directory")
+            logger.info("✅ Found Product_List.xlsx in current directory")
         elif os.path.exists(parent_excel_path):
-            print(f"✅ Found Product_List.xlsx in parent directory")
+            logger.info("✅ Found Product_List.xlsx in parent directory")
             excel_path = parent_excel_path
         else:
-            print("❌ Product_List.xlsx not found!")
-            print("   Please ensure Product_List.xlsx is present in the root directory")
-            print(f"   Current directory: {os.getcwd()}")
-            print(f"   Parent directory: {os.path.dirname(os.getcwd())}")
+            logger.error("❌ Product_List.xlsx not found! Please ensure it is present in the root directory "
+                         "(current directory: %s, parent directory: %s)", os.getcwd(), os.path.dirname(os.getcwd()))
             raise FileNotFoundError("Product_List.xlsx not found")
 
         if ProductImportService.import_products_from_excel(engine):
-            print("✅ Product import successful")
+            logger.info("✅ Product import successful")
             
             # Reload cache immediately after successful import
-            print("\n💾 Loading products into in-memory cache...")
+            logger.info("💾 Loading products into in-memory cache...")
             load_products_into_cache()
-            print("✅ Products loaded into cache")
+            logger.info("✅ Products loaded into cache")
         else:
-            print("❌ Product import failed. Check logs for details.")
+            logger.error("❌ Product import failed. Check logs for details.")
             raise Exception("Product import failed")
             
     except Exception as error:
-        print(f"❌ Error during product setup: {str(error)}")
+        logger.error("❌ Error during product setup: %s", error)
         raise
     
-    stats = ProductImportService.get_product_stats(engine)
+    stats = get_catalog_stats()
     if stats:
-        print(f"\n📊 PRODUCT DATABASE STATS:")
-        print(f"   Total Products: {stats.get('total_products', 0)}")
-        print(f"   Unique Diseases: {stats.get('unique_diseases', 0)}")
-        print(f"   Unique Plants: {stats.get('unique_plants', 0)}")
+        logger.info(
+            "📊 Product catalog stats (generation %s, loaded in %.2fs): %s products, %s diseases, %s plants",
+            stats.get("generation"), stats.get("load_seconds", 0), stats.get("total_products", 0),
+            stats.get("unique_diseases", 0), stats.get("unique_plants", 0),
+            extra={key: stats.get(key, 0) for key in ("total_products", "unique_diseases", "unique_plants")},
+        )
+    application_prepared = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("🚀 Starting application")
+    
+    if not application_prepared:
+        prepare_application()
     
-    print("\n✅ APPLICATION READY!")
-    print("="*60 + "\n")
+    # Per worker: readiness in /health reflects a prediction this process has made
+    await asyncio.to_thread(analyze_service.warm_up_local_model)
+
+    analyze_jobs.start()
+    logger.info("⚙️ Analyze job workers: %s (queue size %s)", analyze_jobs.workers, analyze_jobs.maxsize)
+
+    logger.info("✅ Application ready")
     
     yield
     
-    print("\n👋 Shutting down application...")
+    logger.info("👋 Shutting down application...")
+    await analyze_jobs.stop()
 
 app = FastAPI(title="Plant Disease Detection API", version="4.2.0", lifespan=lifespan)
+
+# Largest /analyze body worth parsing: 2 images at the per-image limit + multipart overhead
+MAX_ANALYZE_REQUEST_BYTES = 2 * MAX_IMAGE_BYTES + 64 * 1024
+
+# add_middleware wraps what is already there: the last one added is the outermost
+# Byte budget enforced on the receive channel, so chunked uploads are capped too
+app.add_middleware(UploadLimitMiddleware, limits=[("/analyze/batch", MAX_BATCH_REQUEST_BYTES), ("/analyze", MAX_ANALYZE_REQUEST_BYTES)])
+app.add_middleware(AdmissionMiddleware, controller=analyze_admission)
+# Opt-in (PROFILE_TOKEN / PROFILE_SAMPLE_RATE); not installed at all otherwise
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+# Outermost, so admission 429/503/413 responses carry CORS headers too
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
 app.include_router(analyze_router)
 app.include_router(product_router)
 app.include_router(otp_routes)
 app.include_router(history_router)
+app.include_router(debug_router)
+app.include_router(analytics_router)
 
 @app.get("/")
 def root():
@@ -85,8 +138,20 @@ def root():
 
 @app.get("/health")
 def health_check():
-    stats = ProductImportService.get_product_stats(engine)
-    return {"status": "healthy", "database": "connected", "products_loaded": stats.get('total_products', 0) > 0, "product_stats": stats}
+    """Liveness/readiness: in-memory counters only, no DB round trip."""
+    return {"status": "healthy", **stats_snapshot(), "auth_cache": token_cache.stats(), "upstream": {**upstream_breaker.stats(), **upstream_hedge.stats()}, "single_flight": {"analyze": analyze_flight.stats(), "search": search_flight.stats()}, "admission": analyze_admission.stats()}
+
+@app.get("/health/deep")
+def deep_health_check():
+    """On-demand probe that also checks the database and compares it with the cache."""
+    probe = deep_probe()
+    status_code = 200 if probe["database"] == "connected" else 503
+    return JSONResponse(status_code=status_code, content={"status": "healthy" if status_code == 200 else "degraded", **stats_snapshot(), **probe})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms, cache/error counters, queue gauges."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
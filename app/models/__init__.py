@@ -1,5 +1,6 @@
 from .detection_model import PlantDetection
 from .product_model import Product
-from .otp_model import OTP
+from .otp_model import OTP, TokenVersion
+from .analytics_model import DetectionDisease, DailyPlantRollup, DailyDiseaseRollup, UserPlantRollup
 
-__all__ = ["PlantDetection", "Product", "OTP"]
\ No newline at end of file
+__all__ = ["PlantDetection", "Product", "OTP", "TokenVersion", "DetectionDisease", "DailyPlantRollup", "DailyDiseaseRollup", "UserPlantRollup"]
\ No newline at end of file
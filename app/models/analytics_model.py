@@ -0,0 +1,63 @@
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Index
+from app.config.db import Base
+
+class DetectionDisease(Base):
+    """
+    One row per (detection, reported disease), written with the detection. Detections
+    without a disease get a single row with disease NULL, so every detection is here once
+    and the rollups below can be rebuilt from this table alone.
+    """
+    __tablename__ = "detection_diseases"
+
+    id = Column(Integer, primary_key=True, index=True)
+    detection_id = Column(Integer, ForeignKey("plant_detections.id", ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False, default=0)
+    mobile = Column(String, nullable=False, index=True)
+    plant = Column(String, nullable=False)        # canonical plant scientific name
+    disease = Column(String, nullable=True)       # canonical disease scientific name
+    disease_name = Column(String, nullable=True)  # common name as reported
+    confidence = Column(Float, nullable=True)     # 0-100
+    detected_at = Column(DateTime(timezone=True), nullable=False)
+    day = Column(Date, nullable=False)
+
+    __table_args__ = (
+        Index("ix_detection_diseases_disease_day", "disease", "day"),
+        Index("ix_detection_diseases_day", "day"),
+    )
+
+
+class DailyPlantRollup(Base):
+    """Detections per UTC day and plant."""
+    __tablename__ = "analytics_daily_plants"
+
+    day = Column(Date, primary_key=True)
+    plant = Column(String, primary_key=True)
+    detections = Column(Integer, nullable=False, default=0)
+
+
+class DailyDiseaseRollup(Base):
+    """Disease reports per UTC day, disease and plant, with the confidence sum for averages."""
+    __tablename__ = "analytics_daily_diseases"
+
+    day = Column(Date, primary_key=True)
+    disease = Column(String, primary_key=True)
+    plant = Column(String, primary_key=True)
+    detections = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0)
+    confidence_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # One disease or one plant over a window (the key leads with day)
+        Index("ix_analytics_daily_diseases_disease_day", "disease", "day"),
+        Index("ix_analytics_daily_diseases_plant_day", "plant", "day"),
+    )
+
+
+class UserPlantRollup(Base):
+    """Detections per user and plant, with the most recent detection day."""
+    __tablename__ = "analytics_user_plants"
+
+    mobile = Column(String, primary_key=True)
+    plant = Column(String, primary_key=True)
+    detections = Column(Integer, nullable=False, default=0)
+    last_day = Column(Date, nullable=False)
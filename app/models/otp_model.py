@@ -8,3 +8,14 @@ class OTP(Base):
     mobile = Column(String, index=True, nullable=False)
     otp = Column(String, nullable=False)        
     expiry = Column(Float, nullable=False)
+
+
+class TokenVersion(Base):
+    """
+    Per-user token generation: tokens carry the version they were issued at ("ver")
+    and stop verifying once logout bumps it. One row per user that ever logged out.
+    """
+    __tablename__ = "token_versions"
+
+    mobile = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from app.config.db import get_db
+from app.controllers.otp_controller import get_current_mobile
+from app.services import detection_analytics
+from app.services.detection_analytics import ANALYTICS_MAX_DAYS, window_start
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["Analytics"]
+)
+
+# Every query below reads the precomputed rollups only, never plant_detections
+
+@router.get("/diseases/top")
+def get_top_diseases(
+    days: int = Query(7, ge=1, le=ANALYTICS_MAX_DAYS),
+    limit: int = Query(10, ge=1, le=100),
+    plant: Optional[str] = Query(None, description="Only this plant (scientific name)"),
+    mobile: str = Depends(get_current_mobile),
+    db: Session = Depends(get_db)
+):
+    """Most reported diseases over the last `days` UTC days, with their average confidence."""
+    since = window_start(days)
+    return {"since": since.isoformat(), "days": days, "diseases": detection_analytics.top_diseases(db, since, limit, plant)}
+
+@router.get("/plants/top")
+def get_top_plants(
+    days: int = Query(7, ge=1, le=ANALYTICS_MAX_DAYS),
+    limit: int = Query(10, ge=1, le=100),
+    mobile: str = Depends(get_current_mobile),
+    db: Session = Depends(get_db)
+):
+    """Most detected plants over the last `days` UTC days."""
+    since = window_start(days)
+    return {"since": since.isoformat(), "days": days, "plants": detection_analytics.top_plants(db, since, limit)}
+
+@router.get("/daily")
+def get_daily_counts(
+    days: int = Query(30, ge=1, le=ANALYTICS_MAX_DAYS),
+    disease: Optional[str] = Query(None, description="Count reports of this disease instead of detections"),
+    plant: Optional[str] = Query(None),
+    mobile: str = Depends(get_current_mobile),
+    db: Session = Depends(get_db)
+):
+    """Per-day counts (days without detections are omitted)."""
+    since = window_start(days)
+    return {"since": since.isoformat(), "days": days, "daily": detection_analytics.daily_counts(db, since, disease, plant)}
+
+@router.get("/me/plants")
+def get_my_plants(
+    limit: int = Query(10, ge=1, le=100),
+    mobile: str = Depends(get_current_mobile),
+    db: Session = Depends(get_db)
+):
+    """The caller's most detected plants, all time."""
+    return {"plants": detection_analytics.user_plants(db, mobile, limit)}
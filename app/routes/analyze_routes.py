@@ -1,16 +1,42 @@
-from fastapi import APIRouter, UploadFile, File, Depends, Request, BackgroundTasks
-from typing import List
-from app.controllers.analyze_controller import handle_analyze
+from fastapi import APIRouter, Depends, Request, BackgroundTasks, Query
+from app.controllers.analyze_controller import handle_analyze, handle_analyze_stream, handle_analyze_batch, submit_analyze_job, get_analyze_job
+from app.controllers.otp_controller import get_current_mobile
+from app.utils.upload_reader import image_form_openapi
 from app.config.db import get_db  
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/analyze", tags=["Analyze"])
 
-@router.post("/")
+# Multipart bodies are read by the handlers as they stream in (ImageForm), so the
+# form is documented here rather than declared as File(...) parameters
+
+@router.post("/", openapi_extra=image_form_openapi())
 async def analyze_plant(
     request: Request,
     background_tasks: BackgroundTasks,
-    images: list[UploadFile] = File(...),
     db: Session = Depends(get_db), 
 ):
-    return await handle_analyze(images, request, db, background_tasks)
\ No newline at end of file
+    return await handle_analyze(request, db, background_tasks)
+
+@router.post("/stream", openapi_extra=image_form_openapi())
+async def analyze_plant_stream(request: Request):
+    """Server-sent events: received, preprocessed, plant, result, products."""
+    return await handle_analyze_stream(request)
+
+@router.post("/batch", openapi_extra=image_form_openapi(groups="Images per plant in upload order, e.g. 2,1,2 (default: 1 each)"))
+async def analyze_plant_batch(request: Request):
+    """Analyze many plants in one request; NDJSON lines stream back as each plant finishes."""
+    return await handle_analyze_batch(request)
+
+@router.post("/jobs", status_code=202, openapi_extra=image_form_openapi())
+async def submit_analysis_job(request: Request):
+    """Queue an analysis; poll GET /analyze/jobs/{job_id} for the result."""
+    return await submit_analyze_job(request)
+
+@router.get("/jobs/{job_id}")
+async def get_analysis_job(
+    job_id: str,
+    wait: float = Query(0, description="Long-poll up to this many seconds (max 30)"),
+    mobile: str = Depends(get_current_mobile),
+):
+    return await get_analyze_job(job_id, mobile, wait)
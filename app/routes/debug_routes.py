@@ -0,0 +1,31 @@
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import FileResponse
+from typing import Optional
+from app.services.profiler import profile_store, profiling_enabled, token_matches
+
+router = APIRouter(
+    prefix="/debug/profiles",
+    tags=["Debug"]
+)
+
+def require_profile_token(token: Optional[str]):
+    if not profiling_enabled():
+        raise HTTPException(404, "Profiling is disabled")
+    if not token_matches(token):
+        raise HTTPException(403, "Invalid profile token")
+
+@router.get("/")
+def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    """Recent request profiles (newest first) with their stage timings."""
+    require_profile_token(x_profile_token)
+    return {"profiles": profile_store.list()}
+
+@router.get("/{filename}")
+def download_profile(filename: str, x_profile_token: Optional[str] = Header(None)):
+    """Download <id>.folded (collapsed stacks for flamegraph/speedscope) or <id>.json."""
+    require_profile_token(x_profile_token)
+    path = profile_store.path(filename)
+    if path is None:
+        raise HTTPException(404, "Profile not found")
+    media_type = "application/json" if filename.endswith(".json") else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=filename)
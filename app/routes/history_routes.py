@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from sqlalchemy.orm import Session
+from datetime import date
+from typing import Literal, Optional
 from app.config.db import get_db
 from app.models.detection_model import PlantDetection
-from app.controllers.otp_controller import decode_access_token
+from app.controllers.otp_controller import get_current_mobile, get_current_mobile_allow_query
+from app.services.detection_export import EXPORT_TOKEN, export_response, export_token_matches
 
 router = APIRouter(
     prefix="/history",
@@ -10,15 +13,7 @@ router = APIRouter(
 )
 
 @router.get("/")
-def get_detection_history(token: str, db: Session = Depends(get_db)):
-    payload = decode_access_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-
-    mobile = payload.get("sub")
-    if not mobile:
-        raise HTTPException(status_code=401, detail="Invalid token payload")
-
+def get_detection_history(mobile: str = Depends(get_current_mobile_allow_query), db: Session = Depends(get_db)):
     history = db.query(PlantDetection).filter(PlantDetection.mobile == mobile).all()
 
     return {"history": [dict(
@@ -34,4 +29,34 @@ def get_detection_history(token: str, db: Session = Depends(get_db)):
         cause=item.cause,
         treatment=item.treatment,
         image=item.image
-    ) for item in history]}
\ No newline at end of file
+    ) for item in history]}
+
+@router.get("/export")
+def export_my_history(
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    since: Optional[date] = Query(None, description="First UTC day (inclusive)"),
+    until: Optional[date] = Query(None, description="Last UTC day (inclusive)"),
+    accept_encoding: str = Header(""),
+    mobile: str = Depends(get_current_mobile)
+):
+    """
+    The caller's detections streamed as NDJSON or CSV (gzip when accepted), in constant
+    memory however long the history is.
+    """
+    return export_response(format, accept_encoding, "detections", mobile, since, until)
+
+@router.get("/export/all")
+def export_all_history(
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    mobile: Optional[str] = Query(None, description="Only this user"),
+    since: Optional[date] = Query(None, description="First UTC day (inclusive)"),
+    until: Optional[date] = Query(None, description="Last UTC day (inclusive)"),
+    accept_encoding: str = Header(""),
+    x_export_token: Optional[str] = Header(None)
+):
+    """Streamed export across users for support / data science (X-Export-Token)."""
+    if not EXPORT_TOKEN:
+        raise HTTPException(404, "Export is disabled")
+    if not export_token_matches(x_export_token):
+        raise HTTPException(403, "Invalid export token")
+    return export_response(format, accept_encoding, "detections", mobile, since, until)
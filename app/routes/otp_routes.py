@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from app.controllers.otp_controller import OTPController, get_db
+from app.controllers.otp_controller import OTPController, get_db, get_current_mobile, revoke_user_tokens
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 router = APIRouter()
@@ -21,3 +21,9 @@ def send_otp(data: MobileRequest, db: Session = Depends(get_db)):
 @router.post("/verify_otp")
 def verify_otp(data: OtpVerifyRequest, db: Session = Depends(get_db)):
     return OTPController.verify_otp(data.mobile, data.otp, db)
+
+@router.post("/logout")
+def logout(mobile: str = Depends(get_current_mobile), db: Session = Depends(get_db)):
+    """Signs the user out on every device: all previously issued tokens stop working."""
+    revoke_user_tokens(mobile, db)
+    return {"message": "Logged out successfully", "mobile": mobile}
@@ -1,20 +1,41 @@
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Header
+from pydantic import BaseModel, Field
 from app.controllers import product_controller
-from app.services.match_utils import normalize, fuzzy_lookup
 from typing import Optional, List, Dict, Any
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["Products"])
 
-@router.get("/products", response_model=List[Dict[str, Any]])
-async def get_products():
-    """Get all products from the cache"""
+# Upper bound on pairs per batch search request
+MAX_BATCH_SEARCH_PAIRS = 1000
+
+class SearchPair(BaseModel):
+    disease_scientific_name: str
+    plant_scientific_name: str
+
+class BatchSearchRequest(BaseModel):
+    pairs: List[SearchPair] = Field(..., min_length=1, max_length=MAX_BATCH_SEARCH_PAIRS)
+    top_k: int = Field(5, ge=1, le=50)
+
+@router.get("/products")
+async def get_products(
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. id,name"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, description="Page size (default: whole catalog)"),
+    accept_encoding: str = Header(""),
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Get products from the cache.
+    Bodies are pre-serialized per catalog version, gzip-compressed when accepted and
+    carry a strong ETag; send it back as If-None-Match to get a 304.
+    """
     try:
-        products = product_controller.get_all_products()
-        if not products:
-            raise HTTPException(status_code=404, detail="No products found")
-        return products
+        return product_controller.get_catalog_response(fields, offset, limit, accept_encoding, if_none_match)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching products: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -29,69 +50,73 @@ async def search_products(
     Uses smart matching including exact, token-based and fuzzy matching.
     """
     try:
-        # Get all products first
         all_products = product_controller.get_all_products()
         if not all_products:
             raise HTTPException(status_code=404, detail="No products found in database")
 
-        # Normalize search terms
-        norm_disease = normalize(disease_scientific_name)
-        norm_plant = normalize(plant_scientific_name)
-
-        logger.info(f"Searching for disease: {norm_disease}, plant: {norm_plant}")
+        top_matches = await product_controller.search_products_coalesced(disease_scientific_name, plant_scientific_name)
 
-        matched_products = []
-        for product in all_products:
-            if not product.get('disease_scientific_name') or not product.get('scientific_name'):
-                continue
-
-            # Normalize product terms
-            product_disease = normalize(product['disease_scientific_name'])
-            product_plant = normalize(product['scientific_name'])
+        if not top_matches:
+            raise HTTPException(status_code=404, detail="No matching products found")
 
-            # Calculate match scores
-            disease_score = fuzzy_lookup(norm_disease, (product_disease,), score_cutoff=60)
-            plant_score = fuzzy_lookup(norm_plant, (product_plant,), score_cutoff=60)
+        return top_matches
 
-            if disease_score and plant_score:
-                disease_match = disease_score[0][1]
-                plant_match = plant_score[0][1]
-                
-                # Combined weighted score
-                total_score = (disease_match * 0.6) + (plant_match * 0.4)
-                
-                if total_score >= 60:  # Lower threshold for better matching
-                    matched_products.append({
-                        "product": product,
-                        "score": total_score,
-                        "match_details": {
-                            "disease_match": disease_match,
-                            "plant_match": plant_match
-                        }
-                    })
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error in product search: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error searching for products: {str(e)}"
+        )
 
-        # Sort by score and take top matches
-        matched_products.sort(key=lambda x: x['score'], reverse=True)
-        top_matches = matched_products[:5]  # Get top 5 matches
+@router.get("/products/typeahead")
+async def typeahead_names(
+    q: str = Query(..., min_length=1, description="Prefix of a plant or disease scientific name"),
+    field: str = Query("all", pattern="^(all|plant|disease)$"),
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    """Autocomplete for plant / disease scientific names (prefix, with fuzzy fallback for typos)."""
+    return product_controller.typeahead(q, field, limit, offset)
 
-        if not top_matches:
-            raise HTTPException(status_code=404, detail="No matching products found")
+@router.post("/products/search/batch")
+async def search_products_batch(data: BatchSearchRequest):
+    """
+    Top-k products for many (disease, plant) pairs in one call.
+    Same scoring as /products/search; results are returned in request order.
+    """
+    try:
+        if not product_controller.get_all_products():
+            raise HTTPException(status_code=404, detail="No products found in database")
 
-        # Return the matched products with their scores
-        return [match['product'] for match in top_matches]
+        pairs = [(pair.disease_scientific_name, pair.plant_scientific_name) for pair in data.pairs]
+        matches = await asyncio.to_thread(product_controller.search_products_batch, pairs, data.top_k)
 
+        return {"results": [
+            {
+                "disease_scientific_name": disease,
+                "plant_scientific_name": plant,
+                "products": products
+            }
+            for (disease, plant), products in zip(pairs, matches)
+        ]}
     except HTTPException as he:
         raise he
     except Exception as e:
-        logger.error(f"Error in product search: {str(e)}", exc_info=True)
+        logger.error(f"Error in batch product search: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=500,
             detail=f"Error searching for products: {str(e)}"
         )
 
 @router.get("/by-disease/{disease_name}")
-def get_products_by_disease(disease_name: str):
-    products = product_controller.get_products_by_disease(disease_name)
+def get_products_by_disease(
+    disease_name: str,
+    limit: Optional[int] = Query(None, ge=1, description="Page size (default: all matches)"),
+    offset: int = Query(0, ge=0)
+):
+    products = product_controller.get_products_by_disease(disease_name, limit, offset)
     if not products:
         raise HTTPException(status_code=404, detail="No products found for this disease")
     return products
\ No newline at end of file
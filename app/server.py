@@ -0,0 +1,229 @@
+"""
+Production entry point: prepare once, then prefork workers that share memory copy-on-write.
+
+The master process imports the app (torch, the YOLO weights, API clients), creates the
+tables, imports the product sheet, loads the catalog cache and runs one warm-up
+inference, then forks SERVER_WORKERS workers that serve a shared listening socket. Model
+weights and catalog structures are inherited rather than rebuilt per worker. gc.freeze()
+keeps the garbage collector from dirtying those shared pages.
+
+Each forked worker:
+- drops inherited DB pool connections (engine.dispose(close=False))
+- rebuilds the OpenAI and boto3 clients and restarts the log listener thread
+- caps torch / OpenCV intra-op threads at TORCH_THREADS_PER_WORKER
+  (default: CPUs // workers)
+
+The master re-forks any worker that dies and forwards SIGTERM / SIGINT for a graceful
+stop.
+
+State kept in process memory is per worker: analyze jobs (/analyze/jobs), logout
+revocations, single-flight, caches and /metrics counters. Run one worker, or route a
+client to a fixed worker, where that matters.
+
+Usage: python -m app.server [--host 0.0.0.0] [--port 8000] [--workers 4]
+"""
+import os
+import io
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import logging
+import uvicorn
+from app.config.logging_config import setup_logging, stop_logging
+
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 8000))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 1))
+# Intra-op threads per worker for torch / OpenCV (0 = CPUs // workers, at least 1)
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", 0))
+# Seconds a worker gets to finish in-flight requests after SIGTERM
+SERVER_GRACEFUL_TIMEOUT = float(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30))
+
+STOP_SIGNALS = {signal.SIGINT, signal.SIGTERM}
+
+logger = logging.getLogger("app.server")
+
+
+def thread_budget(workers: int) -> int:
+    return TORCH_THREADS_PER_WORKER or max(1, (os.cpu_count() or 1) // workers)
+
+
+def set_compute_threads(threads: int):
+    """Cap torch and OpenCV thread pools (both optional at this level)."""
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def warm_model():
+    """
+    One tiny inference in the master so lazy model setup (layer fusion, buffers) happens
+    before the fork and is shared, instead of being repeated and copied per worker.
+    Runs single-threaded: a thread pool started before fork() would not survive it.
+    """
+    from PIL import Image
+    from app.services import analyze_service
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (40, 120, 40)).save(buffer, "JPEG")
+    set_compute_threads(1)
+    started = time.perf_counter()
+    try:
+        analyze_service._run_local_model(buffer.getvalue())
+        logger.info("Local model warmed up in %.2fs", time.perf_counter() - started)
+    except Exception as e:
+        logger.warning("Local model warm-up failed, workers will initialize it lazily: %s", e)
+
+
+def prepare_master(warm: bool):
+    """Everything workers should inherit instead of repeating."""
+    from app.main import prepare_application
+    from app.config.db import engine
+
+    started = time.perf_counter()
+    prepare_application()
+    if warm:
+        warm_model()
+    # Connections opened while preparing must not be shared across processes
+    engine.dispose()
+    gc.collect()
+    # Objects alive now are never collected: GC passes in the workers won't touch
+    # (and so copy) the pages holding the model and catalog
+    gc.freeze()
+    gc.enable()
+    logger.info("Master prepared in %.2fs (%d objects frozen)", time.perf_counter() - started, gc.get_freeze_count())
+
+
+def reinit_after_fork(threads: int):
+    """Per-worker re-initialization of everything that must not be shared with the master."""
+    from app.config.db import engine
+    from app.services import analyze_service
+    from app.utils import s3_uploader
+
+    setup_logging()
+    # Drop pooled connections inherited from the master without closing them under its feet
+    engine.dispose(close=False)
+    analyze_service.create_clients()
+    s3_uploader.create_s3_client()
+    set_compute_threads(threads)
+
+
+def run_worker(worker_id: int, sock: socket.socket, threads: int):
+    from app.main import app
+
+    reinit_after_fork(threads)
+    logger.info("Worker %d started (pid %d, %d compute threads)", worker_id, os.getpid(), threads)
+    # log_config=None: uvicorn logs go through the root (queued JSON) handler too
+    config = uvicorn.Config(app, log_config=None, timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Master:
+    """Forks and supervises workers; re-forks crashed ones from the prepared state."""
+
+    def __init__(self, sock: socket.socket, workers: int, threads: int):
+        self.sock = sock
+        self.workers = workers
+        self.threads = threads
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self, worker_id: int):
+        # No other thread may be running (and holding a lock) across fork()
+        stop_logging()
+        # Blocked until the child has dropped the master's handlers (which signal siblings)
+        signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+        pid = os.fork()
+        if pid == 0:
+            for signum in STOP_SIGNALS:
+                signal.signal(signum, signal.SIG_DFL)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+            self.children = {}
+            code = 0
+            try:
+                run_worker(worker_id, self.sock, self.threads)
+            except BaseException:
+                logger.exception("Worker %d crashed", worker_id)
+                code = 1
+            finally:
+                stop_logging()
+                # Never return into the master's code path (or run its atexit hooks)
+                os._exit(code)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        setup_logging()
+        self.children[pid] = worker_id
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        for signum in STOP_SIGNALS:
+            signal.signal(signum, self.stop)
+        for worker_id in range(self.workers):
+            self.spawn(worker_id)
+        logger.info("Serving on %s with %d workers", self.sock.getsockname(), self.workers)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            worker_id = self.children.pop(pid, None)
+            if worker_id is None or self.stopping:
+                continue
+            logger.warning("Worker %d (pid %d) exited with status %d; restarting", worker_id, pid, status)
+            time.sleep(1)
+            self.spawn(worker_id)
+        logger.info("All workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefork server: prepare once, share model and catalog copy-on-write")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--no-warmup", action="store_true", help="skip the warm-up inference in the master")
+    args = parser.parse_args()
+
+    threads = thread_budget(args.workers)
+    # OpenMP / MKL read these once, when torch is first imported (in the master)
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(name, str(threads))
+
+    # Keep the import-time and loading garbage in generations GC never revisits
+    gc.disable()
+    started = time.perf_counter()
+    sock = bind_socket(args.host, args.port)
+    import app.main  # noqa: F401  (model, clients, logging)
+    logger.info("Application imported in %.2fs", time.perf_counter() - started)
+    prepare_master(warm=not args.no_warmup)
+    Master(sock, args.workers, threads).run()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import os
+import json
+import math
+import threading
+from typing import Optional
+from app.controllers.otp_controller import token_cache
+from app.services.upstream_guard import upstream_latencies
+from app.services.metrics import Gauge, ADMISSION_ADMITTED, ADMISSION_SHED
+
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 32))
+ADMISSION_MAX_QUEUED_BYTES = int(os.getenv("ADMISSION_MAX_QUEUED_BYTES", 256 * 1024 * 1024))
+ADMISSION_MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", 4))
+# Shed new work once recent upstream p90 latency passes this and we're at least half full
+ADMISSION_LATENCY_SHED_SECONDS = float(os.getenv("ADMISSION_LATENCY_SHED_SECONDS", 20))
+
+
+class AdmissionController:
+    """
+    Tracks in-flight analyses, queued upload bytes and upstream latency; decides
+    admit / shed before a request body is read.
+    - 503 + Retry-After: the process as a whole is saturated
+    - 429 + Retry-After: this user already holds their fair share of slots
+    - 413: the request alone is larger than the queued-bytes budget (retrying can't help)
+    """
+
+    def __init__(self, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT, max_queued_bytes: int = ADMISSION_MAX_QUEUED_BYTES,
+                 max_per_user: int = ADMISSION_MAX_PER_USER, latency_shed_seconds: float = ADMISSION_LATENCY_SHED_SECONDS):
+        self.max_in_flight = max_in_flight
+        self.max_queued_bytes = max_queued_bytes
+        self.max_per_user = max_per_user
+        self.latency_shed_seconds = latency_shed_seconds
+        self.in_flight = 0
+        self.queued_bytes = 0
+        self.per_user: dict[str, int] = {}
+        self.admitted = 0
+        self.shed: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _user_limit(self, user: str) -> int:
+        """Fixed per-user cap, tightened to an equal share of slots once we're half full."""
+        if self.in_flight < self.max_in_flight // 2:
+            return self.max_per_user
+        active_users = len(self.per_user) + (0 if user in self.per_user else 1)
+        return max(1, min(self.max_per_user, self.max_in_flight // active_users))
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(upstream_latencies.percentile(0.5) or 5))
+
+    def try_admit(self, user: str, nbytes: int) -> Optional[tuple[int, str]]:
+        """None if admitted, else (status_code, reason)."""
+        with self._lock:
+            rejection = None
+            if nbytes > self.max_queued_bytes:
+                rejection = (413, "request_too_large")
+            elif self.per_user.get(user, 0) >= self._user_limit(user):
+                rejection = (429, "per_user_limit")
+            elif self.in_flight >= self.max_in_flight:
+                rejection = (503, "in_flight_limit")
+            elif self.queued_bytes + nbytes > self.max_queued_bytes:
+                rejection = (503, "queued_bytes_limit")
+            elif (self.in_flight >= self.max_in_flight // 2
+                  and upstream_latencies.percentile(0.9) > self.latency_shed_seconds):
+                rejection = (503, "upstream_latency")
+
+            if rejection:
+                self.shed[rejection[1]] = self.shed.get(rejection[1], 0) + 1
+                ADMISSION_SHED.labels(rejection[1]).inc()
+                return rejection
+
+            self.in_flight += 1
+            self.queued_bytes += nbytes
+            self.per_user[user] = self.per_user.get(user, 0) + 1
+            self.admitted += 1
+            ADMISSION_ADMITTED.labels().inc()
+            return None
+
+    def release(self, user: str, nbytes: int):
+        with self._lock:
+            self.in_flight -= 1
+            self.queued_bytes -= nbytes
+            remaining = self.per_user.get(user, 1) - 1
+            if remaining:
+                self.per_user[user] = remaining
+            else:
+                self.per_user.pop(user, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queued_bytes": self.queued_bytes,
+                "active_users": len(self.per_user),
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+                "shed_total": sum(self.shed.values()),
+            }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware guarding POST /analyze*: admission runs on headers only, so shed
+    requests never have their multipart bodies read. Slots are held until the
+    response (including any stream) has finished.
+    """
+
+    def __init__(self, app, controller: AdmissionController, path_prefix: str = "/analyze"):
+        self.app = app
+        self.controller = controller
+        self.path_prefix = path_prefix
+
+    @staticmethod
+    def _user_key(scope) -> str:
+        headers = dict(scope.get("headers") or [])
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        if authorization.startswith("Bearer "):
+            payload = token_cache.peek(authorization.split(" ")[1])
+            if payload and payload.get("sub"):
+                return f"user:{payload['sub']}"
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length", b"0").decode("latin-1")
+        nbytes = int(content_length) if content_length.isdigit() else 0
+        user = self._user_key(scope)
+
+        rejection = self.controller.try_admit(user, nbytes)
+        if rejection:
+            status_code, reason = rejection
+            detail = {429: "Too many concurrent analyses for this user", 413: "Upload too large"}.get(status_code, "Server busy, retry later")
+            body = json.dumps({"detail": detail, "reason": reason}).encode()
+            headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+            if status_code != 413:
+                headers.append((b"retry-after", str(self.controller.retry_after()).encode()))
+            await send({"type": "http.response.start", "status": status_code, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(user, nbytes)
+
+
+analyze_admission = AdmissionController()
+Gauge("plant_api_admission_in_flight", "Admitted /analyze requests still running", fn=lambda: analyze_admission.in_flight)
+Gauge("plant_api_admission_queued_bytes", "Upload bytes held by admitted /analyze requests", fn=lambda: analyze_admission.queued_bytes)
+Gauge("plant_api_admission_active_users", "Users holding at least one /analyze slot", fn=lambda: len(analyze_admission.per_user))
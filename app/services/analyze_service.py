@@ -1,12 +1,25 @@
 from ultralytics import YOLO
 import os
 import base64
+import asyncio
+import contextlib
+import copy
 import json
+import re
 import time
+import io
+import logging
 import openai
 from pathlib import Path
 from dotenv import load_dotenv
-from .image_utils import optimize_image, select_best_image, detect_image_type
+from PIL import Image
+from .image_utils import encode_image, select_best_image, detect_image_type, content_key, ImageSource
+from app.utils.upload_reader import SpooledImage
+from .single_flight import SingleFlight
+from .upstream_guard import upstream_breaker, upstream_hedge, ANALYSIS_DEADLINE_SECONDS
+from .metrics import STAGE_SECONDS, UPSTREAM_ERRORS, ANALYSES
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 env_path = Path(__file__).parent.parent.parent / ".env"
@@ -15,96 +28,377 @@ load_dotenv(dotenv_path=env_path)
 # YOLO model
 try:
     model = YOLO("app/models/best.pt")
-    print("✅ YOLO model loaded successfully")
+    logger.info("✅ YOLO model loaded successfully")
 except Exception as e:
-    print(f"❌ Failed to load YOLO model: {e}")
+    logger.error("❌ Failed to load YOLO model: %s", e)
     raise RuntimeError(f"Failed to load YOLO model: {e}")
 
-# OpenAI client
+# OpenAI client (OPENAI_BASE_URL points it at an OpenAI-compatible server, e.g. devstack/fake_upstreams.py)
 api_key = os.getenv("OPENAI_API_KEY")
-print(f"🔍 API Key found: {api_key is not None}")
-if api_key:
-    print(f"🔍 API Key starts with: {api_key[:15]}...")
+base_url = os.getenv("OPENAI_BASE_URL") or None
+logger.info("🔍 API Key found: %s", api_key is not None)
 
 if not api_key:
-    raise RuntimeError("OPENAI_API_KEY environment variable required")
+    if not base_url:
+        raise RuntimeError("OPENAI_API_KEY environment variable required")
+    # Local stand-ins don't check the key, but the client insists on one
+    api_key = "local-upstream"
+
+def create_clients():
+    """(Re)build the OpenAI clients; forked workers call this so no connection pool is shared."""
+    global client, async_client
+    client = openai.OpenAI(api_key=api_key, base_url=base_url)
+    async_client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url)
+
+
+create_clients()
+logger.info("✅ OpenAI client initialized%s", f" (base URL {base_url})" if base_url else "")
+
+
+ANALYSIS_PROMPT = "Identify plant species first, then all diseases. JSON: {\"common_name\":\"required\",\"scientific_name\":\"required\",\"plant_confidence\":\"0-100%\",\"disease\":[\"disease names or healthy\"],\"disease_scientific_name\":[\"scientific names\"],\"disease_confidence\":[\"0-100%\"],\"symptoms\":[\"2-3 words max\"],\"cause\":[\"1-2 lines max\"],\"treatment\":[\"1-2 lines max\"]}"
 
-client = openai.OpenAI(api_key=api_key)
-print("✅ OpenAI client initialized")
+# Plant fields streamed to the client as soon as the model has emitted them
+PLANT_FIELDS = ("common_name", "scientific_name", "plant_confidence")
 
 
-async def analyze_images(images: list[bytes]) -> dict:
+def prepare_image(images: list[ImageSource]) -> tuple[bytes, dict]:
+    """
+    Select the best image and optimize it for upload.
+    Returns: (optimized_image_bytes, metadata)
+    """
+    # SMART: Select best image for analysis (prefer close-up)
+    selected_image, image_type, selected_idx = select_best_image(images)
+    
+    # OPTIMIZED: Encode selected image to its type's byte budget + pick vision detail mode
+    optimized_image, encoding = encode_image(selected_image, image_type)
+    
+    # Log optimization info
+    original_size = len(selected_image) / 1024
+    optimized_size = len(optimized_image) / 1024
+    reduction = ((original_size - optimized_size) / original_size) * 100
+    logger.info("🎯 Image %d selected (%s): %.1fKB → %.1fKB (%.1f%% reduction, detail=%s, ~%s tokens)",
+                selected_idx + 1, image_type, original_size, optimized_size, reduction,
+                encoding['detail'], encoding.get('estimated_vision_tokens', '?'))
+
+    metadata = {
+        'selected_image_index': selected_idx,
+        'image_type': image_type,
+        'optimization': f"{reduction:.1f}% reduction",
+        'image_bytes': encoding['bytes'],
+        'estimated_vision_tokens': encoding.get('estimated_vision_tokens'),
+        'encoding': encoding,
+    }
+    return optimized_image, metadata
+
+
+def build_messages(optimized_image: bytes, detail: str = "auto") -> list[dict]:
+    """OpenAI chat messages for the analysis prompt + optimized image."""
+    content = [{"type": "text", "text": ANALYSIS_PROMPT}]
+    b64 = base64.b64encode(optimized_image).decode()
+    content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}", "detail": detail}})
+    return [{"role": "user", "content": content}]
+
+
+def finalize_result(result: dict) -> dict:
+    """Fill required plant names and coerce disease fields to arrays."""
+    # Ensure plant names never blank
+    if not result.get('common_name'):
+        result['common_name'] = 'Unknown Plant'
+    if not result.get('scientific_name'):
+        result['scientific_name'] = 'Species unknown'
+
+    # Ensure arrays for disease fields
+    for field in ['disease', 'disease_scientific_name', 'disease_confidence', 'symptoms', 'cause', 'treatment']:
+        if field in result and not isinstance(result[field], list):
+            result[field] = [result[field]]
+    return result
+
+
+class PartialJSONFields:
+    """
+    Incremental scanner over a streamed JSON object.
+    Reports top-level string fields as soon as their closing quote has arrived.
+    """
+
+    def __init__(self, fields: tuple[str, ...]):
+        self.buffer = ""
+        self.found: dict[str, str] = {}
+        self._patterns = {
+            field: re.compile(r'"%s"\s*:\s*"((?:[^"\\]|\\.)*)"' % re.escape(field))
+            for field in fields
+        }
+
+    def feed(self, text: str) -> dict[str, str]:
+        """Append streamed text; return fields completed by this chunk."""
+        self.buffer += text
+        completed = {}
+        for field, pattern in self._patterns.items():
+            if field in self.found:
+                continue
+            match = pattern.search(self.buffer)
+            if match:
+                value = json.loads(f'"{match.group(1)}"')
+                self.found[field] = completed[field] = value
+        return completed
+
+
+def _split_label(label: str) -> tuple[str, str]:
+    """"Tomato___Early_blight" -> ("Tomato", "Early blight")"""
+    if "___" in label:
+        plant, disease = label.split("___", 1)
+    else:
+        plant, disease = "", label
+    return plant.replace("_", " ").strip(), disease.replace("_", " ").strip()
+
+
+# Set once best.pt has produced a prediction in this process (warm-up or a real fallback);
+# loading the weights alone doesn't prove the model can run
+model_ready = False
+model_error = None
+
+
+def _run_local_model(image_bytes: bytes) -> list[tuple[str, float]]:
+    """best.pt predictions as (label, confidence), best first."""
+    global model_ready, model_error
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        results = model.predict(img.convert("RGB"), verbose=False)
+    model_ready, model_error = True, None
+    prediction = results[0]
+    names = prediction.names
+
+    if getattr(prediction, "probs", None) is not None:
+        return [(names[int(prediction.probs.top1)], float(prediction.probs.top1conf))]
+
+    best = {}
+    for cls, conf in zip(prediction.boxes.cls.tolist(), prediction.boxes.conf.tolist()):
+        label = names[int(cls)]
+        best[label] = max(best.get(label, 0.0), float(conf))
+    return sorted(best.items(), key=lambda item: item[1], reverse=True)
+
+
+def warm_up_local_model() -> bool:
+    """One prediction on a blank image, so the first degraded request doesn't pay for it."""
+    global model_error
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64)).save(buffer, "JPEG")
+    try:
+        _run_local_model(buffer.getvalue())
+        logger.info("✅ Local model warmed up")
+    except Exception as e:
+        model_error = f"{type(e).__name__}: {e}"
+        logger.error("❌ Local model warm-up failed: %s", e)
+    return model_ready
+
+
+async def local_analysis(optimized_image: bytes, reason: str) -> dict:
+    """DEGRADED: Result from the local best.pt model when the upstream is unavailable."""
+    predictions = await asyncio.to_thread(_run_local_model, optimized_image)
+
+    plant = next((_split_label(label)[0] for label, _ in predictions if _split_label(label)[0]), "")
+    diseases = [_split_label(label)[1] for label, _ in predictions]
+    result = finalize_result({
+        "common_name": plant,
+        "scientific_name": "",
+        "plant_confidence": f"{round(predictions[0][1] * 100)}%" if predictions else "0%",
+        "disease": diseases,
+        "disease_scientific_name": ["" for _ in predictions],
+        "disease_confidence": [f"{round(conf * 100)}%" for _, conf in predictions],
+        "symptoms": [],
+        "cause": [],
+        "treatment": [],
+    })
+    logger.warning("⚠️  Degraded to local model (%s): %s", reason, diseases or 'no detections')
+    return result
+
+
+_upstream_seconds = STAGE_SECONDS.labels("upstream_call")
+
+
+def mark_source(result: dict, fallback_reason: str = None):
+    """Record in _metadata whether the result came from OpenAI or the degraded local model."""
+    result['_metadata']['source'] = "local_model" if fallback_reason else "openai"
+    ANALYSES.labels(result['_metadata']['source']).inc()
+    if fallback_reason:
+        result['_metadata']['degraded'] = True
+        result['_metadata']['fallback_reason'] = fallback_reason
+
+
+async def _upstream_analysis(optimized_image: bytes, detail: str) -> dict:
+    # Only completed calls are timed: cancelled hedge losers would skew the histogram
+    started = time.perf_counter()
+    response = await async_client.chat.completions.create(
+        model="gpt-4o",
+        messages=build_messages(optimized_image, detail),
+        max_tokens=500,
+        temperature=0.1,
+        response_format={"type": "json_object"}
+    )
+    _upstream_seconds.observe(time.perf_counter() - started)
+    return json.loads(response.choices[0].message.content)
+
+
+async def analyze_images(images: list[ImageSource], limiter: asyncio.Semaphore = None) -> dict:
     """
     OPTIMIZED: Smart image selection + conditional optimization.
     - Automatically selects best image for disease analysis
     - Applies safe conditional cropping based on image type
     - 70-80% token reduction
+    - Optional `limiter` bounds concurrent upstream calls (preprocessing is not limited)
+    - Upstream call is deadline-bounded and hedged; degrades to best.pt if it fails
+      or while the circuit breaker is open
     """
     start_time = time.time()
     
     try:
-        # SMART: Select best image for analysis (prefer close-up)
-        selected_image, image_type, selected_idx = select_best_image(images)
-        
-        # OPTIMIZED: Apply conditional optimization to selected image
-        optimized_image = optimize_image(selected_image, image_type)
-        
-        # Log optimization info
-        original_size = len(selected_image) / 1024
-        optimized_size = len(optimized_image) / 1024
-        reduction = ((original_size - optimized_size) / original_size) * 100
-        print(f"🎯 Image {selected_idx + 1} selected ({image_type}): {original_size:.1f}KB → {optimized_size:.1f}KB ({reduction:.1f}% reduction)")
-        
-        # Prepare OpenAI request
-        content = [{
-            "type": "text", 
-            "text": "Identify plant species first, then all diseases. JSON: {\"common_name\":\"required\",\"scientific_name\":\"required\",\"plant_confidence\":\"0-100%\",\"disease\":[\"disease names or healthy\"],\"disease_scientific_name\":[\"scientific names\"],\"disease_confidence\":[\"0-100%\"],\"symptoms\":[\"2-3 words max\"],\"cause\":[\"1-2 lines max\"],\"treatment\":[\"1-2 lines max\"]}"
-        }]
-
-        # Add optimized image
-        b64 = base64.b64encode(optimized_image).decode()
-        content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}})
-
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": content}],
-            max_tokens=500,
-            temperature=0.1,
-            response_format={"type": "json_object"}
-        )
-
-        result = json.loads(response.choices[0].message.content)
-
-        # Ensure plant names never blank
-        if not result.get('common_name'):
-            result['common_name'] = 'Unknown Plant'
-        if not result.get('scientific_name'):
-            result['scientific_name'] = 'Species unknown'
-
-        # Ensure arrays for disease fields
-        for field in ['disease', 'disease_scientific_name', 'disease_confidence', 'symptoms', 'cause', 'treatment']:
-            if field in result and not isinstance(result[field], list):
-                result[field] = [result[field]]
+        # CPU-bound selection/encoding runs off the event loop
+        optimized_image, metadata = await asyncio.to_thread(prepare_image, images)
+        detail = metadata["encoding"]["detail"]
+
+        fallback_reason = None
+        if not upstream_breaker.allow():
+            fallback_reason = "circuit_open"
+        else:
+            try:
+                # Call OpenAI API (async client so concurrent analyses don't block each other)
+                async with limiter or contextlib.nullcontext():
+                    raw, hedge_info = await upstream_hedge.run(
+                        lambda: _upstream_analysis(optimized_image, detail),
+                        deadline=ANALYSIS_DEADLINE_SECONDS
+                    )
+                result = finalize_result(raw)
+                metadata['upstream'] = hedge_info
+            except asyncio.TimeoutError:
+                logger.error("❌ Upstream analysis exceeded %.0fs deadline", ANALYSIS_DEADLINE_SECONDS)
+                UPSTREAM_ERRORS.labels("deadline_exceeded").inc()
+                fallback_reason = "deadline_exceeded"
+            except Exception as e:
+                logger.error("❌ Upstream analysis failed: %s", e)
+                UPSTREAM_ERRORS.labels(type(e).__name__).inc()
+                fallback_reason = f"upstream_error: {type(e).__name__}"
+
+        if fallback_reason:
+            result = await local_analysis(optimized_image, fallback_reason)
 
         # Calculate API time
         api_time = time.time() - start_time
         
         # Add metadata about image selection and performance
-        result['_metadata'] = {
-            'selected_image_index': selected_idx,
-            'image_type': image_type,
-            'optimization': f"{reduction:.1f}% reduction",
-            'api_time_seconds': round(api_time, 2)
-        }
-        
-        print(f"✅ Analysis completed in {api_time:.2f}s")
-        
+        result['_metadata'] = {**metadata, 'api_time_seconds': round(api_time, 2)}
+        mark_source(result, fallback_reason)
+
         return result
 
     except json.JSONDecodeError as e:
-        print(f"❌ JSON decode error: {e}")
+        logger.error("❌ JSON decode error: %s", e)
         return {"error": "Invalid JSON response from OpenAI"}
     except Exception as e:
-        print(f"❌ Analysis failed: {e}")
-        return {"error": f"Analysis failed: {str(e)}"}
\ No newline at end of file
+        logger.error("❌ Analysis failed: %s", e, exc_info=True)
+        return {"error": f"Analysis failed: {str(e)}"}
+
+
+# Identical concurrent analyses (retries, double submits) share one upstream call
+analyze_flight = SingleFlight("analyze")
+
+
+async def analyze_images_coalesced(images: list[ImageSource], limiter: asyncio.Semaphore = None) -> dict:
+    """
+    analyze_images keyed on the image content hash: concurrent identical requests
+    share one in-flight analysis. Each caller gets its own copy of the result.
+    The shared analysis reads the leading caller's uploads and holds its own reference
+    to them until it finishes, so the leader closing its images (cancelled, failed or
+    simply done) can't close them under the followers still waiting on it.
+    """
+    key = await asyncio.to_thread(content_key, images)
+    lent = []
+
+    def start():
+        lent.extend(image.retain() for image in images if isinstance(image, SpooledImage))
+        return analyze_images(images, limiter)
+
+    def release():
+        for image in lent:
+            image.close()
+
+    result = await analyze_flight.do(key, start, on_done=release)
+    return copy.deepcopy(result)
+
+
+async def analyze_images_stream(images: list[ImageSource]):
+    """
+    STREAMING: Same pipeline as analyze_images (deadline, breaker and local fallback,
+    but no hedging), yielding (event, data) progress:
+    - ("preprocessed", metadata) once the image is selected and optimized
+    - ("plant", fields) as soon as the streamed output contains the plant identification
+    - ("result", result) or ("error", {"error": ...}) at the end
+    """
+    start_time = time.time()
+
+    try:
+        optimized_image, metadata = await asyncio.to_thread(prepare_image, images)
+        yield "preprocessed", metadata
+
+        result = None
+        fallback_reason = None
+        if not upstream_breaker.allow():
+            fallback_reason = "circuit_open"
+        else:
+            try:
+                upstream_started = time.perf_counter()
+                # One absolute deadline over two timeout scopes: "plant" is yielded between
+                # them, never inside one, so the deadline can't fire into the consumer's code
+                deadline = asyncio.get_running_loop().time() + ANALYSIS_DEADLINE_SECONDS
+                scanner = PartialJSONFields(PLANT_FIELDS)
+                plant = None
+                async with asyncio.timeout_at(deadline):
+                    stream = await async_client.chat.completions.create(
+                        model="gpt-4o",
+                        messages=build_messages(optimized_image, metadata["encoding"]["detail"]),
+                        max_tokens=500,
+                        temperature=0.1,
+                        response_format={"type": "json_object"},
+                        stream=True
+                    )
+                    chunks = aiter(stream)
+                    async for chunk in chunks:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            scanner.feed(chunk.choices[0].delta.content)
+                            if all(field in scanner.found for field in PLANT_FIELDS[:2]):
+                                plant = dict(scanner.found)
+                                break
+
+                if plant is not None:
+                    yield "plant", plant
+                    async with asyncio.timeout_at(deadline):
+                        async for chunk in chunks:
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                scanner.feed(chunk.choices[0].delta.content)
+
+                _upstream_seconds.observe(time.perf_counter() - upstream_started)
+                result = finalize_result(json.loads(scanner.buffer))
+                upstream_breaker.record(True)
+            except TimeoutError:
+                logger.error("❌ Upstream analysis exceeded %.0fs deadline", ANALYSIS_DEADLINE_SECONDS)
+                upstream_breaker.record(False)
+                UPSTREAM_ERRORS.labels("deadline_exceeded").inc()
+                fallback_reason = "deadline_exceeded"
+            except Exception as e:
+                logger.error("❌ Upstream analysis failed: %s", e)
+                upstream_breaker.record(False)
+                UPSTREAM_ERRORS.labels(type(e).__name__).inc()
+                fallback_reason = f"upstream_error: {type(e).__name__}"
+
+        if fallback_reason:
+            result = await local_analysis(optimized_image, fallback_reason)
+
+        api_time = time.time() - start_time
+        result['_metadata'] = {**metadata, 'api_time_seconds': round(api_time, 2)}
+        mark_source(result, fallback_reason)
+
+        yield "result", result
+
+    except json.JSONDecodeError as e:
+        logger.error("❌ JSON decode error: %s", e)
+        yield "error", {"error": "Invalid JSON response from OpenAI"}
+    except Exception as e:
+        logger.error("❌ Analysis failed: %s", e, exc_info=True)
+        yield "error", {"error": f"Analysis failed: {str(e)}"}
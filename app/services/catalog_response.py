@@ -0,0 +1,118 @@
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import orjson
+from app.services import product_cache
+from app.services.metrics import CACHE_EVENTS
+from app.utils.content_negotiation import accepts_gzip
+
+# Projected / paginated bodies kept per catalog version (the full catalog is always kept)
+CATALOG_VARIANT_CACHE_SIZE = int(os.getenv("CATALOG_VARIANT_CACHE_SIZE", 64))
+CATALOG_GZIP_LEVEL = int(os.getenv("CATALOG_GZIP_LEVEL", 6))
+# Bodies smaller than this aren't worth compressing
+CATALOG_GZIP_MIN_BYTES = 1024
+
+CATALOG_FIELDS = ("id", "name", "scientific_name", "disease", "disease_scientific_name",
+                  "product_link", "how_to_use", "product_image")
+
+
+class CatalogBody:
+    """One serialized catalog representation: raw + gzip bytes and their strong ETags."""
+
+    def __init__(self, raw: bytes, total: int):
+        self.raw = raw
+        self.total = total
+        digest = hashlib.sha256(raw).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        if len(raw) >= CATALOG_GZIP_MIN_BYTES:
+            # mtime=0 keeps the compressed bytes (and so the ETag) deterministic
+            self.gzipped = gzip.compress(raw, compresslevel=CATALOG_GZIP_LEVEL, mtime=0)
+            self.gzip_etag = f'"{digest}-gzip"'
+        else:
+            self.gzipped = None
+            self.gzip_etag = None
+
+    def select(self, accept_encoding: str) -> Tuple[bytes, str, Optional[str]]:
+        """(body, etag, content-encoding) for the client's Accept-Encoding."""
+        if self.gzipped is not None and accepts_gzip(accept_encoding):
+            return self.gzipped, self.gzip_etag, "gzip"
+        return self.raw, self.etag, None
+
+
+_body_hits = CACHE_EVENTS.labels("catalog_body", "hit")
+_body_misses = CACHE_EVENTS.labels("catalog_body", "miss")
+
+
+class CatalogResponseCache:
+    """
+    Serializes /products once per catalog version instead of once per request.
+    - Keyed on product_cache.get_catalog_version(); a rebuild invalidates every body
+    - The full catalog is built on first request and pinned outside the LRU;
+      projected/paginated variants go through a small LRU so arbitrary query strings
+      can't grow memory unbounded (nor evict the full body)
+    """
+
+    def __init__(self, max_variants: int = CATALOG_VARIANT_CACHE_SIZE):
+        self.max_variants = max_variants
+        self._version = None
+        self._full: Optional[CatalogBody] = None
+        self._variants: "OrderedDict[tuple, CatalogBody]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.hits = 0
+
+    @staticmethod
+    def _serialize(products: List[Dict], fields: Optional[Tuple[str, ...]], offset: int, limit: Optional[int]) -> CatalogBody:
+        end = None if limit is None else offset + limit
+        page = products[offset:end]
+        if fields is not None:
+            page = [{field: product.get(field) for field in fields} for product in page]
+        return CatalogBody(orjson.dumps(page), len(products))
+
+    def get(self, fields: Optional[Tuple[str, ...]] = None, offset: int = 0, limit: Optional[int] = None) -> CatalogBody:
+        version = product_cache.get_catalog_version()
+        key = (fields, offset, limit)
+        full = key == (None, 0, None)
+        with self._lock:
+            if version != self._version:
+                self._full = None
+                self._variants.clear()
+                self._version = version
+            body = self._full if full else self._variants.get(key)
+            if body is not None:
+                if not full:
+                    self._variants.move_to_end(key)
+                self.hits += 1
+                _body_hits.inc()
+                return body
+
+        _body_misses.inc()
+        body = self._serialize(product_cache.get_cached_products(), fields, offset, limit)
+        with self._lock:
+            self.builds += 1
+            if version == self._version and full:
+                self._full = body
+            elif version == self._version:
+                self._variants[key] = body
+                while len(self._variants) > self.max_variants:
+                    self._variants.popitem(last=False)
+        return body
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"catalog_version": self._version, "full_catalog_cached": self._full is not None, "variants": len(self._variants), "builds": self.builds, "hits": self.hits}
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check: `*` or any listed tag (W/ prefixes compared weakly)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+catalog_responses = CatalogResponseCache()
@@ -0,0 +1,260 @@
+import os
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence
+from sqlalchemy import Table, case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.models.analytics_model import DetectionDisease, DailyPlantRollup, DailyDiseaseRollup, UserPlantRollup
+from app.services.match_utils import canonicalize
+
+logger = logging.getLogger(__name__)
+
+# Longest window the analytics endpoints aggregate over
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", 366))
+
+DETECTION_DISEASES = DetectionDisease.__table__
+DAILY_PLANTS = DailyPlantRollup.__table__
+DAILY_DISEASES = DailyDiseaseRollup.__table__
+USER_PLANTS = UserPlantRollup.__table__
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE (same API in SQLAlchemy for both)
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def parse_confidence(value) -> Optional[float]:
+    """"88%" / "88" / 88 / 0.88 -> 88.0; None when unparseable."""
+    if isinstance(value, str):
+        value = value.strip().rstrip("%").strip()
+    try:
+        confidence = float(value)
+    except (TypeError, ValueError):
+        return None
+    if 0 < confidence <= 1:
+        confidence *= 100
+    return confidence if 0 <= confidence <= 100 else None
+
+
+def _item(values, idx: int):
+    if isinstance(values, list) and idx < len(values):
+        return values[idx]
+    return None
+
+
+def detection_rows(detection, detected_at: datetime) -> List[dict]:
+    """Side-table rows for one saved detection (needs its id: flush first)."""
+    plant = canonicalize(detection.scientific_name or "") or canonicalize(detection.common_name or "")
+    base = {
+        "detection_id": detection.id,
+        "mobile": detection.mobile,
+        "plant": plant,
+        "detected_at": detected_at,
+        "day": detected_at.date(),
+    }
+    names = detection.disease_scientific_name if isinstance(detection.disease_scientific_name, list) else []
+    rows = []
+    for idx, name in enumerate(names):
+        disease = canonicalize(name) if isinstance(name, str) else ""
+        if not disease:
+            continue
+        # Position among the kept diseases: position 0 marks the detection's first row
+        rows.append({
+            **base,
+            "position": len(rows),
+            "disease": disease,
+            "disease_name": _item(detection.disease, idx),
+            "confidence": parse_confidence(_item(detection.disease_confidence, idx)),
+        })
+    if not rows:
+        rows.append({**base, "position": 0, "disease": None, "disease_name": None, "confidence": None})
+    return rows
+
+
+def rollup_deltas(rows: Iterable[dict]) -> Dict[Table, List[dict]]:
+    """
+    Aggregate side-table rows into one increment per rollup key, in key order (concurrent
+    writers then take row locks in the same order and cannot deadlock each other).
+    """
+    plants = defaultdict(int)
+    diseases = defaultdict(lambda: [0, 0.0, 0])
+    users = {}
+    for row in rows:
+        if row["position"] == 0:
+            plants[(row["day"], row["plant"])] += 1
+            key = (row["mobile"], row["plant"])
+            count, last_day = users.get(key, (0, row["day"]))
+            users[key] = (count + 1, max(last_day, row["day"]))
+        if row["disease"]:
+            totals = diseases[(row["day"], row["disease"], row["plant"])]
+            totals[0] += 1
+            if row["confidence"] is not None:
+                totals[1] += row["confidence"]
+                totals[2] += 1
+    return {
+        DAILY_PLANTS: [{"day": day, "plant": plant, "detections": count} for (day, plant), count in sorted(plants.items())],
+        DAILY_DISEASES: [
+            {"day": day, "disease": disease, "plant": plant, "detections": count, "confidence_sum": total, "confidence_count": scored}
+            for (day, disease, plant), (count, total, scored) in sorted(diseases.items())
+        ],
+        USER_PLANTS: [
+            {"mobile": mobile, "plant": plant, "detections": count, "last_day": last_day}
+            for (mobile, plant), (count, last_day) in sorted(users.items())
+        ],
+    }
+
+
+def _key_columns(table: Table) -> List[str]:
+    return [column.name for column in table.primary_key.columns]
+
+
+def _upsert(db: Session, table: Table, rows: List[dict]):
+    """Add `rows` onto the rollup: counters are incremented, last_day keeps the latest."""
+    if not rows:
+        return
+    keys = _key_columns(table)
+    values = [name for name in rows[0] if name not in keys]
+    make_insert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+
+    if make_insert is not None:
+        stmt = make_insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=keys, set_={
+            name: case((stmt.excluded[name] > table.c[name], stmt.excluded[name]), else_=table.c[name])
+            if name == "last_day" else table.c[name] + stmt.excluded[name]
+            for name in values
+        })
+        db.execute(stmt, rows)
+        return
+
+    # Portable fallback: update, then insert the keys that did not exist yet
+    for row in rows:
+        where = [table.c[name] == row[name] for name in keys]
+        result = db.execute(update(table).where(*where).values({
+            name: case((table.c[name] < row[name], row[name]), else_=table.c[name])
+            if name == "last_day" else table.c[name] + row[name]
+            for name in values
+        }))
+        if result.rowcount == 0:
+            db.execute(insert(table), [row])
+
+
+def apply_rollups(db: Session, rows: Sequence[dict]):
+    for table, deltas in rollup_deltas(rows).items():
+        _upsert(db, table, deltas)
+
+
+def analytics_rows(detections: Sequence, detected_at: datetime = None) -> List[dict]:
+    """Side-table rows for flushed detections; read them before the commit expires the objects."""
+    detected_at = detected_at or datetime.now(timezone.utc)
+    return [row for detection in detections for row in detection_rows(detection, detected_at)]
+
+
+def record_detections(db: Session, rows: Sequence[dict]) -> bool:
+    """
+    Write-time analytics for committed detections, in a transaction of their own:
+    side-table rows plus rollup increments. A failure is logged and rolled back without
+    touching the detections, and the hot (day, plant) rollup rows are only locked for
+    this short transaction, not for the detection insert.
+    """
+    if not rows:
+        return True
+    try:
+        db.execute(insert(DETECTION_DISEASES), rows)
+        apply_rollups(db, rows)
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error("❌ Detection analytics write failed (detections kept): %s", e)
+        return False
+
+
+def rebuild_rollups(db: Session):
+    """Recompute every rollup from the side table (repair / after manual deletes)."""
+    t = DETECTION_DISEASES
+    for table in (DAILY_PLANTS, DAILY_DISEASES, USER_PLANTS):
+        db.execute(delete(table))
+    db.execute(insert(DAILY_PLANTS).from_select(
+        ["day", "plant", "detections"],
+        select(t.c.day, t.c.plant, func.count()).where(t.c.position == 0).group_by(t.c.day, t.c.plant),
+    ))
+    db.execute(insert(DAILY_DISEASES).from_select(
+        ["day", "disease", "plant", "detections", "confidence_sum", "confidence_count"],
+        select(t.c.day, t.c.disease, t.c.plant, func.count(), func.coalesce(func.sum(t.c.confidence), 0), func.count(t.c.confidence))
+        .where(t.c.disease.is_not(None)).group_by(t.c.day, t.c.disease, t.c.plant),
+    ))
+    db.execute(insert(USER_PLANTS).from_select(
+        ["mobile", "plant", "detections", "last_day"],
+        select(t.c.mobile, t.c.plant, func.count(), func.max(t.c.day)).where(t.c.position == 0).group_by(t.c.mobile, t.c.plant),
+    ))
+    db.commit()
+    logger.info("✅ Detection analytics rollups rebuilt")
+
+
+# Queries: read only the rollup tables, so their cost follows the number of distinct
+# (day, plant, disease) keys in the window, not the number of detections stored.
+
+def window_start(days: int, today: date = None) -> date:
+    """First UTC day of a `days`-long window ending today."""
+    today = today or datetime.now(timezone.utc).date()
+    return today - timedelta(days=days - 1)
+
+
+def _average(total, count) -> Optional[float]:
+    return round(total / count, 1) if count else None
+
+
+def top_diseases(db: Session, since: date, limit: int = 10, plant: Optional[str] = None) -> List[dict]:
+    r = DAILY_DISEASES
+    detections = func.sum(r.c.detections)
+    query = (
+        select(r.c.disease, detections, func.sum(r.c.confidence_sum), func.sum(r.c.confidence_count))
+        .where(r.c.day >= since)
+        .group_by(r.c.disease)
+        .order_by(detections.desc(), r.c.disease)
+        .limit(limit)
+    )
+    if plant:
+        query = query.where(r.c.plant == canonicalize(plant))
+    return [
+        {"disease": disease, "detections": count, "avg_confidence": _average(total, scored)}
+        for disease, count, total, scored in db.execute(query)
+    ]
+
+
+def top_plants(db: Session, since: date, limit: int = 10) -> List[dict]:
+    r = DAILY_PLANTS
+    detections = func.sum(r.c.detections)
+    query = (
+        select(r.c.plant, detections)
+        .where(r.c.day >= since)
+        .group_by(r.c.plant)
+        .order_by(detections.desc(), r.c.plant)
+        .limit(limit)
+    )
+    return [{"plant": plant, "detections": count} for plant, count in db.execute(query)]
+
+
+def daily_counts(db: Session, since: date, disease: Optional[str] = None, plant: Optional[str] = None) -> List[dict]:
+    """Detections per day (disease reports per day when `disease` is given)."""
+    r = DAILY_DISEASES if disease else DAILY_PLANTS
+    query = select(r.c.day, func.sum(r.c.detections)).where(r.c.day >= since).group_by(r.c.day).order_by(r.c.day)
+    if disease:
+        query = query.where(r.c.disease == canonicalize(disease))
+    if plant:
+        query = query.where(r.c.plant == canonicalize(plant))
+    return [{"day": day.isoformat(), "detections": count} for day, count in db.execute(query)]
+
+
+def user_plants(db: Session, mobile: str, limit: int = 10) -> List[dict]:
+    r = USER_PLANTS
+    query = (
+        select(r.c.plant, r.c.detections, r.c.last_day)
+        .where(r.c.mobile == mobile)
+        .order_by(r.c.detections.desc(), r.c.plant)
+        .limit(limit)
+    )
+    return [
+        {"plant": plant, "detections": count, "last_detected": last_day.isoformat()}
+        for plant, count, last_day in db.execute(query)
+    ]
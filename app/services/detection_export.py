@@ -0,0 +1,141 @@
+import io
+import os
+import csv
+import hmac
+import time
+import zlib
+import logging
+from datetime import date
+from typing import Iterable, Iterator, Optional, Sequence
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Text, and_, cast, select
+from app.config.db import SessionLocal
+from app.models.detection_model import PlantDetection
+from app.services.detection_analytics import DETECTION_DISEASES
+from app.utils.content_negotiation import accepts_gzip
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per server-side cursor round trip; also rows per response chunk
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", 2000))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", 6))
+# X-Export-Token for exports across all users (support / data science); unset = disabled
+EXPORT_TOKEN = os.getenv("EXPORT_TOKEN", "")
+
+EXPORT_FIELDS = ("id", "mobile", "detected_at", "common_name", "scientific_name", "plant_confidence", "disease",
+                 "disease_scientific_name", "disease_confidence", "symptoms", "cause", "treatment", "image")
+# List-valued columns, read as the stored JSON text and copied into the output as is
+# (parsing and re-serializing them was most of the export's CPU time)
+JSON_FIELDS = frozenset(("disease", "disease_scientific_name", "disease_confidence", "symptoms", "cause", "treatment"))
+SCALAR_FIELDS = tuple(name for name in EXPORT_FIELDS if name not in JSON_FIELDS)
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def export_token_matches(token: Optional[str]) -> bool:
+    return bool(EXPORT_TOKEN) and token is not None and hmac.compare_digest(token, EXPORT_TOKEN)
+
+
+def export_query(mobile: Optional[str] = None, since: Optional[date] = None, until: Optional[date] = None):
+    """
+    Detections in id order with their detection time from the analytics side table.
+    Rows saved before the side table existed have no time: exported with detected_at
+    null, and left out of date-range exports.
+    """
+    d = PlantDetection.__table__
+    s = DETECTION_DISEASES
+    columns = [
+        s.c.detected_at if name == "detected_at" else cast(d.c[name], Text).label(name) if name in JSON_FIELDS else d.c[name]
+        for name in EXPORT_FIELDS
+    ]
+    query = (
+        select(*columns)
+        .select_from(d.outerjoin(s, and_(s.c.detection_id == d.c.id, s.c.position == 0)))
+        .order_by(d.c.id)
+    )
+    if mobile:
+        query = query.where(d.c.mobile == mobile)
+    if since:
+        query = query.where(s.c.day >= since)
+    if until:
+        query = query.where(s.c.day <= until)
+    return query
+
+
+_SCALAR_INDEXES = [EXPORT_FIELDS.index(name) for name in SCALAR_FIELDS]
+_JSON_PARTS = [(EXPORT_FIELDS.index(name), b',"' + name.encode() + b'":') for name in EXPORT_FIELDS if name in JSON_FIELDS]
+
+
+def _ndjson(rows: Sequence) -> bytes:
+    """One object per line: scalars serialized by orjson, then the raw JSON columns spliced in."""
+    parts = []
+    for row in rows:
+        parts.append(orjson.dumps({name: row[idx] for name, idx in zip(SCALAR_FIELDS, _SCALAR_INDEXES)})[:-1])
+        for idx, key in _JSON_PARTS:
+            parts.append(key)
+            parts.append(row[idx].encode() if row[idx] is not None else b"null")
+        parts.append(b"}\n")
+    return b"".join(parts)
+
+
+_DETECTED_AT = EXPORT_FIELDS.index("detected_at")
+
+
+def _csv(rows: Sequence) -> bytes:
+    """csv writes None as an empty cell; only the timestamp needs converting."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        row = list(row)
+        if row[_DETECTED_AT] is not None:
+            row[_DETECTED_AT] = row[_DETECTED_AT].isoformat()
+        writer.writerow(row)
+    return buffer.getvalue().encode()
+
+
+ENCODERS = {"ndjson": _ndjson, "csv": _csv}
+
+
+def export_chunks(fmt: str, mobile: Optional[str] = None, since: Optional[date] = None, until: Optional[date] = None,
+                  batch_rows: int = EXPORT_BATCH_ROWS) -> Iterator[bytes]:
+    """
+    Encoded export, one chunk per batch of rows. Rows come from a server-side cursor
+    (yield_per / stream_results): at most one batch is held in memory, whatever the total.
+    Uses its own session, since the response outlives the request's dependencies.
+    """
+    encode = ENCODERS[fmt]
+    started = time.perf_counter()
+    exported = 0
+    db = SessionLocal()
+    try:
+        if fmt == "csv":
+            yield (",".join(EXPORT_FIELDS) + "\n").encode()
+        result = db.execute(export_query(mobile, since, until).execution_options(yield_per=batch_rows))
+        for rows in result.partitions():
+            exported += len(rows)
+            yield encode(rows)
+        logger.info("✅ Exported %d detections as %s in %.1fs", exported, fmt, time.perf_counter() - started)
+    finally:
+        # Also reached when the client disconnects mid-export (generator closed)
+        db.close()
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = EXPORT_GZIP_LEVEL) -> Iterator[bytes]:
+    """Incremental gzip stream: compressor state is bounded, never the whole body."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_response(fmt: str, accept_encoding: str, filename: str, mobile: Optional[str] = None,
+                    since: Optional[date] = None, until: Optional[date] = None) -> StreamingResponse:
+    """Streamed attachment; gzip-encoded on the fly when the client accepts it."""
+    chunks = export_chunks(fmt, mobile, since, until)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{fmt}"', "Vary": "Accept-Encoding"}
+    if accepts_gzip(accept_encoding):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=EXPORT_MEDIA_TYPES[fmt], headers=headers)
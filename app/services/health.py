@@ -0,0 +1,107 @@
+import os
+import time
+import threading
+import logging
+from sqlalchemy import event, text
+from app.config.db import engine
+from app.services import product_cache, analyze_service
+from app.services.upstream_guard import upstream_breaker
+from app.services.product_import_service import ProductImportService
+from app.services.metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+STARTED_AT = time.time()
+
+
+class DetectionWriteBacklog:
+    """Counts detection rows scheduled for background persistence but not yet committed."""
+
+    def __init__(self):
+        self.pending = 0
+        self.written = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def add(self, count: int = 1):
+        with self._lock:
+            self.pending += count
+
+    def done(self, count: int = 1, ok: bool = True):
+        with self._lock:
+            self.pending -= count
+            if ok:
+                self.written += count
+            else:
+                self.failed += count
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending": self.pending, "written": self.written, "failed": self.failed}
+
+
+detection_writes = DetectionWriteBacklog()
+Gauge("plant_api_detection_write_backlog", "Detections scheduled for saving but not yet committed", fn=lambda: detection_writes.pending)
+
+
+# Last known database reachability, kept current by the connection pool's own traffic:
+# every checkout means "connected", a disconnect / failed connect means "unreachable"
+database_status = {"status": "unknown"}
+
+
+@event.listens_for(engine, "checkout")
+def _database_checkout(*_):
+    database_status["status"] = "connected"
+
+
+@event.listens_for(engine, "handle_error")
+def _database_error(context):
+    if context.is_disconnect or context.connection is None:
+        database_status["status"] = "unreachable"
+
+
+def model_readiness() -> dict:
+    return {
+        "local_model_ready": analyze_service.model_ready,
+        "local_model_error": analyze_service.model_error,
+        "openai_configured": bool(analyze_service.api_key),
+        "upstream_breaker": upstream_breaker.state,
+    }
+
+
+def stats_snapshot() -> dict:
+    """
+    In-memory process stats: constant time, never touches the database. "database" and
+    "product_stats" keep the keys /health always had, from the pool's last known state
+    and the cached catalog counts (/health/deep replaces both with live values).
+    """
+    catalog = product_cache.get_catalog_stats()
+    return {
+        "pid": os.getpid(),
+        "uptime_seconds": round(time.time() - STARTED_AT, 1),
+        "database": database_status["status"],
+        "catalog": catalog,
+        "products_loaded": catalog.get("total_products", 0) > 0,
+        "product_stats": {key: catalog.get(key, 0) for key in ("total_products", "unique_diseases", "unique_plants")},
+        "detection_writes": detection_writes.stats(),
+        "models": model_readiness(),
+    }
+
+
+def deep_probe() -> dict:
+    """On-demand dependency check: DB round trip plus catalog counts vs the in-memory cache."""
+    probe = {"database": "connected"}
+    started = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        probe["database_latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    except Exception as e:
+        logger.error(f"Deep health probe: database unreachable: {e}")
+        return {"database": "unreachable", "error": str(e)}
+
+    db_stats = ProductImportService.get_product_stats(engine)
+    probe["product_stats"] = db_stats
+    # An empty (not yet loaded) cache has no counts at all
+    probe["cache_in_sync"] = db_stats.get("total_products", 0) == product_cache.get_catalog_stats().get("total_products", 0)
+    return probe
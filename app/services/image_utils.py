@@ -1,20 +1,56 @@
 from PIL import Image, ImageFilter
+from typing import Union
+from app.utils.upload_reader import SpooledImage
+from app.services.metrics import timed
 import io
+import hashlib
+import math
+import os
 
-def detect_image_type(image_data: bytes) -> str:
+ImageSource = Union[bytes, SpooledImage]
+
+
+def _image_stream(image_data: ImageSource):
+    """Readable stream for raw bytes or a spooled upload (rewound)."""
+    if isinstance(image_data, (bytes, bytearray)):
+        return io.BytesIO(image_data)
+    return image_data.stream()
+
+
+def _image_bytes(image_data: ImageSource) -> bytes:
+    if isinstance(image_data, (bytes, bytearray)):
+        return bytes(image_data)
+    return image_data.getvalue()
+
+
+def _edge_density(img: Image.Image) -> float:
+    """Share of strong edges in a 100x100 grayscale thumbnail (0-1)."""
+    small_img = img.resize((100, 100)).convert('L')
+    edges = small_img.filter(ImageFilter.FIND_EDGES)
+    edge_pixels = sum(1 for pixel in edges.getdata() if pixel > 30)
+    return edge_pixels / 10000
+
+
+def content_key(images: list[ImageSource]) -> str:
+    """Order-sensitive hash of a set of images (single-flight / cache key)."""
+    digest = hashlib.sha256()
+    for image_data in images:
+        if isinstance(image_data, (bytes, bytearray)):
+            digest.update(hashlib.sha256(image_data).digest())
+        else:
+            digest.update(bytes.fromhex(image_data.sha256()))
+    return digest.hexdigest()
+
+
+def detect_image_type(image_data: ImageSource) -> str:
     """
     SMART: Detect if image is close-up or wide-view using edge density.
     Returns: "close_up" or "wide_view"
     """
     try:
-        with Image.open(io.BytesIO(image_data)) as img:
-            # Quick analysis with small image
-            small_img = img.resize((100, 100)).convert('L')
-            
+        with Image.open(_image_stream(image_data)) as img:
             # Calculate edge density (close-ups have more detail)
-            edges = small_img.filter(ImageFilter.FIND_EDGES)
-            edge_pixels = sum(1 for pixel in edges.getdata() if pixel > 30)
-            edge_density = edge_pixels / 10000  # Normalized 0-1
+            edge_density = _edge_density(img)
             
             # Classification threshold
             return "close_up" if edge_density > 0.15 else "wide_view"
@@ -22,47 +58,148 @@ def detect_image_type(image_data: bytes) -> str:
         return "unknown"
 
 
-def optimize_image(image_data: bytes, image_type: str = None) -> bytes:
+# Per-type encoding targets: (max side px, starting JPEG quality, byte budget)
+ENCODE_PRESETS = {
+    "close_up": (512, 75, int(os.getenv("IMAGE_BYTE_BUDGET_CLOSE_UP", 48 * 1024))),
+    "wide_view": (768, 80, int(os.getenv("IMAGE_BYTE_BUDGET_WIDE_VIEW", 96 * 1024))),
+}
+MIN_QUALITY = 40
+MIN_SIDE = 320
+# "auto" picks per image; "low" / "high" force the upstream vision detail mode
+IMAGE_DETAIL_MODE = os.getenv("IMAGE_DETAIL_MODE", "auto")
+# Low-detail mode sees at most 512x512, so anything that small never needs high detail
+LOW_DETAIL_MAX_SIDE = 512
+# Close-ups this busy (fine spotting, mildew) still get high detail
+HIGH_DETAIL_EDGE_DENSITY = float(os.getenv("HIGH_DETAIL_EDGE_DENSITY", 0.35))
+
+
+def estimate_vision_tokens(width: int, height: int, detail: str) -> int:
+    """
+    GPT-4o vision token estimate:
+    - low: flat 85
+    - high: fit in 2048x2048, shortest side to 768, 170 per 512px tile + 85
+    """
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = 768 / min(width, height)
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 170 * tiles + 85
+
+
+def choose_detail(img: Image.Image, image_type: str) -> str:
+    if IMAGE_DETAIL_MODE in ("low", "high"):
+        return IMAGE_DETAIL_MODE
+    if max(img.size) <= LOW_DETAIL_MAX_SIDE:
+        return "low"
+    # Wide views keep lesions small in frame; close-ups only when very detailed
+    if image_type != "close_up" or _edge_density(img) >= HIGH_DETAIL_EDGE_DENSITY:
+        return "high"
+    return "low"
+
+
+def _jpeg(img: Image.Image, quality: int, optimize: bool = False) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality, optimize=optimize)
+    return buffer.getvalue()
+
+
+def encode_to_budget(img: Image.Image, max_side: int, quality: int, budget: int) -> tuple[bytes, Image.Image, int]:
     """
-    SAFE CONDITIONAL OPTIMIZATION:
-    - Close-ups: Crop 85% center + resize 512px + compress 75% = 80% reduction
-    - Wide-views: Keep full + resize 768px + compress 80% = 60% reduction
+    Largest image (<= max_side) at the highest quality (<= quality) that fits `budget` bytes.
+    - Binary search over quality in steps of 5 using cheap (non-optimized) encodes
+    - Shrinks dimensions by 25% when even MIN_QUALITY doesn't fit, down to MIN_SIDE
+    Returns: (jpeg_bytes, resized_image, quality)
+    """
+    side = min(max(img.size), max_side)
+    while True:
+        candidate = img.copy()
+        candidate.thumbnail((side, side), Image.Resampling.LANCZOS)
+
+        qualities = list(range(MIN_QUALITY, quality + 1, 5))
+        if qualities[-1] != quality:
+            qualities.append(quality)
+
+        best = None
+        lo, hi = 0, len(qualities) - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if len(_jpeg(candidate, qualities[mid])) <= budget:
+                best = qualities[mid]
+                lo = mid + 1
+            else:
+                hi = mid - 1
+
+        if best is not None or side <= MIN_SIDE:
+            best = best if best is not None else MIN_QUALITY
+            return _jpeg(candidate, best, optimize=True), candidate, best
+
+        side = max(MIN_SIDE, int(side * 0.75))
+
+
+@timed("optimization")
+def encode_image(image_data: ImageSource, image_type: str = None) -> tuple[bytes, dict]:
+    """
+    ADAPTIVE ENCODING: optimize_image + byte budget + vision detail mode.
+    - Close-ups: Crop 85% center, <=512px, budget IMAGE_BYTE_BUDGET_CLOSE_UP
+    - Wide-views: Keep full, <=768px, budget IMAGE_BYTE_BUDGET_WIDE_VIEW
+    - Small JPEGs already within budget are sent untouched
+    Returns: (jpeg_bytes, info) with dimensions, quality, bytes, detail, estimated_tokens
     """
     try:
         # Auto-detect type if not provided
         if image_type is None:
             image_type = detect_image_type(image_data)
-        
-        with Image.open(io.BytesIO(image_data)) as img:
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # CONDITIONAL OPTIMIZATION based on image type
-            if image_type == "close_up":
-                # SAFE to crop - disease in center
-                w, h = img.size
-                crop_w, crop_h = int(w * 0.85), int(h * 0.85)
-                left, top = (w - crop_w) // 2, (h - crop_h) // 2
-                img = img.crop((left, top, left + crop_w, top + crop_h))
-                max_size = 512
-                quality = 75
-            else:  # wide_view or unknown
-                # Keep full for context
-                max_size = 768
-                quality = 80
-            
-            # Resize maintaining aspect ratio
-            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-            
-            # Compress JPEG
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=quality, optimize=True)
-            return buffer.getvalue()
+
+        max_side, quality, budget = ENCODE_PRESETS.get(image_type, ENCODE_PRESETS["wide_view"])
+
+        with Image.open(_image_stream(image_data)) as img:
+            if img.format == 'JPEG' and len(image_data) <= budget and max(img.size) <= LOW_DETAIL_MAX_SIDE:
+                data = _image_bytes(image_data)
+                width, height = img.size
+                detail = choose_detail(img, image_type)
+                quality = None
+            else:
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+
+                if image_type == "close_up":
+                    # SAFE to crop - disease in center
+                    w, h = img.size
+                    crop_w, crop_h = int(w * 0.85), int(h * 0.85)
+                    left, top = (w - crop_w) // 2, (h - crop_h) // 2
+                    img = img.crop((left, top, left + crop_w, top + crop_h))
+
+                data, img, quality = encode_to_budget(img, max_side, quality, budget)
+                width, height = img.size
+                detail = choose_detail(img, image_type)
+
+        return data, {
+            'dimensions': [width, height],
+            'quality': quality,
+            'bytes': len(data),
+            'byte_budget': budget,
+            'detail': detail,
+            'estimated_vision_tokens': estimate_vision_tokens(width, height, detail),
+        }
     except:
-        return image_data
+        data = _image_bytes(image_data)
+        return data, {'bytes': len(data), 'detail': 'auto'}
+
+
+def optimize_image(image_data: ImageSource, image_type: str = None) -> bytes:
+    """
+    SAFE CONDITIONAL OPTIMIZATION (see encode_image):
+    - Close-ups: Crop 85% center + resize <=512px + compress to byte budget
+    - Wide-views: Keep full + resize <=768px + compress to byte budget
+    """
+    return encode_image(image_data, image_type)[0]
 
 
-def select_best_image(images: list[bytes]) -> tuple[bytes, str, int]:
+@timed("selection")
+def select_best_image(images: list[ImageSource]) -> tuple[ImageSource, str, int]:
     """
     SMART: Select best image for disease analysis.
     Returns: (selected_image_bytes, image_type, selected_index)
@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+import logging
+from uuid import uuid4
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi import HTTPException
+from app.services.metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+ANALYZE_JOB_WORKERS = int(os.getenv("ANALYZE_JOB_WORKERS", 4))
+ANALYZE_JOB_QUEUE_SIZE = int(os.getenv("ANALYZE_JOB_QUEUE_SIZE", 100))
+ANALYZE_JOB_TTL = float(os.getenv("ANALYZE_JOB_TTL", 600))
+
+
+class Job:
+    """A submitted unit of work and, once finished, its result or error."""
+
+    def __init__(self, owner: str, run: Callable[[], Awaitable[Any]]):
+        self.id = uuid4().hex
+        self.owner = owner
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.status_code = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._run = run
+        self.done = asyncio.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"job_id": self.id, "status": self.status}
+        if self.status == "done":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = self.error
+            data["status_code"] = self.status_code
+        return data
+
+
+class JobQueue:
+    """
+    Bounded in-process job queue:
+    - `workers` asyncio tasks drain a queue of at most `maxsize` pending jobs
+    - submit() raises 429 with Retry-After when the queue is full
+    - finished jobs are kept for `ttl` seconds, then forgotten
+    """
+
+    def __init__(self, workers: int = ANALYZE_JOB_WORKERS, maxsize: int = ANALYZE_JOB_QUEUE_SIZE, ttl: float = ANALYZE_JOB_TTL):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._avg_job_seconds = 10.0
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} job workers (queue size {self.maxsize})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up."""
+        return max(1, int(self._avg_job_seconds * (self.depth() + 1) / self.workers))
+
+    def is_full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    def reject_if_full(self):
+        if self.is_full():
+            raise HTTPException(429, "Too many queued jobs, retry later", headers={"Retry-After": str(self.retry_after())})
+
+    def submit(self, owner: str, run: Callable[[], Awaitable[Any]], cleanup: Callable[[], None] = None) -> Job:
+        """Queue `run`; `cleanup` releases its resources if the job is rejected."""
+        self.start()
+        self.expire()
+        job = Job(owner, run)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            if cleanup:
+                cleanup()
+            raise HTTPException(429, "Too many queued jobs, retry later", headers={"Retry-After": str(self.retry_after())})
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str, owner: str) -> Job:
+        self.expire()
+        job = self.jobs.get(job_id)
+        if job is None or job.owner != owner:
+            raise HTTPException(404, "Job not found or expired")
+        return job
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """Long-poll: return once the job finishes or `timeout` elapses."""
+        if timeout > 0 and not job.done.is_set():
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    def expire(self):
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            started = time.time()
+            try:
+                job.result = await job._run()
+                job.status = "done"
+            except HTTPException as e:
+                job.status, job.error, job.status_code = "failed", e.detail, e.status_code
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}", exc_info=True)
+                job.status, job.error, job.status_code = "failed", str(e), 500
+            finally:
+                job.finished_at = time.time()
+                # Exponential moving average feeds the Retry-After estimate
+                self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * (job.finished_at - started)
+                job._run = None
+                job.done.set()
+                self._queue.task_done()
+
+
+analyze_jobs = JobQueue()
+Gauge("plant_api_job_queue_depth", "Analyze jobs waiting for a worker", fn=analyze_jobs.depth)
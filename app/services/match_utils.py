@@ -1,7 +1,18 @@
+import os
 import re
+import sys
+import numpy as np
 from rapidfuzz import process, fuzz
 from functools import lru_cache
-from typing import List, Tuple, Optional
+from typing import Dict, Iterable, List, Tuple, Optional, Sequence
+
+# Everything normalize() keeps: a-z, 0-9, whitespace and "."
+_NAME_CHARS = re.compile(r'[^a-z0-9\s\.]')
+# ASCII fast path of the same rule: one translate() instead of a regex pass
+_NORMALIZE_TABLE = str.maketrans("", "", "".join(
+    chr(c) for c in range(128) if not (chr(c).isalnum() and not chr(c).isupper()) and chr(c) not in " ."
+))
+
 
 def normalize(text: str) -> str:
     """
@@ -13,24 +24,183 @@ def normalize(text: str) -> str:
     """
     if not isinstance(text, str):
         return ""
-    
-    # Convert to lowercase
-    text = text.lower().strip()
-    
-    # Standardize spaces
-    text = re.sub(r'\s+', ' ', text)
-    
+
+    # Lowercase, trim and collapse whitespace runs to single spaces
+    text = " ".join(text.lower().split())
+
     # Preserve scientific name format (Genus species)
     # but remove other special characters
-    text = re.sub(r'[^a-z0-9\s\.]', '', text)
-    
+    text = text.translate(_NORMALIZE_TABLE) if text.isascii() else _NAME_CHARS.sub('', text)
+
     # Handle common variations in scientific names
-    text = text.replace('spp.', 'species')
-    text = text.replace('var.', 'variety')
-    text = text.replace('subsp.', 'subspecies')
-    
+    if "." in text:
+        text = text.replace('spp.', 'species')
+        text = text.replace('var.', 'variety')
+        text = text.replace('subsp.', 'subspecies')
+
     return text.strip()
 
+
+# Canonical rank words; tokens for matching leave them out
+RANK_ALIASES = {
+    "sp": "species", "spp": "species", "species": "species",
+    "var": "variety", "variety": "variety",
+    "subsp": "subspecies", "ssp": "subspecies", "subspecies": "subspecies",
+    "pv": "pathovar", "pathovar": "pathovar",
+}
+RANK_WORDS = frozenset(RANK_ALIASES.values()) | {"forma", "specialis"}
+
+# Outdated or alternative binomials -> current name (applied to the leading genus + epithet)
+SCIENTIFIC_SYNONYMS = {
+    "lycopersicon esculentum": "solanum lycopersicum",
+    "lycopersicon lycopersicum": "solanum lycopersicum",
+    "botryotinia fuckeliana": "botrytis cinerea",
+    "magnaporthe oryzae": "pyricularia oryzae",
+    "magnaporthe grisea": "pyricularia oryzae",
+    "sphaerotheca fuliginea": "podosphaera xanthii",
+    "podosphaera fuliginea": "podosphaera xanthii",
+    "erysiphe cichoracearum": "golovinomyces cichoracearum",
+    "uncinula necator": "erysiphe necator",
+    "mycosphaerella fijiensis": "pseudocercospora fijiensis",
+    "gibberella fujikuroi": "fusarium fujikuroi",
+    "gibberella zeae": "fusarium graminearum",
+    "pseudomonas solanacearum": "ralstonia solanacearum",
+    "glomerella cingulata": "colletotrichum gloeosporioides",
+    "thanatephorus cucumeris": "rhizoctonia solani",
+}
+
+# Well-known binomials whose abbreviated genus ("P. infestans") is expanded even when the
+# catalog doesn't list them; catalog names add to this on every load
+KNOWN_BINOMIALS = (
+    "phytophthora infestans", "phytophthora capsici", "alternaria solani", "alternaria alternata",
+    "botrytis cinerea", "fusarium oxysporum", "fusarium graminearum", "rhizoctonia solani",
+    "sclerotinia sclerotiorum", "pythium aphanidermatum", "pyricularia oryzae", "puccinia graminis",
+    "puccinia triticina", "podosphaera xanthii", "erysiphe necator", "plasmopara viticola",
+    "pseudoperonospora cubensis", "xanthomonas campestris", "xanthomonas oryzae", "pseudomonas syringae",
+    "ralstonia solanacearum", "colletotrichum gloeosporioides", "cercospora beticola", "septoria lycopersici",
+    "venturia inaequalis", "solanum lycopersicum", "solanum tuberosum", "solanum melongena",
+    "capsicum annuum", "oryza sativa", "triticum aestivum", "zea mays", "vitis vinifera",
+    "malus domestica", "cucumis sativus", "citrus sinensis", "musa acuminata", "gossypium hirsutum",
+)
+
+# Distinct query strings whose canonical form is remembered (catalog names are pinned separately)
+CANONICAL_CACHE_SIZE = int(os.getenv("CANONICAL_CACHE_SIZE", 50000))
+
+# Canonical form of one name: (text, matching tokens without rank words)
+CanonicalName = Tuple[str, Tuple[str, ...]]
+
+_CANONICAL_TABLE = str.maketrans({
+    **{chr(c): None for c in range(128) if not (chr(c).isalnum() and not chr(c).isupper()) and not chr(c).isspace() and chr(c) != "."},
+    ".": " ",
+})
+
+
+def _raw_tokens(text: str) -> List[str]:
+    """Lowercase words of `text` with normalize()'s character rule; dots split words."""
+    text = text.lower()
+    if text.isascii():
+        return text.translate(_CANONICAL_TABLE).split()
+    return _NAME_CHARS.sub('', text).replace('.', ' ').split()
+
+
+def _base_tokens(text: str) -> List[str]:
+    """Rank aliases and synonyms applied; a one-letter genus is left for abbreviation expansion."""
+    words = _raw_tokens(text)
+    tokens = words[:1]
+    i = 1
+    while i < len(words):
+        word = words[i]
+        if word == "f" and i + 1 < len(words) and words[i + 1] == "sp":
+            tokens += ["forma", "specialis"]
+            i += 2
+            continue
+        tokens.append(RANK_ALIASES.get(word, word))
+        i += 1
+    synonym = SCIENTIFIC_SYNONYMS.get(" ".join(tokens[:2]))
+    if synonym:
+        tokens[:2] = synonym.split()
+    return tokens
+
+
+class NameCanonicalizer:
+    """
+    Raw scientific name -> canonical form: lowercase words, rank variants spelled out
+    ("spp." / "sp." -> species, "ssp." -> subspecies, "f. sp." -> forma specialis),
+    outdated binomials replaced by current ones, and an abbreviated genus expanded when
+    the epithet identifies it ("P. infestans" -> "phytophthora infestans").
+    - load() runs once per catalog load: catalog names are canonicalized and pinned, and
+      their genera join the abbreviation table, so query-time catalog lookups are dict hits
+    - Other strings (queries) go through a bounded LRU of CANONICAL_CACHE_SIZE entries
+    - Canonical strings and tokens are interned, so a large catalog shares one copy
+    """
+
+    def __init__(self, cache_size: int = CANONICAL_CACHE_SIZE):
+        self._pinned: Dict[str, CanonicalName] = {}
+        self._genera: Dict[Tuple[str, str], Optional[str]] = self._learn_genera(_base_tokens(name) for name in KNOWN_BINOMIALS)
+        self._cached = lru_cache(maxsize=cache_size)(self._compute)
+
+    @staticmethod
+    def _learn_genera(token_lists: Iterable[List[str]], genera: Dict[Tuple[str, str], Optional[str]] = None):
+        """(genus initial, epithet) -> genus; None where two genera share the key (ambiguous)."""
+        genera = dict(genera or {})
+        for tokens in token_lists:
+            if len(tokens) < 2 or len(tokens[0]) < 2 or tokens[1] in RANK_WORDS:
+                continue
+            key = (tokens[0][0], tokens[1])
+            if genera.get(key, tokens[0]) != tokens[0]:
+                genera[key] = None
+            else:
+                genera[key] = tokens[0]
+        return genera
+
+    def _finish(self, tokens: List[str], genera: Dict[Tuple[str, str], Optional[str]]) -> CanonicalName:
+        if len(tokens) >= 2 and len(tokens[0]) == 1:
+            genus = genera.get((tokens[0], tokens[1]))
+            if genus:
+                tokens = [genus] + tokens[1:]
+        tokens = [sys.intern(token) for token in tokens]
+        return sys.intern(" ".join(tokens)), tuple(token for token in tokens if token not in RANK_WORDS)
+
+    def _compute(self, text: str) -> CanonicalName:
+        return self._finish(_base_tokens(text), self._genera)
+
+    def load(self, names: Iterable[str]):
+        """Pin canonical forms for a new catalog's names and relearn genus abbreviations."""
+        base = {name: _base_tokens(name) for name in set(names) if isinstance(name, str)}
+        genera = self._learn_genera(base.values(), self._learn_genera(_base_tokens(name) for name in KNOWN_BINOMIALS))
+        pinned: Dict[str, CanonicalName] = {}
+        for name, tokens in base.items():
+            canonical = self._finish(tokens, genera)
+            pinned[name] = canonical
+            pinned.setdefault(canonical[0], canonical)
+        self._pinned, self._genera = pinned, genera
+        # Cached query forms may depend on the previous catalog's genera
+        self._cached.cache_clear()
+
+    def get(self, text: str) -> CanonicalName:
+        if not isinstance(text, str):
+            return "", ()
+        canonical = self._pinned.get(text)
+        return canonical if canonical is not None else self._cached(text)
+
+    def stats(self) -> dict:
+        info = self._cached.cache_info()
+        return {"pinned": len(self._pinned), "cached": info.currsize, "hits": info.hits, "misses": info.misses}
+
+
+canonical_names = NameCanonicalizer()
+
+
+def canonicalize(text: str) -> str:
+    """Canonical scientific name used for matching (see NameCanonicalizer)."""
+    return canonical_names.get(text)[0]
+
+
+def canonical_tokens(text: str) -> Tuple[str, ...]:
+    """Matching tokens of the canonical name: genus, epithet, infraspecific names (no rank words)."""
+    return canonical_names.get(text)[1]
+
+
 def tokenize_scientific_name(name: str) -> List[str]:
     """
     Break scientific name into meaningful parts for better matching:
@@ -38,8 +208,7 @@ def tokenize_scientific_name(name: str) -> List[str]:
     - Species
     - Subspecies/Variety
     """
-    tokens = normalize(name).split()
-    return [t for t in tokens if t and t not in ('species', 'variety', 'subspecies')]
+    return list(canonical_tokens(name))
 
 @lru_cache(maxsize=1024)
 def fuzzy_lookup(query: str, choices: Tuple[str, ...], score_cutoff: int = 60) -> List[Tuple[str, int, int]]:
@@ -54,13 +223,14 @@ def fuzzy_lookup(query: str, choices: Tuple[str, ...], score_cutoff: int = 60) -
         return []
     
     matches = []
-    query_tokens = set(tokenize_scientific_name(query))
+    query_tokens = set(canonical_tokens(query))
     
     for idx, choice in enumerate(choices):
-        choice_tokens = set(tokenize_scientific_name(choice))
+        choice_tokens = set(canonical_tokens(choice))
         
         # Calculate different types of matches
-        token_ratio = len(query_tokens & choice_tokens) / max(len(query_tokens), len(choice_tokens))
+        longest = max(len(query_tokens), len(choice_tokens))
+        token_ratio = len(query_tokens & choice_tokens) / longest if longest else 0.0
         fuzzy_ratio = fuzz.WRatio(query, choice) / 100
         
         # Weight exact token matches higher
@@ -70,4 +240,42 @@ def fuzzy_lookup(query: str, choices: Tuple[str, ...], score_cutoff: int = 60) -
             matches.append((choice, int(combined_score), idx))
     
     # Sort by score descending
-    return sorted(matches, key=lambda x: x[1], reverse=True)
\ No newline at end of file
+    return sorted(matches, key=lambda x: x[1], reverse=True)
+
+def score_matrix(queries: Sequence[str], choices: Sequence[str], score_cutoff: int = 60) -> np.ndarray:
+    """
+    Vectorized fuzzy_lookup: scores[i, j] is the score fuzzy_lookup(queries[i], (choices[j],))
+    would report, or -1 where it would be filtered out by `score_cutoff`.
+    - Token overlap via a query x choice token-incidence product over the query tokens
+      only (a choice token no query has adds nothing), so memory is choices x query
+      vocabulary rather than choices x catalog vocabulary
+    - WRatio via rapidfuzz.process.cdist
+    """
+    scores = np.full((len(queries), len(choices)), -1, dtype=np.int32)
+    if not len(queries) or not len(choices):
+        return scores
+
+    query_tokens = [set(canonical_tokens(q)) for q in queries]
+    choice_tokens = [set(canonical_tokens(c)) for c in choices]
+    vocabulary = {token: i for i, token in enumerate(set().union(*query_tokens))}
+
+    def incidence(token_sets):
+        matrix = np.zeros((len(token_sets), max(len(vocabulary), 1)), dtype=np.float32)
+        for row, tokens in enumerate(token_sets):
+            matrix[row, [vocabulary[t] for t in tokens if t in vocabulary]] = 1
+        return matrix
+
+    overlap = (incidence(query_tokens) @ incidence(choice_tokens).T).astype(np.float64)
+    query_len = np.array([len(t) for t in query_tokens], dtype=np.float64)[:, None]
+    choice_len = np.array([len(t) for t in choice_tokens], dtype=np.float64)[None, :]
+    longest = np.maximum(query_len, choice_len)
+    token_ratio = np.divide(overlap, longest, out=np.zeros_like(overlap), where=longest > 0)
+
+    fuzzy_ratio = process.cdist(queries, choices, scorer=fuzz.WRatio, dtype=np.float64) / 100
+
+    combined = (token_ratio * 0.7 + fuzzy_ratio * 0.3) * 100
+    valid = combined >= score_cutoff
+    # Empty queries never match, same as fuzzy_lookup
+    valid &= np.array([bool(q) for q in queries])[:, None]
+    scores[valid] = combined[valid].astype(np.int32)
+    return scores
@@ -0,0 +1,224 @@
+import time
+import asyncio
+import functools
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Latency buckets (seconds): sub-ms cache hits up to multi-second upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60)
+
+# Set only while a request is being profiled: histogram observations are also
+# appended here as (label, seconds), so the profile carries that request's stage timings
+request_stages: ContextVar[Optional[list]] = ContextVar("request_stages", default=None)
+
+
+class _Metric:
+    """Base for a named metric family; children are per label-value tuple, created on first use."""
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _new_child(self, values: Tuple[str, ...]):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child(values))
+        return child
+
+    def _label_text(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{self._label_text(values)} {child.value}"]
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self, values: Tuple[str, ...]):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """
+    Settable gauge, or a callback gauge (`fn`) read only at scrape time, which costs
+    the hot path nothing (used for queue depths the owning object already tracks).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), fn: Optional[Callable[[], float]] = None):
+        self.fn = fn
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self, values: Tuple[str, ...]):
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def render(self) -> List[str]:
+        if self.fn is None:
+            return super().render()
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {float(self.fn())}"]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "label", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...], label: str = ""):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.label = label
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        idx = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+        stages = request_stages.get()
+        if stages is not None:
+            stages.append((self.label, value))
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self, values: Tuple[str, ...]):
+        return _HistogramChild(self.buckets, "/".join(values))
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child: _HistogramChild) -> List[str]:
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            le = self._label_text(values, 'le="%s"' % bound)
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        cumulative += counts[-1]
+        le = self._label_text(values, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{le} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {total}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Shared instruments for the request pipeline
+STAGE_SECONDS = Histogram("plant_api_stage_seconds", "Latency of one pipeline stage", ("stage",))
+CACHE_EVENTS = Counter("plant_api_cache_events_total", "Cache lookups by cache and outcome", ("cache", "result"))
+UPSTREAM_ERRORS = Counter("plant_api_upstream_errors_total", "Failed upstream analysis calls by kind", ("kind",))
+ANALYSES = Counter("plant_api_analyses_total", "Completed analyses by result source", ("source",))
+ADMISSION_ADMITTED = Counter("plant_api_admission_admitted_total", "/analyze requests admitted")
+ADMISSION_SHED = Counter("plant_api_admission_shed_total", "/analyze requests rejected before their body was read, by reason", ("reason",))
+
+
+def timed(stage: str):
+    """Decorator recording a sync or async function's wall time under STAGE_SECONDS{stage}."""
+    child = STAGE_SECONDS.labels(stage)
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with child.time():
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with child.time():
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition (format 0.0.4) of every registered metric."""
+    return REGISTRY.render()
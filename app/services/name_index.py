@@ -0,0 +1,136 @@
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+from rapidfuzz import process, fuzz
+from app.services.match_utils import normalize
+
+# Sorts after any character normalize() can produce
+_PREFIX_END = "\uffff"
+
+
+class TypeaheadIndex:
+    """
+    Sorted-array prefix index over distinct normalized names.
+    - Every word start is indexed ("phytophthora infestans" is found by "phy" and "inf")
+    - prefix() is two bisects + a slice: O(log n) to find the matches, plus a pass over
+      them to count distinct names (a name can match at several word starts)
+    - fuzzy() is the typo fallback (rapidfuzz over the distinct names)
+    """
+
+    def __init__(self, names: Iterable[str]):
+        display: Dict[str, str] = {}
+        for name in names:
+            key = normalize(name)
+            if key and key not in display:
+                display[key] = name.strip()
+
+        self.names: List[str] = list(display)
+        self.display: List[str] = [display[key] for key in self.names]
+
+        word_starts: List[Tuple[str, int]] = []
+        for name_id, key in enumerate(self.names):
+            tokens = key.split(" ")
+            for i in range(len(tokens)):
+                word_starts.append((" ".join(tokens[i:]), name_id))
+        word_starts.sort()
+        self._keys = [key for key, _ in word_starts]
+        self._ids = [name_id for _, name_id in word_starts]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def prefix(self, query: str, limit: int = 10, offset: int = 0) -> Tuple[int, List[Tuple[str, str]]]:
+        """(number of distinct matching names, [(matched key, display name)] for this page)"""
+        query = normalize(query)
+        if not query:
+            return 0, []
+        lo = bisect_left(self._keys, query)
+        hi = bisect_left(self._keys, query + _PREFIX_END, lo)
+
+        page, seen, skipped = [], set(), 0
+        for i in range(lo, hi):
+            name_id = self._ids[i]
+            if name_id in seen:
+                continue
+            seen.add(name_id)
+            if skipped < offset:
+                skipped += 1
+                continue
+            page.append((self._keys[i], self.display[name_id]))
+            if len(page) >= limit:
+                break
+        return len(set(self._ids[lo:hi])), page
+
+    def fuzzy(self, query: str, limit: int = 10, offset: int = 0, score_cutoff: int = 70) -> Tuple[int, List[Tuple[float, str]]]:
+        """
+        Typo-tolerant fallback: [(score, display name)], best WRatio matches first.
+        Scores names sharing a word starting with the query's first two letters (typos
+        rarely hit those); only scans every name when that bucket has no match.
+        """
+        query = normalize(query)
+        if not query or not self.names:
+            return 0, []
+
+        lo = bisect_left(self._keys, query[:2])
+        hi = bisect_left(self._keys, query[:2] + _PREFIX_END, lo)
+        candidate_ids = list(dict.fromkeys(self._ids[lo:hi]))
+
+        matches = []
+        if candidate_ids:
+            candidates = [self.names[name_id] for name_id in candidate_ids]
+            matches = [
+                (score, candidate_ids[idx])
+                for _, score, idx in process.extract(query, candidates, scorer=fuzz.WRatio, limit=offset + limit, score_cutoff=score_cutoff)
+            ]
+        if not matches:
+            matches = [
+                (score, idx)
+                for _, score, idx in process.extract(query, self.names, scorer=fuzz.WRatio, limit=offset + limit, score_cutoff=score_cutoff)
+            ]
+        return len(matches), [(score, self.display[name_id]) for score, name_id in matches[offset:offset + limit]]
+
+
+class SubstringIndex:
+    """
+    Trigram index for case-insensitive substring search (in-memory ILIKE '%q%').
+    - Distinct lowercased names -> trigram posting lists
+    - Queries of 3+ chars intersect postings, then verify with `in`; shorter ones scan distinct names
+    - Each distinct name maps back to its row positions, so results keep catalog order
+    """
+
+    def __init__(self, values: List[str]):
+        name_ids: Dict[str, int] = {}
+        self.rows: List[List[int]] = []
+        for row, value in enumerate(values):
+            key = (value or "").lower()
+            if not key:
+                continue
+            name_id = name_ids.setdefault(key, len(name_ids))
+            if name_id == len(self.rows):
+                self.rows.append([])
+            self.rows[name_id].append(row)
+        self.names: List[str] = list(name_ids)
+
+        self._postings: Dict[str, set] = {}
+        for name_id, name in enumerate(self.names):
+            for gram in self._trigrams(name):
+                self._postings.setdefault(gram, set()).add(name_id)
+
+    @staticmethod
+    def _trigrams(text: str) -> set:
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def search(self, query: str) -> List[int]:
+        """Row positions whose value contains `query` (case-insensitive), in row order."""
+        query = query.lower()
+        if not query:
+            return []
+
+        if len(query) < 3:
+            candidates = range(len(self.names))
+        else:
+            postings = sorted((self._postings.get(gram, set()) for gram in self._trigrams(query)), key=len)
+            candidates = set.intersection(*postings) if postings[0] else set()
+
+        rows = [row for name_id in candidates if query in self.names[name_id] for row in self.rows[name_id]]
+        rows.sort()
+        return rows
@@ -1,30 +1,129 @@
+import time
 import logging
+import numpy as np
 from sqlalchemy import text
 from app.config.db import engine
-from typing import List, Dict, Any
+from app.services.match_utils import canonicalize, canonical_names
+from app.services.name_index import TypeaheadIndex, SubstringIndex
+from app.services.metrics import timed
+from typing import List, Dict, Any, Tuple
 
 logger = logging.getLogger(__name__)
 
 PRODUCT_CACHE: List[Dict[str, Any]] = []
+# (product, canonical disease scientific name, canonical plant scientific name)
+PRODUCT_INDEX: List[Tuple[Dict[str, Any], str, str]] = []
 
+
+def build_product_index(products: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], str, str]]:
+    """Canonicalize catalog names once per load so searches don't re-normalize every row."""
+    canonical_names.load(
+        name for product in products for name in (product.get('disease_scientific_name'), product.get('scientific_name'))
+    )
+    return [
+        (product, canonicalize(product['disease_scientific_name']), canonicalize(product['scientific_name']))
+        for product in products
+        if product.get('disease_scientific_name') and product.get('scientific_name')
+    ]
+
+class NameMatrixIndex:
+    """
+    Distinct normalized disease/plant names plus each product's position in them,
+    so batch searches score every query against each distinct name only once.
+    """
+
+    def __init__(self, product_index: List[Tuple[Dict[str, Any], str, str]]):
+        self.products = [product for product, _, _ in product_index]
+        self.disease_names, self.disease_pos = self._factorize([disease for _, disease, _ in product_index])
+        self.plant_names, self.plant_pos = self._factorize([plant for _, _, plant in product_index])
+
+    @staticmethod
+    def _factorize(values: List[str]) -> Tuple[List[str], np.ndarray]:
+        positions: Dict[str, int] = {}
+        codes = np.fromiter((positions.setdefault(v, len(positions)) for v in values), dtype=np.int64, count=len(values))
+        return list(positions), codes
+
+
+NAME_MATRIX_INDEX = NameMatrixIndex([])
+# Prefix/typeahead indexes over distinct plant and disease scientific names
+TYPEAHEAD_INDEXES: Dict[str, TypeaheadIndex] = {"plant": TypeaheadIndex([]), "disease": TypeaheadIndex([])}
+# Substring index over common disease names (positions into PRODUCT_CACHE)
+DISEASE_SUBSTRING_INDEX = SubstringIndex([])
+# Bumped on every rebuild; response caches key on it
+CATALOG_VERSION = 0
+# Counts computed once per rebuild, so /health and startup never query the table
+CATALOG_STATS: Dict[str, Any] = {}
+
+
+def compute_catalog_stats(products: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Same numbers as COUNT / COUNT(DISTINCT) over the products table (NULLs not counted)."""
+    return {
+        "total_products": len(products),
+        "unique_diseases": len({p['disease_scientific_name'] for p in products if p.get('disease_scientific_name') is not None}),
+        "unique_plants": len({p['scientific_name'] for p in products if p.get('scientific_name') is not None}),
+    }
+
+
+def rebuild_indexes(products: List[Dict[str, Any]]):
+    """Recompute every derived search structure for a new catalog snapshot."""
+    global PRODUCT_CACHE, PRODUCT_INDEX, NAME_MATRIX_INDEX, TYPEAHEAD_INDEXES, DISEASE_SUBSTRING_INDEX, CATALOG_VERSION, CATALOG_STATS
+    PRODUCT_CACHE = products
+    PRODUCT_INDEX = build_product_index(products)
+    NAME_MATRIX_INDEX = NameMatrixIndex(PRODUCT_INDEX)
+    TYPEAHEAD_INDEXES = {
+        "plant": TypeaheadIndex(p['scientific_name'] for p in products if p.get('scientific_name')),
+        "disease": TypeaheadIndex(p['disease_scientific_name'] for p in products if p.get('disease_scientific_name')),
+    }
+    DISEASE_SUBSTRING_INDEX = SubstringIndex([p.get('disease') or "" for p in products])
+    CATALOG_VERSION += 1
+    CATALOG_STATS = {**compute_catalog_stats(products), "generation": CATALOG_VERSION, "loaded_at": time.time()}
+
+
+@timed("catalog_load")
 def load_products_into_cache():
     """
     Loads all products from the database into an in-memory list.
     """
-    global PRODUCT_CACHE
     logger.info("Initializing product cache...")
+    started = time.perf_counter()
     try:
         from app.models.product_model import Product
         from sqlalchemy.orm import Session
 
         with Session(engine) as session:
             products = session.query(Product).all()
-            PRODUCT_CACHE = [product.to_dict() for product in products]
+            rebuild_indexes([product.to_dict() for product in products])
             logger.info(f"Successfully loaded {len(PRODUCT_CACHE)} products into in-memory cache.")
     except Exception as e:
         logger.critical(f"Failed to load products into cache. Search will not work. Error: {e}", exc_info=True)
-        PRODUCT_CACHE = []
+        rebuild_indexes([])
+    CATALOG_STATS["load_seconds"] = round(time.perf_counter() - started, 3)
 
 def get_cached_products() -> List[Dict[str, Any]]:
     """Returns the cached list of products."""
-    return PRODUCT_CACHE
\ No newline at end of file
+    return PRODUCT_CACHE
+
+def get_catalog_version() -> int:
+    """Returns the version of the current catalog snapshot."""
+    return CATALOG_VERSION
+
+def get_catalog_stats() -> Dict[str, Any]:
+    """Returns catalog counts, generation and load time for the current snapshot."""
+    return CATALOG_STATS
+
+def get_product_index() -> List[Tuple[Dict[str, Any], str, str]]:
+    """Returns the canonical search index over the cached products."""
+    return PRODUCT_INDEX
+
+def get_name_matrix_index() -> NameMatrixIndex:
+    """Returns the distinct-name index used for batch (matrix) searches."""
+    return NAME_MATRIX_INDEX
+
+def get_typeahead_index(field: str) -> TypeaheadIndex:
+    """Returns the typeahead index for "plant" or "disease" scientific names."""
+    return TYPEAHEAD_INDEXES[field]
+
+def find_products_by_disease(disease_name: str) -> List[Dict[str, Any]]:
+    """Cached products whose common disease name contains `disease_name` (case-insensitive)."""
+    products = PRODUCT_CACHE
+    return [products[row] for row in DISEASE_SUBSTRING_INDEX.search(disease_name)]
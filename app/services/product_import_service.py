@@ -6,8 +6,8 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 from app.models.product_model import Product
 from typing import Dict, Any
+from app.config.logging_config import should_trace
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ProductImportService:
@@ -47,14 +47,15 @@ class ProductImportService:
                 session.execute(text("DELETE FROM products"))
                 logger.info("Cleared existing products from database")
 
+                # Per-row trace only for a sampled fraction of imports, and only at DEBUG
+                trace = should_trace(logger)
+
                 # Prepare products for insertion
                 products_to_insert = []
                 for idx, row in df.iterrows():
-                    # Debug print the raw row data
-                    logger.info(f"\nProcessing row {idx + 1}:")
-                    for col in df.columns:
-                        logger.info(f"{col}: {row[col]}")
-                    
+                    if trace:
+                        logger.debug("Processing row %d", idx + 1, extra={"row": {col: row[col] for col in df.columns}})
+
                     product = {
                         "product_name": str(row['Product Name']).strip() if pd.notna(row['Product Name']) else '',
                         "scientific_name": str(row['Scientific Plant Name']).strip() if pd.notna(row['Scientific Plant Name']) else '',
@@ -64,13 +65,10 @@ class ProductImportService:
                         "how_to_use": str(row['How to use']).strip() if pd.notna(row['How to use']) else '',
                     }
                     
-                    # Debug print the processed product data
-                    logger.info(f"Processed product data:")
-                    for key, value in product.items():
-                        logger.info(f"{key}: {value}")
-                    
+                    if trace:
+                        logger.debug("Processed product data", extra={"product": product})
+
                     products_to_insert.append(product)
-                    logger.info(f"Added product {len(products_to_insert)} to insert list\n")
 
                 if products_to_insert:
                     logger.info(f"Inserting {len(products_to_insert)} products...")
@@ -101,6 +99,7 @@ class ProductImportService:
 
     @staticmethod
     def get_product_stats(engine) -> Dict[str, Any]:
+        """Catalog counts straight from the DB; only used by the deep health probe."""
         try:
             with engine.connect() as conn:
                 total = conn.execute(text("SELECT COUNT(id) FROM products")).scalar_one_or_none()
@@ -110,15 +109,3 @@ class ProductImportService:
         except Exception as e:
             logger.error(f"Could not retrieve product stats: {e}", exc_info=True)
             return {}
-
-    @staticmethod
-    def get_product_stats(engine) -> Dict[str, Any]:
-        try:
-            with engine.connect() as conn:
-                total = conn.execute(text("SELECT COUNT(id) FROM products")).scalar_one_or_none()
-                unique_diseases = conn.execute(text("SELECT COUNT(DISTINCT disease_scientific_name) FROM products")).scalar_one_or_none()
-                unique_plants = conn.execute(text("SELECT COUNT(DISTINCT scientific_name) FROM products")).scalar_one_or_none()
-                return {"total_products": total or 0, "unique_diseases": unique_diseases or 0, "unique_plants": unique_plants or 0}
-        except Exception as e:
-            logger.error(f"Could not retrieve product stats: {e}", exc_info=True)
-            return {}
\ No newline at end of file
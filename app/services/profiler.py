@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import hmac
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+from app.services.metrics import request_stages
+
+logger = logging.getLogger(__name__)
+
+# Requests carrying X-Profile-Token: <PROFILE_TOKEN> are profiled (unset = header trigger off)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+# Fraction of matching requests profiled without the header (0 = off)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/plant_api_profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 50))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", 0.005))
+PROFILE_PATH_PREFIXES = tuple(p.strip() for p in os.getenv("PROFILE_PATH_PREFIXES", "/analyze,/products/search").split(",") if p.strip())
+
+PROFILE_HEADER = b"x-profile-token"
+# Leaf frames in these modules are threads parked waiting for work, not doing it
+_IDLE_MODULES = ("threading.py", "selectors.py", "queue.py", os.path.join("futures", "thread.py"))
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+def token_matches(token: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler: a background thread snapshots every thread's stack
+    each `interval` seconds and counts collapsed stacks (flamegraph / speedscope
+    "folded" format). Unlike cProfile it sees work offloaded with asyncio.to_thread.
+    Samples are process-wide, so concurrent requests show up in the same profile.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or frame.f_code.co_filename.endswith(_IDLE_MODULES):
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfileStore:
+    """Rotating directory of <id>.folded + <id>.json pairs; only the newest `keep` are kept."""
+
+    def __init__(self, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+
+    def save(self, profile_id: str, folded: str, meta: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{profile_id}.folded"), "w") as f:
+            f.write(folded)
+        with open(os.path.join(self.directory, f"{profile_id}.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        self.rotate()
+
+    def rotate(self):
+        for profile_id in self.list_ids()[self.keep:]:
+            for ext in (".folded", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + ext))
+                except FileNotFoundError:
+                    pass
+
+    def list_ids(self) -> List[str]:
+        """Profile ids, newest first (ids start with a sortable timestamp)."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name[:-5] for name in os.listdir(self.directory) if name.endswith(".json")), reverse=True)
+
+    def list(self) -> List[dict]:
+        profiles = []
+        for profile_id in self.list_ids():
+            try:
+                with open(os.path.join(self.directory, f"{profile_id}.json")) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def path(self, filename: str) -> Optional[str]:
+        """Absolute path of a stored profile file, or None (also rejects path traversal)."""
+        if os.path.basename(filename) != filename or not filename.endswith((".folded", ".json")):
+            return None
+        path = os.path.join(self.directory, filename)
+        return path if os.path.isfile(path) else None
+
+
+profile_store = ProfileStore()
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling selected requests (privileged header or sampling rate).
+    Only installed when profiling is configured, so it costs nothing otherwise. One
+    profile runs at a time; requests arriving meanwhile just run unprofiled.
+    """
+
+    def __init__(self, app, store: ProfileStore = profile_store, path_prefixes: Tuple[str, ...] = PROFILE_PATH_PREFIXES,
+                 sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.store = store
+        self.path_prefixes = path_prefixes
+        self.sample_rate = sample_rate
+        self._busy = threading.Lock()
+
+    def _wanted(self, scope) -> bool:
+        if not scope["path"].startswith(self.path_prefixes):
+            return False
+        headers = dict(scope.get("headers") or [])
+        token = headers.get(PROFILE_HEADER)
+        if token is not None and token_matches(token.decode("latin-1")):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope) or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{uuid4().hex[:8]}"
+        status = {"code": None}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", []).append((b"x-profile-id", profile_id.encode()))
+            await send(message)
+
+        stages: List[Tuple[str, float]] = []
+        stages_token = request_stages.set(stages)
+        sampler = StackSampler()
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            sampler.stop()
+            request_stages.reset(stages_token)
+            self._busy.release()
+
+            stage_totals: Dict[str, float] = {}
+            for stage, seconds in stages:
+                stage_totals[stage] = round(stage_totals.get(stage, 0.0) + seconds, 6)
+            meta = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status["code"],
+                "duration_seconds": round(duration, 6),
+                "stages": stage_totals,
+                "samples": sum(sampler.samples.values()),
+                "interval_seconds": sampler.interval,
+                "created_at": time.time(),
+            }
+            try:
+                await asyncio.to_thread(self.store.save, profile_id, sampler.folded(), meta)
+            except Exception as e:
+                logger.error(f"Failed to write profile {profile_id}: {e}")
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from app.services.metrics import CACHE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical work: callers with the same key share one in-flight task.
+    - The work runs in its own task, so the leading caller disconnecting doesn't cancel it
+      for the others (each waiter awaits through asyncio.shield)
+    - Once every waiter has gone away, the shared task is cancelled
+    - Results are shared by reference; callers that mutate them must copy
+    - `on_done` (used only when the caller leads) runs once the shared task has
+      finished, however it ends: the place to release what the leader lent to it
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.abandoned = 0
+        self._leader_events = CACHE_EVENTS.labels(f"{name}_single_flight", "leader")
+        self._coalesced_events = CACHE_EVENTS.labels(f"{name}_single_flight", "coalesced")
+
+    async def do(self, key: Hashable, make_coro: Callable[[], Awaitable[Any]],
+                 on_done: Optional[Callable[[], None]] = None) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(make_coro()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._forget(key, task))
+            if on_done is not None:
+                flight.task.add_done_callback(lambda task: on_done())
+            self.leaders += 1
+            self._leader_events.inc()
+        else:
+            self.coalesced += 1
+            self._coalesced_events.inc()
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller disconnected: nobody wants the result any more
+                flight.task.cancel()
+                self.abandoned += 1
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        flight = self._flights.get(key)
+        if flight is not None and flight.task is task:
+            del self._flights[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"{self.name} single-flight task failed: {task.exception()}")
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
@@ -0,0 +1,214 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Whole analysis stage must finish within this many seconds
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", 25))
+# Fire a hedged second call once the first exceeds this latency percentile...
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 0.9))
+# ...or this delay while there are too few samples for a percentile
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", 8))
+HEDGE_MIN_SAMPLES = 20
+
+# Circuit breaker: trip after BREAKER_ERROR_RATE failures over the last BREAKER_WINDOW calls
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", 20))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 10))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("BREAKER_COOLDOWN_SECONDS", 30))
+
+
+class LatencyWindow:
+    """Rolling window of recent successful upstream latencies (seconds)."""
+
+    def __init__(self, maxlen: int = 200):
+        self._samples = deque(maxlen=maxlen)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self._samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    closed -> open when the recent error rate spikes; open -> half_open after a cooldown.
+    While open, callers skip the upstream entirely (local-only mode). In half_open exactly
+    one caller is let through as a probe: its success closes the breaker, its failure
+    re-opens it (counted as a trip). A probe that never reports back stops blocking
+    new probes after `probe_timeout`.
+    """
+
+    def __init__(self, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 error_rate: float = BREAKER_ERROR_RATE, cooldown: float = BREAKER_COOLDOWN_SECONDS,
+                 probe_timeout: float = ANALYSIS_DEADLINE_SECONDS):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.time() - self._opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "open":
+                return False
+            now = time.time()
+            if self._probing and now - self._probe_started < self.probe_timeout:
+                return False
+            self._probing = True
+            self._probe_started = now
+            return True
+
+    def record(self, ok: bool):
+        with self._lock:
+            if self._opened_at is not None:
+                if not self._probing:
+                    # Late outcome of a call let through before the breaker opened
+                    return
+                # half-open probe decides: success closes, failure re-opens
+                self._probing = False
+                if ok:
+                    self._opened_at = None
+                    self._outcomes.clear()
+                    logger.info("Upstream circuit breaker CLOSED (probe succeeded)")
+                else:
+                    self._opened_at = time.time()
+                    self.trips += 1
+                    logger.warning("Upstream circuit breaker re-OPENED (probe failed)")
+                return
+
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+                self._opened_at = time.time()
+                self.trips += 1
+                logger.warning(f"Upstream circuit breaker OPEN ({failures}/{len(self._outcomes)} recent calls failed)")
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": self._outcomes.count(False),
+            "probing": self._probing,
+            "trips": self.trips,
+        }
+
+
+class HedgedCall:
+    """
+    Deadline-bounded call with one hedge:
+    - starts the primary call
+    - if it hasn't returned after the latency-percentile threshold (or fails), fires one hedge,
+      provided the breaker still allows a call (it may have opened meanwhile)
+    - first successful response wins, the loser is cancelled
+    - the breaker gets one outcome per run(), not one per attempt
+    """
+
+    def __init__(self, latencies: LatencyWindow, breaker: CircuitBreaker,
+                 percentile: float = HEDGE_PERCENTILE, default_delay: float = HEDGE_DEFAULT_DELAY):
+        self.latencies = latencies
+        self.breaker = breaker
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.hedges_skipped = 0
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return self.default_delay
+        return self.latencies.percentile(self.percentile)
+
+    async def _timed(self, make_call: Callable[[], Awaitable[Any]]):
+        started = time.time()
+        result = await make_call()
+        self.latencies.add(time.time() - started)
+        return result
+
+    async def run(self, make_call: Callable[[], Awaitable[Any]], deadline: float = ANALYSIS_DEADLINE_SECONDS) -> tuple[Any, dict]:
+        """Returns (result, info) or raises the last error / asyncio.TimeoutError."""
+        expires = time.monotonic() + deadline
+        tasks = {asyncio.create_task(self._timed(make_call)): "primary"}
+        hedge_decided = False
+        hedged = False
+        last_error = None
+
+        try:
+            while tasks:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    break
+                timeout = remaining if hedge_decided else min(remaining, self.hedge_delay())
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    name = tasks.pop(task)
+                    if task.exception() is None:
+                        self.breaker.record(True)
+                        if name == "hedge":
+                            self.hedges_won += 1
+                        return task.result(), {"hedged": hedged, "winner": name}
+                    last_error = task.exception()
+                    logger.warning(f"Upstream {name} call failed: {last_error}")
+
+                # Slow or failed primary: fire the single hedge, unless the breaker has
+                # opened meanwhile (or this call is the half-open probe)
+                if not hedge_decided:
+                    hedge_decided = True
+                    if self.breaker.allow():
+                        hedged = True
+                        self.hedges_fired += 1
+                        tasks[asyncio.create_task(self._timed(make_call))] = "hedge"
+                    else:
+                        self.hedges_skipped += 1
+
+            self.breaker.record(False)
+            if last_error is not None and not tasks:
+                raise last_error
+            raise asyncio.TimeoutError(f"Upstream analysis exceeded {deadline:.0f}s deadline")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "hedge_delay_seconds": round(self.hedge_delay(), 2),
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "hedges_skipped": self.hedges_skipped,
+            "latency_p50": round(self.latencies.percentile(0.5), 2),
+            "latency_p90": round(self.latencies.percentile(0.9), 2),
+        }
+
+
+upstream_latencies = LatencyWindow()
+upstream_breaker = CircuitBreaker()
+upstream_hedge = HedgedCall(upstream_latencies, upstream_breaker)
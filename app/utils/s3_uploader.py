@@ -1,16 +1,57 @@
 import boto3
 import os
+import shutil
+import asyncio
+from typing import BinaryIO, Union
 from botocore.exceptions import NoCredentialsError
 from fastapi import HTTPException
 
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    region_name=os.getenv("AWS_REGION"),
-)
+# "s3" (default) or "local": write objects under LOCAL_STORAGE_DIR instead (offline/dev/load tests)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3").lower()
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "local_storage")
+# Base URL stored for local objects; defaults to a file:// URL of LOCAL_STORAGE_DIR
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", "")
+
+def create_s3_client():
+    """(Re)build the boto3 client; boto3 clients must not cross a fork, so workers call this."""
+    global s3_client
+    s3_client = boto3.client(
+        "s3",
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region_name=os.getenv("AWS_REGION"),
+    )
+
+create_s3_client()
+
+def object_url(filename: str) -> str:
+    """URL an uploaded object will be reachable at, for the configured backend."""
+    if STORAGE_BACKEND == "local":
+        base = LOCAL_STORAGE_URL or f"file://{os.path.abspath(LOCAL_STORAGE_DIR)}"
+        return f"{base.rstrip('/')}/{filename}"
+    return f"https://{os.getenv('AWS_BUCKET_NAME')}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{filename}"
+
+def _write_local(file_bytes: Union[bytes, BinaryIO], filename: str):
+    root = os.path.realpath(LOCAL_STORAGE_DIR)
+    path = os.path.realpath(os.path.join(root, filename))
+    # Object keys must stay inside the storage directory (no "..", absolute paths or symlinks out)
+    if os.path.commonpath([root, path]) != root or path == root:
+        raise OSError(f"Object key escapes LOCAL_STORAGE_DIR: {filename!r}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        if isinstance(file_bytes, (bytes, bytearray)):
+            f.write(file_bytes)
+        else:
+            shutil.copyfileobj(file_bytes, f)
+
+async def upload_to_s3(file_bytes: Union[bytes, BinaryIO], filename: str, content_type: str) -> str:
+    if STORAGE_BACKEND == "local":
+        try:
+            await asyncio.to_thread(_write_local, file_bytes, filename)
+            return object_url(filename)
+        except OSError as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
-async def upload_to_s3(file_bytes: bytes, filename: str, content_type: str) -> str:
     bucket_name = os.getenv("AWS_BUCKET_NAME")
 
     try:
@@ -20,8 +61,8 @@ async def upload_to_s3(file_bytes: bytes, filename: str, content_type: str) -> s
             Body=file_bytes,
             ContentType=content_type,
         )
-        return f"https://{bucket_name}.s3.{os.getenv('AWS_REGION')}.amazonaws.com/{filename}"
+        return object_url(filename)
     except NoCredentialsError:
         raise HTTPException(status_code=500, detail="AWS credentials not found")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,299 @@
+import os
+import json
+import hashlib
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", 10 * 1024 * 1024))
+# Uploads above this size are spooled to a temp file instead of living in RAM
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Magic bytes -> MIME type for the formats /analyze accepts
+_SNIFF_BYTES = 12
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Detect the real image format from its first bytes (ignores client content_type)."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+# Sniffed MIME type -> file extension for stored objects
+IMAGE_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
+
+
+class SpooledImage:
+    """
+    Uploaded image held in a SpooledTemporaryFile.
+    Small images stay in memory, large ones roll over to disk.
+    Reference counted: every retain() needs its own close(); the file is closed by the last.
+    """
+
+    def __init__(self, file, size: int, content_type: str, filename: str):
+        self.file = file
+        self.size = size
+        self.content_type = content_type
+        self.filename = filename
+        self._digest = None
+        self._refs = 1
+
+    def __len__(self) -> int:
+        return self.size
+
+    def stream(self):
+        """Underlying file rewound to the start."""
+        self.file.seek(0)
+        return self.file
+
+    def getvalue(self) -> bytes:
+        return self.stream().read()
+
+    def sha256(self) -> str:
+        """Content hash, computed once by streaming the spooled file."""
+        if self._digest is None:
+            digest = hashlib.sha256()
+            stream = self.stream()
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    def retain(self) -> "SpooledImage":
+        """Another holder (e.g. a shared single-flight analysis) keeps the file open."""
+        self._refs += 1
+        return self
+
+    def close(self):
+        self._refs -= 1
+        if self._refs <= 0:
+            self.file.close()
+
+
+class _FilePart:
+    """One file part of the form while it is being received."""
+
+    def __init__(self, filename: str, declared_type: str, spool_threshold: int):
+        self.filename = filename
+        self.declared_type = declared_type
+        self.spool = tempfile.SpooledTemporaryFile(max_size=spool_threshold)
+        self.head = b""
+        self.content_type = None
+        self.size = 0
+
+
+class ImageForm:
+    """
+    Streaming multipart/form-data reader for the /analyze endpoints. The body is parsed
+    as it arrives (python-multipart) instead of through FastAPI's File(...), which only
+    returns once Starlette has spooled every part:
+    - Each file's format is sniffed from its first bytes; non-images are rejected at once
+    - Each file is aborted as soon as its running byte count passes `max_bytes`
+    - At most `max_files` files under `file_field`; text fields are kept up to 1KB
+    The spooled files belong to the caller (as SpooledImage), not to the request, so they
+    can outlive it (S3 uploads, jobs, streams).
+    """
+
+    MAX_FIELD_BYTES = 1024
+
+    def __init__(self, max_files: int, max_bytes: int = MAX_IMAGE_BYTES, file_field: str = "images",
+                 spool_threshold: int = UPLOAD_SPOOL_THRESHOLD):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.file_field = file_field
+        self.spool_threshold = spool_threshold
+        self.files: List[_FilePart] = []
+        self.fields: Dict[str, str] = {}
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._name = None
+        self._file: Optional[_FilePart] = None
+        self._data = bytearray()
+        self._writes: List[Tuple[_FilePart, bytes]] = []
+
+    # python-multipart callbacks (synchronous; file writes are queued for read())
+
+    def _on_part_begin(self):
+        self._headers, self._name, self._file = {}, None, None
+        self._data = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name, self._header_value = b"", b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" not in options:
+            return
+        if self._name != self.file_field:
+            raise HTTPException(400, f"Unexpected file field: {self._name}")
+        if len(self.files) >= self.max_files:
+            raise HTTPException(400, f"Too many images (max {self.max_files})")
+        self._file = _FilePart(options[b"filename"].decode("utf-8", "replace"),
+                               self._headers.get(b"content-type", b"").decode("latin-1"), self.spool_threshold)
+        self.files.append(self._file)
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        chunk = data[start:end]
+        part = self._file
+        if part is None:
+            if len(self._data) + len(chunk) > self.MAX_FIELD_BYTES:
+                raise HTTPException(400, f"Form field too large: {self._name}")
+            self._data.extend(chunk)
+            return
+
+        if part.content_type is None:
+            part.head += chunk[:_SNIFF_BYTES - len(part.head)]
+            if len(part.head) >= _SNIFF_BYTES:
+                part.content_type = sniff_image_type(part.head)
+                if part.content_type is None:
+                    raise HTTPException(400, f"Invalid type: {part.declared_type}")
+
+        part.size += len(chunk)
+        if part.size > self.max_bytes:
+            raise HTTPException(400, f"Image too large (max {self.max_bytes // (1024 * 1024)}MB)")
+        self._writes.append((part, chunk))
+
+    def _on_part_end(self):
+        if self._file is None and self._name:
+            self.fields[self._name] = self._data.decode("utf-8", "replace")
+        elif self._file is not None and self._file.content_type is None:
+            # Shorter than the sniffed header: can't be an image
+            raise HTTPException(400, f"Invalid type: {self._file.declared_type}")
+
+    async def _flush_writes(self):
+        writes, self._writes = self._writes, []
+        for part, chunk in writes:
+            if part.size <= self.spool_threshold:
+                part.spool.write(chunk)  # still in memory
+            else:
+                await run_in_threadpool(part.spool.write, chunk)
+
+    async def read(self, request: Request) -> Tuple[List[SpooledImage], Dict[str, str]]:
+        """(images in upload order, text fields); every spool is closed if anything is rejected."""
+        _, params = parse_options_header(request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise HTTPException(400, "Expected a multipart/form-data upload")
+
+        parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                await self._flush_writes()
+            parser.finalize()
+        except Exception:
+            for part in self.files:
+                part.spool.close()
+            raise
+
+        images = []
+        for part in self.files:
+            part.spool.seek(0)
+            images.append(SpooledImage(part.spool, part.size, part.content_type, part.filename))
+        return images, self.fields
+
+
+async def read_image_form(request: Request, max_files: int, max_bytes: int = MAX_IMAGE_BYTES) -> Tuple[List[SpooledImage], Dict[str, str]]:
+    return await ImageForm(max_files, max_bytes).read(request)
+
+
+def image_form_openapi(**fields: str) -> dict:
+    """requestBody for routes reading their form with ImageForm: `images` files plus text `fields`."""
+    properties = {"images": {"type": "array", "items": {"type": "string", "format": "binary"}}}
+    properties.update({name: {"type": "string", "description": description} for name, description in fields.items()})
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "properties": properties, "required": ["images"],
+    }}}}}
+
+
+class UploadTooLarge(HTTPException):
+    """Raised from the request's receive channel; FastAPI passes HTTPExceptions through body parsing."""
+
+    def __init__(self):
+        super().__init__(413, "Upload too large")
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware capping request bodies by path prefix (first match wins):
+    - Declared Content-Length over the limit: 413 before anything is read
+    - Otherwise bytes are counted as they are received (chunked uploads included) and
+      the request is aborted with 413 as soon as the count passes the limit
+    """
+
+    def __init__(self, app, limits: Sequence[Tuple[str, int]]):
+        self.app = app
+        self.limits = limits
+
+    @staticmethod
+    async def _reject(send):
+        body = json.dumps({"detail": "Upload too large"}).encode()
+        await send({"type": "http.response.start", "status": 413, "headers": [
+            (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close"),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        limit = None
+        if scope["type"] == "http":
+            limit = next((limit for prefix, limit in self.limits if scope["path"].startswith(prefix)), None)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope.get("headers") or []).get(b"content-length", b"").decode("latin-1")
+        if content_length.isdigit() and int(content_length) > limit:
+            await self._reject(send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise UploadTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, tracking_send)
+        except UploadTooLarge:
+            # Normally rendered by the app's exception handling; this covers reads outside it
+            if response_started:
+                raise
+            await self._reject(send)
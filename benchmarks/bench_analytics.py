@@ -0,0 +1,268 @@
+"""
+Benchmark: detection analytics as the detection table grows (default up to 10M rows).
+
+Synthetic detections arrive at --per-day a day, so a growing table is also a growing
+history. At every checkpoint it times:
+- the /analytics queries, which read only the rollup tables
+- the same "top diseases this week" question answered from the side table
+  (detection_diseases, indexed by day)
+- what plant_detections alone allows today: a full scan unnesting the JSON disease arrays
+  (all time, since detections carry no timestamp). Skipped above --scan-cap rows.
+It also times the write path with and without record_detections().
+
+Bulk loading writes each chunk of detections like the batch save does: one insert for
+the detections, one for their side-table rows and one upsert per rollup.
+
+The tables are dropped and recreated in --db: use a disposable database. Default is a
+temporary SQLite file. Postgres URLs work too (json_array_elements_text for the scan).
+
+Usage:
+    python -m benchmarks.bench_analytics [--sizes 100k,1m,10m] [--per-day 13700]
+    python -m benchmarks.bench_analytics --sizes 10k,100k --db postgresql://bench@localhost/bench
+"""
+import os
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import logging
+import statistics
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, event, func, insert, select, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from app.config.db import Base  # noqa: E402
+from app.models.detection_model import PlantDetection  # noqa: E402
+from app.services import detection_analytics as analytics  # noqa: E402
+from app.services.detection_analytics import DETECTION_DISEASES, DAILY_PLANTS, DAILY_DISEASES, USER_PLANTS  # noqa: E402
+
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+TABLES = [PlantDetection.__table__, DETECTION_DISEASES, DAILY_PLANTS, DAILY_DISEASES, USER_PLANTS]
+START_DAY = date(2024, 1, 1)
+CHUNK = 20_000
+PLANTS, DISEASES_PER_PLANT, USERS = 80, 8, 200_000
+# Diseases reported per detection: none / one / two
+DISEASE_COUNTS, DISEASE_COUNT_WEIGHTS = (0, 1, 2), (0.2, 0.65, 0.15)
+JSON_SCAN = {
+    "sqlite": "SELECT d.value, count(*) FROM plant_detections, json_each(plant_detections.disease_scientific_name) d "
+              "GROUP BY d.value ORDER BY 2 DESC LIMIT 10",
+    "postgresql": "SELECT d, count(*) FROM plant_detections, json_array_elements_text(plant_detections.disease_scientific_name) d "
+                  "GROUP BY d ORDER BY 2 DESC LIMIT 10",
+}
+
+
+def parse_size(label: str) -> int:
+    label = label.strip().lower()
+    if label[-1:] in SIZE_SUFFIXES:
+        return int(float(label[:-1]) * SIZE_SUFFIXES[label[-1]])
+    return int(label)
+
+
+def _word(rng: random.Random, low: int = 4, high: int = 10) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+
+class Detection:
+    """The attributes detection_rows() reads from a saved PlantDetection."""
+    __slots__ = ("id", "mobile", "common_name", "scientific_name", "disease", "disease_scientific_name", "disease_confidence")
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+
+class Generator:
+    """Skewed synthetic traffic: a few plants and diseases dominate, like real reports."""
+
+    def __init__(self, per_day: int, seed: int = 7):
+        self.rng = random.Random(seed)
+        self.per_day = per_day
+        rng = self.rng
+        self.plants = [f"{_word(rng, 5, 11).capitalize()} {_word(rng, 5, 12)}" for _ in range(PLANTS)]
+        self.plant_weights = [1 / (rank + 1) for rank in range(PLANTS)]
+        self.diseases = [[(f"{_word(rng, 5, 11).capitalize()} {_word(rng, 5, 12)}", f"{_word(rng).capitalize()} blight")
+                          for _ in range(DISEASES_PER_PLANT)] for _ in range(PLANTS)]
+        self.disease_weights = [1 / (rank + 1) for rank in range(DISEASES_PER_PLANT)]
+        self.mobiles = [f"9{rng.randrange(10 ** 9):09d}" for _ in range(USERS)]
+        self.next_id = 1
+
+    def detected_at(self, detection_id: int) -> datetime:
+        day = START_DAY + timedelta(days=(detection_id - 1) // self.per_day)
+        return datetime.combine(day, dt_time(12), tzinfo=timezone.utc)
+
+    def today(self) -> date:
+        return self.detected_at(max(1, self.next_id - 1)).date()
+
+    def chunk(self, count: int) -> List[Detection]:
+        rng = self.rng
+        plants = rng.choices(range(PLANTS), weights=self.plant_weights, k=count)
+        counts = rng.choices(DISEASE_COUNTS, weights=DISEASE_COUNT_WEIGHTS, k=count)
+        detections = []
+        for plant, n in zip(plants, counts):
+            picked = list(dict.fromkeys(rng.choices(self.diseases[plant], weights=self.disease_weights, k=n)))
+            detections.append(Detection(
+                id=self.next_id,
+                mobile=rng.choice(self.mobiles),
+                common_name=f"Plant {plant}",
+                scientific_name=self.plants[plant],
+                disease=[common for _, common in picked],
+                disease_scientific_name=[scientific for scientific, _ in picked],
+                disease_confidence=[f"{rng.randint(55, 99)}%" for _ in picked],
+            ))
+            self.next_id += 1
+        return detections
+
+
+def load(engine, generator: Generator, count: int):
+    """Append `count` detections, writing them the way save_detections_background does."""
+    done = 0
+    while done < count:
+        detections = generator.chunk(min(CHUNK, count - done))
+        with Session(engine) as db:
+            db.execute(insert(PlantDetection.__table__), [{
+                "id": d.id, "mobile": d.mobile, "common_name": d.common_name, "scientific_name": d.scientific_name,
+                "plant_confidence": "90%", "disease": d.disease, "disease_scientific_name": d.disease_scientific_name,
+                "disease_confidence": d.disease_confidence, "symptoms": [], "cause": [], "treatment": [], "image": None,
+            } for d in detections])
+            rows = [row for d in detections for row in analytics.detection_rows(d, generator.detected_at(d.id))]
+            db.execute(insert(DETECTION_DISEASES), rows)
+            analytics.apply_rollups(db, rows)
+            db.commit()
+        done += len(detections)
+
+
+def timed(func: Callable[[], Any], repeat: int) -> float:
+    """Median milliseconds over `repeat` calls, after one warm-up call."""
+    func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def query_cases(engine, generator: Generator) -> Dict[str, Callable[[], Any]]:
+    today = generator.today()
+    week, month = analytics.window_start(7, today), analytics.window_start(30, today)
+    plant, disease = generator.plants[0], generator.diseases[0][0][0]
+    mobile = generator.mobiles[0]
+
+    def run(query):
+        def call():
+            with Session(engine) as db:
+                return query(db)
+        return call
+
+    t = DETECTION_DISEASES
+    side_table_top = (
+        select(t.c.disease, func.count()).where(t.c.day >= week, t.c.disease.is_not(None))
+        .group_by(t.c.disease).order_by(func.count().desc()).limit(10)
+    )
+    return {
+        "rollup: top diseases 7d": run(lambda db: analytics.top_diseases(db, week)),
+        "rollup: top diseases 7d, one plant": run(lambda db: analytics.top_diseases(db, week, plant=plant)),
+        "rollup: top plants 30d": run(lambda db: analytics.top_plants(db, month)),
+        "rollup: daily counts 30d, one disease": run(lambda db: analytics.daily_counts(db, month, disease=disease)),
+        "rollup: plants of one user": run(lambda db: analytics.user_plants(db, mobile)),
+        "side table: top diseases 7d": run(lambda db: list(db.execute(side_table_top))),
+    }
+
+
+def write_cases(engine, generator: Generator) -> Dict[str, Callable[[], Any]]:
+    """One detection saved per call through the ORM path, with and without analytics."""
+    detected_at = datetime.combine(generator.today(), dt_time(18), tzinfo=timezone.utc)
+
+    def save(with_analytics: bool):
+        def call():
+            template = generator.chunk(1)[0]
+            with Session(engine) as db:
+                detection = PlantDetection(
+                    mobile=template.mobile, common_name=template.common_name, scientific_name=template.scientific_name,
+                    plant_confidence="90%", disease=template.disease, disease_scientific_name=template.disease_scientific_name,
+                    disease_confidence=template.disease_confidence, symptoms=[], cause=[], treatment=[], image=None,
+                )
+                db.add(detection)
+                db.flush()
+                rows = analytics.analytics_rows([detection], detected_at) if with_analytics else []
+                db.commit()
+                analytics.record_detections(db, rows)
+        return call
+
+    return {"write: detection only": save(False), "write: detection + analytics": save(True)}
+
+
+def table_counts(engine) -> Dict[str, int]:
+    with Session(engine) as db:
+        return {table.name: db.execute(select(func.count()).select_from(table)).scalar() for table in TABLES}
+
+
+def run(sizes: List[int], db_url: str, per_day: int, repeat: int, scan_cap: int, out: str = None):
+    engine = create_engine(db_url)
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _fast_sqlite(connection, _):
+            # Loading speed only; durability is irrelevant for a throwaway benchmark file
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+    Base.metadata.drop_all(engine, tables=TABLES[::-1])
+    Base.metadata.create_all(engine, tables=TABLES)
+
+    generator = Generator(per_day)
+    results = []
+    for size in sorted(sizes):
+        started = time.perf_counter()
+        load(engine, generator, size - (generator.next_id - 1))
+        load_seconds = time.perf_counter() - started
+        if dialect == "sqlite":
+            with engine.connect() as connection:
+                connection.execute(text("ANALYZE"))
+        counts = table_counts(engine)
+        days = (generator.today() - START_DAY).days + 1
+        print(f"— {size:,} detections over {days} days (loaded in {load_seconds:.0f}s): "
+              f"{counts['detection_diseases']:,} side rows, {counts['analytics_daily_diseases']:,} disease rollup rows", flush=True)
+
+        timings = {name: timed(case, repeat) for name, case in query_cases(engine, generator).items()}
+        if dialect in JSON_SCAN and size <= scan_cap:
+            scan = text(JSON_SCAN[dialect])
+
+            def full_scan():
+                with Session(engine) as db:
+                    return list(db.execute(scan))
+            timings["JSON scan: top diseases all time"] = timed(full_scan, min(repeat, 3))
+        timings.update({name: timed(case, repeat) for name, case in write_cases(engine, generator).items()})
+        results.append({"detections": size, "days": days, "tables": counts, "load_seconds": load_seconds, "ms": timings})
+
+    names = list(dict.fromkeys(name for r in results for name in r["ms"]))
+    print(f"\n📊 Median ms per call ({dialect}, {per_day} detections/day)")
+    header = "".join(f"{r['detections']:>12,}" for r in results)
+    print(f"{'case':<40}{header}")
+    for name in names:
+        cells = "".join(f"{r['ms'][name]:>12.2f}" if name in r["ms"] else f"{'skipped':>12}" for r in results)
+        print(f"{name:<40}{cells}")
+
+    if out:
+        with open(out, "w") as f:
+            json.dump({"dialect": dialect, "per_day": per_day, "results": results}, f, indent=2)
+        print(f"\n💾 Results written to {out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analytics rollup queries vs table size")
+    parser.add_argument("--sizes", default="100k,1m,10m", help="cumulative detection counts, e.g. 100k,1m,10m")
+    parser.add_argument("--per-day", type=int, default=13_700, help="synthetic detections per day (10M ~ two years)")
+    parser.add_argument("--db", default="sqlite:////tmp/bench_analytics.sqlite", help="disposable database URL")
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per case")
+    parser.add_argument("--scan-cap", default="1m", help="largest table the JSON full scan runs against")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    run([parse_size(s) for s in args.sizes.split(",")], args.db, args.per_day, args.repeat, parse_size(args.scan_cap), args.out)
+    sys.exit(0)
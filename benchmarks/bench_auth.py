@@ -0,0 +1,68 @@
+"""
+Microbenchmark: per-request auth cost with and without the verified-token cache.
+
+Both columns go through get_current_mobile(), the real dependency:
+- miss path: JWT decode + the token version query (the cache holds nothing)
+- cached   : the verified-token cache answers
+The token version query runs against DATABASE_URL (in-memory SQLite by default); point
+it at the deployment's database to include its round trip.
+
+Usage: python -m benchmarks.bench_auth [--tokens 50] [--requests 20000]
+"""
+import os
+import random
+import argparse
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+
+from starlette.requests import Request  # noqa: E402
+from app.config.db import Base, engine  # noqa: E402
+from app.controllers import otp_controller  # noqa: E402
+from app.controllers.otp_controller import (  # noqa: E402
+    VerifiedTokenCache,
+    create_access_token,
+    current_token_version,
+    get_current_mobile,
+)
+
+
+def bearer_request(token: str) -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"",
+                    "headers": [(b"authorization", f"Bearer {token}".encode())]})
+
+
+def timed_requests(requests) -> float:
+    start = time.perf_counter()
+    for request in requests:
+        get_current_mobile(request)
+    return time.perf_counter() - start
+
+
+def run(num_tokens: int, num_requests: int):
+    Base.metadata.create_all(bind=engine)
+    mobiles = [f"+9199990{i:05d}" for i in range(num_tokens)]
+    tokens = [create_access_token({"sub": mobile, "ver": current_token_version(mobile)}) for mobile in mobiles]
+    workload = [bearer_request(random.choice(tokens)) for _ in range(num_requests)]
+
+    # Nothing is ever kept: every request takes the miss path
+    otp_controller.token_cache = VerifiedTokenCache(maxsize=0)
+    uncached = timed_requests(workload)
+
+    cache = otp_controller.token_cache = VerifiedTokenCache()
+    cached = timed_requests(workload)
+
+    print(f"📊 {num_requests} requests over {num_tokens} distinct tokens ({engine.dialect.name})")
+    print(f"   miss path   : {uncached / num_requests * 1e6:8.2f} µs/request (decode + token version query)")
+    print(f"   token cache : {cached / num_requests * 1e6:8.2f} µs/request")
+    print(f"   speedup     : {uncached / cached:8.1f}x")
+    print(f"   cache stats : {cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    run(args.tokens, args.requests)
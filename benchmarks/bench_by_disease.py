@@ -0,0 +1,75 @@
+"""
+Benchmark: /by-disease substring lookup, in-memory trigram index vs a DB ILIKE scan.
+
+The DB side runs against in-memory SQLite, so it understates a networked Postgres
+round trip; it still shows the per-query table scan the index avoids.
+
+Usage: python -m benchmarks.bench_by_disease [--products 100000] [--queries 500]
+"""
+import os
+import random
+import string
+import argparse
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from app.config.db import Base  # noqa: E402
+from app.models.product_model import Product  # noqa: E402
+from app.services.name_index import SubstringIndex  # noqa: E402
+
+
+def random_word(rng: random.Random, low: int = 4, high: int = 10) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+
+def run(num_products: int, num_queries: int):
+    rng = random.Random(7)
+    diseases = [f"{random_word(rng).capitalize()} {random_word(rng)}" for _ in range(max(1, num_products // 20))]
+    rows = [
+        {"id": i + 1, "product_name": f"Product {i}", "disease": rng.choice(diseases), "scientific_name": random_word(rng)}
+        for i in range(num_products)
+    ]
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(Product.__table__.insert(), rows)
+    db = sessionmaker(bind=engine)()
+
+    start = time.perf_counter()
+    index = SubstringIndex([row["disease"] for row in rows])
+    build = time.perf_counter() - start
+
+    queries = []
+    for _ in range(num_queries):
+        disease = rng.choice(diseases)
+        offset = rng.randint(0, len(disease) - 4)
+        queries.append(disease[offset:offset + rng.randint(3, 6)])
+
+    start = time.perf_counter()
+    memory_hits = [len(index.search(q)) for q in queries]
+    memory = (time.perf_counter() - start) / num_queries
+
+    db_queries = queries[:max(1, num_queries // 10)]
+    start = time.perf_counter()
+    db_hits = [len(db.query(Product).filter(Product.disease.ilike(f"%{q}%")).all()) for q in db_queries]
+    database = (time.perf_counter() - start) / len(db_queries)
+    db.close()
+
+    agree = sum(m == d for m, d in zip(memory_hits, db_hits))
+    print(f"📊 {num_products} products, {len(index.names)} distinct disease names")
+    print(f"   index build     : {build * 1000:8.1f} ms")
+    print(f"   trigram index   : {memory * 1000:8.3f} ms/query")
+    print(f"   sqlite ILIKE    : {database * 1000:8.3f} ms/query")
+    print(f"   hit counts agree: {agree}/{len(db_hits)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+    run(args.products, args.queries)
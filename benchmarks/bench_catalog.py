@@ -0,0 +1,93 @@
+"""
+Benchmark: GET /products before (response_model re-serialization per request) vs
+after (pre-serialized, gzip'd, ETag'd body), through the real ASGI stack.
+
+Usage: python -m benchmarks.bench_catalog [--products 5000] [--requests 200]
+"""
+import os
+import random
+import string
+import argparse
+import time
+from typing import Any, Dict, List
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from app.services import product_cache  # noqa: E402
+from app.routes.product_routes import router as product_router  # noqa: E402
+
+
+def random_text(rng: random.Random, words: int) -> str:
+    return " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10))) for _ in range(words))
+
+
+def make_products(num_products: int) -> List[Dict[str, Any]]:
+    rng = random.Random(7)
+    return [
+        {
+            "id": i + 1,
+            "name": random_text(rng, 2).title(),
+            "scientific_name": random_text(rng, 2).capitalize(),
+            "disease": random_text(rng, 2).title(),
+            "disease_scientific_name": random_text(rng, 2).capitalize(),
+            "product_link": f"https://example.com/p/{i}",
+            "how_to_use": random_text(rng, 30),
+            "product_image": f"https://example.com/img/{i}.jpg",
+        }
+        for i in range(num_products)
+    ]
+
+
+def fetch(client: TestClient, path: str, headers: Dict[str, str]):
+    """(status, bytes on the wire) without decompressing, so the client doesn't skew CPU."""
+    with client.stream("GET", path, headers=headers) as response:
+        return response.status_code, sum(len(chunk) for chunk in response.iter_raw())
+
+
+def measure(client: TestClient, path: str, headers: Dict[str, str], num_requests: int):
+    fetch(client, path, headers)
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(num_requests):
+        status, size = fetch(client, path, headers)
+    wall = (time.perf_counter() - wall) / num_requests
+    cpu = (time.process_time() - cpu) / num_requests
+    return wall, cpu, status, size
+
+
+def run(num_products: int, num_requests: int):
+    product_cache.rebuild_indexes(make_products(num_products))
+
+    app = FastAPI()
+
+    @app.get("/legacy/products", response_model=List[Dict[str, Any]])
+    async def legacy_products():
+        return product_cache.get_cached_products()
+
+    app.include_router(product_router)
+    client = TestClient(app)
+
+    raw = {"Accept-Encoding": "identity"}
+    gz = {"Accept-Encoding": "gzip"}
+    etag = client.get("/products", headers=gz).headers["etag"]
+
+    cases = [
+        ("before: response_model", "/legacy/products", raw),
+        ("after : identity", "/products", raw),
+        ("after : gzip", "/products", gz),
+        ("after : If-None-Match", "/products", {**gz, "If-None-Match": etag}),
+        ("after : fields=id,name", "/products?fields=id,name", gz),
+    ]
+    print(f"📊 {num_products} products, {num_requests} requests per case")
+    for label, path, headers in cases:
+        wall, cpu, status, size = measure(client, path, headers, num_requests)
+        print(f"   {label:24s}: {wall * 1000:8.2f} ms wall  {cpu * 1000:8.2f} ms cpu  {status}  {size / 1024:8.1f} KiB on the wire")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    run(args.products, args.requests)
@@ -0,0 +1,153 @@
+"""
+Benchmark: streaming detection export throughput and memory on multi-million-row tables.
+
+Loads synthetic detections (same generator and write path as bench_analytics), then at
+each size exports the whole table through export_chunks() for every format, with and
+without gzip. For comparison it also runs what /history does: ORM objects for every row,
+one list of dicts, one JSON body. That comparison is skipped above --legacy-cap rows.
+
+Peak memory is the growth of the process's resident high-water mark during one export
+(VmHWM reset through /proc/self/clear_refs; Linux only, "n/a" elsewhere). Throughput
+covers the database read, the encoding and the compression, but not the network.
+
+The tables are dropped and recreated in --db: use a disposable database.
+
+Usage:
+    python -m benchmarks.bench_export [--sizes 1m,3m] [--formats ndjson,csv]
+    python -m benchmarks.bench_export --sizes 100k --db postgresql://bench@localhost/bench
+"""
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import orjson  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import Session, sessionmaker  # noqa: E402
+from app.config.db import Base  # noqa: E402
+from app.models.detection_model import PlantDetection  # noqa: E402
+from app.services import detection_export  # noqa: E402
+from benchmarks.bench_analytics import TABLES, Generator, load, parse_size  # noqa: E402
+
+
+def _status_kib(field: str) -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def measure(produce: Callable[[], Iterable[bytes]]) -> Dict[str, Any]:
+    """Drain one export; wall time, bytes produced and resident-memory growth."""
+    gc.collect()
+    peak_known = _reset_peak()
+    baseline = _status_kib("VmRSS")
+    started = time.perf_counter()
+    size = 0
+    for chunk in produce():
+        size += len(chunk)
+    seconds = time.perf_counter() - started
+    peak = _status_kib("VmHWM")
+    return {
+        "seconds": seconds,
+        "bytes": size,
+        "peak_mib": (peak - baseline) / 1024 if peak_known and peak is not None and baseline is not None else None,
+    }
+
+
+def legacy_history(engine) -> Callable[[], Iterable[bytes]]:
+    """The /history approach: every row as an ORM object, then one JSON document."""
+    def produce():
+        with Session(engine) as db:
+            history = db.query(PlantDetection).all()
+            body = orjson.dumps({"history": [dict(
+                id=item.id, mobile=item.mobile, common_name=item.common_name, scientific_name=item.scientific_name,
+                plant_confidence=item.plant_confidence, disease=item.disease, disease_scientific_name=item.disease_scientific_name,
+                disease_confidence=item.disease_confidence, symptoms=item.symptoms, cause=item.cause, treatment=item.treatment,
+                image=item.image,
+            ) for item in history]})
+        return [body]
+    return produce
+
+
+def streaming_export(fmt: str, compress: bool) -> Callable[[], Iterable[bytes]]:
+    def produce():
+        chunks = detection_export.export_chunks(fmt)
+        return detection_export.gzip_chunks(chunks) if compress else chunks
+    return produce
+
+
+def run(sizes: List[int], formats: List[str], db_url: str, legacy_cap: int, out: str = None):
+    engine = create_engine(db_url)
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _fast_sqlite(connection, _):
+            # Loading speed only; durability is irrelevant for a throwaway benchmark file
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+    Base.metadata.drop_all(engine, tables=TABLES[::-1])
+    Base.metadata.create_all(engine, tables=TABLES)
+    # export_chunks opens its sessions from the app's SessionLocal: point it at this database
+    detection_export.SessionLocal = sessionmaker(bind=engine)
+
+    generator = Generator(per_day=13_700)
+    results = []
+    for size in sorted(sizes):
+        started = time.perf_counter()
+        load(engine, generator, size - (generator.next_id - 1))
+        print(f"— {size:,} detections loaded in {time.perf_counter() - started:.0f}s", flush=True)
+
+        cases = {f"{fmt}{' + gzip' if compress else ''}": streaming_export(fmt, compress)
+                 for fmt in formats for compress in (False, True)}
+        if size <= legacy_cap:
+            cases["/history style (ORM + one JSON body)"] = legacy_history(engine)
+        for name, produce in cases.items():
+            result = measure(produce)
+            results.append({"detections": size, "case": name, **result})
+            print(f"   {name:<40} {result['seconds']:>6.1f}s", flush=True)
+
+    print(f"\n📊 Full-table export ({dialect}, batches of {detection_export.EXPORT_BATCH_ROWS} rows, gzip level {detection_export.EXPORT_GZIP_LEVEL})")
+    print(f"{'rows':>12} {'case':<40} {'rows/s':>10} {'MB/s':>7} {'output':>10} {'peak RSS +':>11}")
+    for r in results:
+        peak = f"{r['peak_mib']:.0f} MiB" if r["peak_mib"] is not None else "n/a"
+        print(f"{r['detections']:>12,} {r['case']:<40} {r['detections'] / r['seconds']:>10,.0f} "
+              f"{r['bytes'] / r['seconds'] / 1e6:>7.1f} {r['bytes'] / 1e6:>7.0f} MB {peak:>11}")
+
+    if out:
+        with open(out, "w") as f:
+            json.dump({"dialect": dialect, "batch_rows": detection_export.EXPORT_BATCH_ROWS, "results": results}, f, indent=2)
+        print(f"\n💾 Results written to {out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming export throughput and memory vs table size")
+    parser.add_argument("--sizes", default="1m,3m", help="cumulative detection counts, e.g. 100k,1m,3m")
+    parser.add_argument("--formats", default="ndjson,csv")
+    parser.add_argument("--db", default="sqlite:////tmp/bench_export.sqlite", help="disposable database URL")
+    parser.add_argument("--legacy-cap", default="1m", help="largest table the /history-style export runs against")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    run([parse_size(s) for s in args.sizes.split(",")], args.formats.split(","), args.db, parse_size(args.legacy_cap), args.out)
+    sys.exit(0)
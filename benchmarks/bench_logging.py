@@ -0,0 +1,94 @@
+"""
+Benchmark: product search latency with logging off vs on, synchronous vs queued.
+
+Runs the legacy tiered search handler (the one with per-product trace lines) over a
+synthetic catalog. Log output goes to /dev/null, so this measures formatting and
+handler cost, not disk or terminal speed.
+
+Usage: python -m benchmarks.bench_logging [--products 1000] [--searches 50]
+"""
+import os
+import random
+import string
+import asyncio
+import argparse
+import logging
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.config import logging_config  # noqa: E402
+from app.services import product_cache  # noqa: E402
+from app.controllers.product_controller import get_products_by_scientific_name  # noqa: E402
+
+
+def random_name(rng: random.Random) -> str:
+    return " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))) for _ in range(2)).capitalize()
+
+
+def make_products(num_products: int, rng: random.Random):
+    return [
+        {"id": i + 1, "name": f"Product {i}", "scientific_name": random_name(rng), "disease": random_name(rng).title(),
+         "disease_scientific_name": random_name(rng), "product_link": "", "how_to_use": "", "product_image": ""}
+        for i in range(num_products)
+    ]
+
+
+def sync_logging(level: int, devnull):
+    """Pre-queue setup: a StreamHandler on the root logger, written on the calling thread."""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(logging_config.JsonFormatter())
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def time_searches(queries, num_searches: int) -> float:
+    async def run():
+        started = time.perf_counter()
+        for disease, plant in queries[:num_searches]:
+            try:
+                await get_products_by_scientific_name(disease, plant)
+            except Exception:
+                pass
+        return (time.perf_counter() - started) / num_searches
+    return asyncio.run(run())
+
+
+def run(num_products: int, num_searches: int):
+    rng = random.Random(7)
+    products = make_products(num_products, rng)
+    product_cache.rebuild_indexes(products)
+    queries = [(p["disease_scientific_name"], p["scientific_name"]) for p in rng.sample(products, num_searches)]
+    devnull = open(os.devnull, "w")
+
+    cases = [
+        ("off (WARNING)", "queue", "WARNING", 0.0),
+        ("INFO, queued", "queue", "INFO", 0.0),
+        ("DEBUG trace, queued", "queue", "DEBUG", 1.0),
+        ("DEBUG trace, sync", "sync", "DEBUG", 1.0),
+        ("DEBUG trace 1% sample", "queue", "DEBUG", 0.01),
+    ]
+    logging.getLogger().setLevel(logging.WARNING)
+    time_searches(queries, num_searches)  # warm-up
+
+    print(f"📊 {num_products} products, {num_searches} searches per case")
+    for label, mode, level, sample_rate in cases:
+        logging_config.LOG_TRACE_SAMPLE_RATE = sample_rate
+        if mode == "queue":
+            logging_config.setup_logging(level=level, stream=devnull)
+        else:
+            sync_logging(getattr(logging, level), devnull)
+        per_search = time_searches(queries, num_searches)
+        logging_config.stop_logging()
+        print(f"   {label:24s}: {per_search * 1000:8.2f} ms/search")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--searches", type=int, default=50)
+    args = parser.parse_args()
+    run(args.products, args.searches)
@@ -0,0 +1,61 @@
+"""
+Benchmark: per-pair cost of POST /products/search/batch scoring vs repeated single searches.
+
+Usage: python -m benchmarks.bench_search_batch [--products 2000] [--sizes 1,10,100,1000]
+"""
+import os
+import random
+import argparse
+import logging
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.services import product_cache  # noqa: E402
+from app.services.match_utils import fuzzy_lookup  # noqa: E402
+from app.controllers.product_controller import search_products, search_products_batch  # noqa: E402
+
+GENERA = ["Solanum", "Alternaria", "Phytophthora", "Puccinia", "Fusarium", "Capsicum", "Oryza", "Pyricularia",
+          "Erysiphe", "Botrytis", "Rosa", "Mangifera", "Colletotrichum", "Xanthomonas", "Cercospora", "Citrus"]
+SPECIES = ["lycopersicum", "solani", "infestans", "graminis", "oxysporum", "annuum", "sativa", "oryzae",
+           "cichoracearum", "cinerea", "indica", "gloeosporioides", "campestris", "beticola", "limon"]
+
+
+def scientific_name(rng: random.Random) -> str:
+    return f"{rng.choice(GENERA)} {rng.choice(SPECIES)}{rng.choice(['', '', ' spp.', ' var. major'])}"
+
+
+def run(num_products: int, sizes: list[int]):
+    rng = random.Random(42)
+    product_cache.rebuild_indexes([
+        {"id": i, "name": f"Product {i}", "scientific_name": scientific_name(rng),
+         "disease": "", "disease_scientific_name": scientific_name(rng)}
+        for i in range(num_products)
+    ])
+
+    print(f"📊 Catalog: {num_products} products")
+    print(f"{'pairs':>7} {'single µs/pair':>15} {'batch µs/pair':>15} {'speedup':>8}")
+    for size in sizes:
+        pairs = [(scientific_name(rng), scientific_name(rng)) for _ in range(size)]
+
+        fuzzy_lookup.cache_clear()
+        single_pairs = pairs[:min(size, 50)]
+        start = time.perf_counter()
+        for disease, plant in single_pairs:
+            search_products(disease, plant)
+        single = (time.perf_counter() - start) / len(single_pairs)
+
+        start = time.perf_counter()
+        search_products_batch(pairs)
+        batch = (time.perf_counter() - start) / size
+
+        print(f"{size:>7} {single * 1e6:>15.0f} {batch * 1e6:>15.0f} {single / batch:>7.1f}x")
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--sizes", default="1,10,100,1000")
+    args = parser.parse_args()
+    run(args.products, [int(size) for size in args.sizes.split(",")])
@@ -0,0 +1,52 @@
+"""
+Benchmark: typeahead latency over a large set of distinct scientific names.
+
+Usage: python -m benchmarks.bench_typeahead [--names 100000] [--queries 2000]
+"""
+import os
+import random
+import string
+import argparse
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.services.name_index import TypeaheadIndex  # noqa: E402
+
+
+def random_word(rng: random.Random, low: int = 5, high: int = 12) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+
+def run(num_names: int, num_queries: int):
+    rng = random.Random(7)
+    names = [f"{random_word(rng).capitalize()} {random_word(rng)}" for _ in range(num_names)]
+
+    start = time.perf_counter()
+    index = TypeaheadIndex(names)
+    build = time.perf_counter() - start
+
+    queries = [rng.choice(names).split()[rng.randint(0, 1)][:rng.randint(2, 5)] for _ in range(num_queries)]
+    start = time.perf_counter()
+    for query in queries:
+        index.prefix(query, limit=10)
+    prefix = (time.perf_counter() - start) / num_queries
+
+    typos = [name[:3] + "x" + name[4:] for name in rng.sample(names, min(50, num_names))]
+    start = time.perf_counter()
+    for query in typos:
+        index.fuzzy(query, limit=10)
+    fuzzy = (time.perf_counter() - start) / len(typos)
+
+    print(f"📊 {len(index)} distinct names")
+    print(f"   index build    : {build * 1000:8.1f} ms")
+    print(f"   prefix lookup  : {prefix * 1e6:8.1f} µs/query")
+    print(f"   fuzzy fallback : {fuzzy * 1000:8.2f} ms/query")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--names", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.names, args.queries)
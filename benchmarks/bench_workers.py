@@ -0,0 +1,142 @@
+"""
+Benchmark: cold start and memory of N workers, run as N separate `uvicorn app.main:app`
+processes (how scaling works today: one process per container) versus one prefork
+`python -m app.server --workers N` (model and catalog loaded once, shared copy-on-write).
+
+Memory is summed over every process of a setup (the prefork master included):
+- RSS counts shared pages once per process, so it overstates a prefork setup
+- PSS splits each shared page between its sharers; summed, it is the real footprint
+Cold start is launch until every worker answers /health (each reports its pid).
+
+Runs against the environment it is started in (.env, DATABASE_URL, OPENAI_* ...), so
+point those at disposable services; see devstack/fake_upstreams.py. Linux only (/proc).
+
+Usage: python -m benchmarks.bench_workers [--workers 1,2,4] [--port 8100]
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+from typing import Dict, List, Set
+
+import httpx
+
+
+def process_tree(root: int) -> List[int]:
+    """`root` and all of its descendants, from /proc/<pid>/stat parent links."""
+    parents: Dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; fields resume after its closing ")"
+                fields = f.read().rsplit(")", 1)[1].split()
+            parents[int(entry)] = int(fields[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    tree, frontier = [root], [root]
+    while frontier:
+        children = [pid for pid, ppid in parents.items() if ppid in frontier]
+        tree.extend(children)
+        frontier = children
+    return tree
+
+
+def memory_kib(pid: int) -> Dict[str, int]:
+    """Rss and Pss (KiB) of one process from smaps_rollup."""
+    values = {"Rss": 0, "Pss": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in values:
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def wait_ready(urls: List[str], workers: int, timeout: float) -> float:
+    """Seconds until `workers` distinct pids have answered /health across `urls`."""
+    started = time.perf_counter()
+    pids: Set[int] = set()
+    while len(pids) < workers:
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError(f"only {len(pids)}/{workers} workers ready after {timeout:.0f}s")
+        for url in urls:
+            try:
+                # A fresh connection each time, so the shared socket can hand it to any worker
+                response = httpx.get(f"{url}/health", timeout=2)
+                if response.status_code == 200:
+                    pids.add(response.json().get("pid"))
+            except (httpx.HTTPError, ValueError):
+                time.sleep(0.1)
+    return time.perf_counter() - started
+
+
+def launch(mode: str, workers: int, port: int, log) -> List[subprocess.Popen]:
+    if mode == "prefork":
+        command = [sys.executable, "-m", "app.server", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)]
+        return [subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)]
+    return [
+        subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port + i)],
+                         stdout=log, stderr=subprocess.STDOUT)
+        for i in range(workers)
+    ]
+
+
+def stop(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.send_signal(signal.SIGTERM)
+    for process in processes:
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def measure(mode: str, workers: int, port: int, timeout: float, settle: float, log) -> Dict[str, float]:
+    processes = launch(mode, workers, port, log)
+    try:
+        urls = [f"http://127.0.0.1:{port}"] if mode == "prefork" else [f"http://127.0.0.1:{port + i}" for i in range(workers)]
+        cold_start = wait_ready(urls, workers, timeout)
+        time.sleep(settle)
+        pids = [pid for process in processes for pid in process_tree(process.pid)]
+        usage = [memory_kib(pid) for pid in pids]
+    finally:
+        stop(processes)
+    return {
+        "cold_start": cold_start,
+        "processes": len(pids),
+        "rss_mib": sum(u["Rss"] for u in usage) / 1024,
+        "pss_mib": sum(u["Pss"] for u in usage) / 1024,
+    }
+
+
+def run(worker_counts: List[int], port: int, timeout: float, settle: float, log_path: str):
+    results = []
+    with open(log_path, "ab") as log:
+        for workers in worker_counts:
+            for mode in ("separate", "prefork"):
+                print(f"⏳ {mode} x{workers}...", flush=True)
+                results.append((mode, workers, measure(mode, workers, port, timeout, settle, log)))
+
+    print(f"\n📊 Cold start and memory (server output in {log_path})")
+    print(f"{'setup':<10} {'workers':>7} {'procs':>5} {'cold start':>11} {'total RSS':>11} {'total PSS':>11} {'PSS/worker':>11}")
+    for mode, workers, r in results:
+        print(f"{mode:<10} {workers:>7} {r['processes']:>5} {r['cold_start']:>10.1f}s {r['rss_mib']:>8.0f} MiB "
+              f"{r['pss_mib']:>8.0f} MiB {r['pss_mib'] / workers:>8.0f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for a setup to become ready")
+    parser.add_argument("--settle", type=float, default=2, help="seconds idle after ready before sampling memory")
+    parser.add_argument("--log", default="/tmp/bench_workers.log")
+    args = parser.parse_args()
+    run([int(n) for n in args.workers.split(",")], args.port, args.timeout, args.settle, args.log)
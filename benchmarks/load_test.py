@@ -0,0 +1,423 @@
+"""
+Load test: replays a weighted mix of user scenarios against a running API at a target
+concurrency (closed loop) or arrival rate (open loop), then reports throughput,
+p50/p95/p99 latency and error rates per endpoint as JSON. `compare` diffs two reports
+and exits non-zero on regressions, so it can gate a CI job.
+
+Scenarios:
+    login    POST /auth/send_otp + POST /auth/verify_otp (OTP read from the send_otp response)
+    analyze  POST /analyze/ with a set of 1..--images-per-analyze images
+    search   GET /products/search with disease/plant pairs taken from the catalog
+    history  GET /history/
+    catalog  GET /products (gzip)
+
+For an offline run, start the fake upstreams (python -m devstack.fake_upstreams) and the
+API with OPENAI_BASE_URL / E2A_API_URL / STORAGE_BACKEND=local pointing at them.
+
+Usage:
+    python -m benchmarks.load_test run --base-url http://localhost:8000 --concurrency 20 --duration 60 --out after.json
+    python -m benchmarks.load_test run --rate 15 --mix search=6,analyze=2,history=1,login=1 --images ./test_images
+    python -m benchmarks.load_test compare before.json after.json [--threshold 0.1]
+"""
+import io
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import httpx
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+DEFAULT_MIX = "search=5,analyze=2,history=2,login=1"
+# Latency changes smaller than this are noise whatever the relative change
+MIN_LATENCY_DELTA_MS = 2.0
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Linear-interpolated percentile (q in 0..100) of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition("=")
+        if not name.strip():
+            continue
+        if name.strip() not in SCENARIOS:
+            raise SystemExit(f"❌ Unknown scenario {name.strip()!r} (choose from {', '.join(SCENARIOS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Recorder:
+    """Per-endpoint latency samples and status counts; samples before `record_after` are warmup."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.record_after = 0.0
+        self.dropped = 0
+
+    def add(self, endpoint: str, started: float, status: str, ok: bool):
+        if started < self.record_after:
+            return
+        self.latencies[endpoint].append(time.perf_counter() - started)
+        self.statuses[endpoint][status] += 1
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {}
+        all_latencies, total_errors = [], 0
+        for endpoint in sorted(self.latencies):
+            values = sorted(self.latencies[endpoint])
+            all_latencies.extend(values)
+            total_errors += self.errors[endpoint]
+            endpoints[endpoint] = self._stats(values, self.errors[endpoint], elapsed)
+            endpoints[endpoint]["statuses"] = dict(sorted(self.statuses[endpoint].items()))
+        overall = self._stats(sorted(all_latencies), total_errors, elapsed)
+        overall["dropped"] = self.dropped
+        return {"overall": overall, "endpoints": endpoints}
+
+    @staticmethod
+    def _stats(values: List[float], errors: int, elapsed: float) -> dict:
+        count = len(values)
+        return {
+            "requests": count,
+            "errors": errors,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "throughput_rps": round(count / elapsed, 3) if elapsed else 0.0,
+            "latency_ms": {
+                "min": round(values[0] * 1000, 2) if values else 0.0,
+                "mean": round(sum(values) / count * 1000, 2) if values else 0.0,
+                "p50": round(percentile(values, 50) * 1000, 2),
+                "p90": round(percentile(values, 90) * 1000, 2),
+                "p95": round(percentile(values, 95) * 1000, 2),
+                "p99": round(percentile(values, 99) * 1000, 2),
+                "max": round(values[-1] * 1000, 2) if values else 0.0,
+            },
+        }
+
+
+class LoadContext:
+    """Shared state for scenarios: HTTP client, logged-in users, images and search terms."""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, images: List[Tuple[str, bytes]],
+                 images_per_analyze: int, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.images = images
+        self.images_per_analyze = images_per_analyze
+        self.rng = rng
+        self.tokens: List[str] = []
+        self.mobiles: List[str] = []
+        self.search_terms: List[Tuple[str, str]] = []
+
+    async def request(self, endpoint: str, method: str, url: str, ok_statuses=(200,), started: float = None, **kwargs):
+        started = started or time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.add(endpoint, started, type(e).__name__, False)
+            return None
+        self.recorder.add(endpoint, started, str(response.status_code), response.status_code in ok_statuses)
+        return response
+
+    def auth_headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.rng.choice(self.tokens)}"} if self.tokens else {}
+
+    async def login(self, mobile: str, started: float = None) -> Optional[str]:
+        response = await self.request("send_otp", "POST", "/auth/send_otp", json={"mobile": mobile}, started=started)
+        if response is None or response.status_code != 200:
+            return None
+        otp = response.json().get("otp")
+        response = await self.request("verify_otp", "POST", "/auth/verify_otp", json={"mobile": mobile, "otp": otp})
+        if response is None or response.status_code != 200:
+            return None
+        return response.json().get("token")
+
+
+async def scenario_login(ctx: LoadContext, started: float):
+    await ctx.login(ctx.rng.choice(ctx.mobiles), started)
+
+
+async def scenario_analyze(ctx: LoadContext, started: float):
+    count = ctx.rng.randint(1, min(ctx.images_per_analyze, len(ctx.images)))
+    files = [("images", (name, data, "image/jpeg")) for name, data in ctx.rng.sample(ctx.images, count)]
+    await ctx.request("analyze", "POST", "/analyze/", files=files, headers=ctx.auth_headers(), started=started)
+
+
+async def scenario_search(ctx: LoadContext, started: float):
+    disease, plant = ctx.rng.choice(ctx.search_terms)
+    # 404 is the API's "no matching products" answer, not a failure
+    await ctx.request("search", "GET", "/products/search", ok_statuses=(200, 404), started=started,
+                      params={"disease_scientific_name": disease, "plant_scientific_name": plant},
+                      headers=ctx.auth_headers())
+
+
+async def scenario_history(ctx: LoadContext, started: float):
+    await ctx.request("history", "GET", "/history/", headers=ctx.auth_headers(), started=started)
+
+
+async def scenario_catalog(ctx: LoadContext, started: float):
+    await ctx.request("catalog", "GET", "/products", headers={"Accept-Encoding": "gzip"}, started=started)
+
+
+SCENARIOS = {
+    "login": scenario_login,
+    "analyze": scenario_analyze,
+    "search": scenario_search,
+    "history": scenario_history,
+    "catalog": scenario_catalog,
+}
+
+
+def load_images(folder: Optional[str], rng: random.Random) -> List[Tuple[str, bytes]]:
+    """Images from `folder`, or a few synthetic phone-sized JPEGs when none is given."""
+    if folder:
+        paths = sorted(p for p in Path(folder).glob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+        if not paths:
+            raise SystemExit(f"❌ No supported image files found in {folder}")
+        return [(p.name, p.read_bytes()) for p in paths]
+
+    from PIL import Image
+    images = []
+    for i in range(4):
+        image = Image.effect_noise((2016, 1512), 40).convert("RGB")
+        image.paste((rng.randint(20, 80), rng.randint(100, 180), rng.randint(20, 80)), (300, 300, 1700, 1200))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        images.append((f"synthetic_{i}.jpg", buffer.getvalue()))
+    return images
+
+
+async def setup(ctx: LoadContext, num_users: int, mix: Dict[str, float]):
+    """Log the virtual users in and pull search terms from the catalog (not recorded)."""
+    ctx.mobiles = [f"+91{ctx.rng.randint(6000000000, 9999999999)}" for _ in range(num_users)]
+    if any(name in mix for name in ("analyze", "search", "history")):
+        tokens = await asyncio.gather(*(ctx.login(mobile) for mobile in ctx.mobiles))
+        ctx.tokens = [token for token in tokens if token]
+        if not ctx.tokens:
+            raise SystemExit("❌ No virtual user could log in; is the API (and its SMS upstream) running?")
+    if "search" in mix:
+        response = await ctx.client.get("/products", params={"fields": "scientific_name,disease_scientific_name"})
+        if response.status_code == 200:
+            ctx.search_terms = [(p["disease_scientific_name"], p["scientific_name"]) for p in response.json()
+                                if p.get("disease_scientific_name") and p.get("scientific_name")]
+        if not ctx.search_terms:
+            ctx.search_terms = [("Alternaria solani", "Solanum lycopersicum"), ("Phytophthora infestans", "Solanum tuberosum")]
+    ctx.recorder.latencies.clear()
+    ctx.recorder.statuses.clear()
+    ctx.recorder.errors.clear()
+
+
+async def run_closed_loop(ctx: LoadContext, mix: Dict[str, float], concurrency: int, deadline: float):
+    """`concurrency` virtual users, each starting its next scenario as soon as the last finishes."""
+    names, weights = list(mix), list(mix.values())
+
+    async def user():
+        while time.perf_counter() < deadline:
+            await SCENARIOS[ctx.rng.choices(names, weights)[0]](ctx, time.perf_counter())
+
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+
+
+async def run_open_loop(ctx: LoadContext, mix: Dict[str, float], rate: float, max_in_flight: int, deadline: float):
+    """
+    Poisson arrivals at `rate` per second regardless of how fast the server answers.
+    Latency counts from the scheduled arrival, so a slow client loop can't hide queueing
+    (coordinated omission). Arrivals beyond `max_in_flight` are dropped and counted.
+    """
+    names, weights = list(mix), list(mix.values())
+    in_flight = set()
+    next_arrival = time.perf_counter()
+    while next_arrival < deadline:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= max_in_flight:
+            ctx.recorder.dropped += 1
+        else:
+            task = asyncio.create_task(SCENARIOS[ctx.rng.choices(names, weights)[0]](ctx, next_arrival))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        next_arrival += ctx.rng.expovariate(rate)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+
+async def run_load(args) -> dict:
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    images = load_images(args.images, rng) if "analyze" in mix else []
+    recorder = Recorder()
+    connections = args.max_in_flight if args.rate else args.concurrency
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        ctx = LoadContext(client, recorder, images, args.images_per_analyze, rng)
+        await setup(ctx, args.users, mix)
+
+        started = time.perf_counter()
+        recorder.record_after = started + args.warmup
+        deadline = started + args.warmup + args.duration
+        if args.rate:
+            await run_open_loop(ctx, mix, args.rate, args.max_in_flight, deadline)
+        else:
+            await run_closed_loop(ctx, mix, args.concurrency, deadline)
+        elapsed = time.perf_counter() - recorder.record_after
+
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "base_url": args.base_url,
+            "mode": "open" if args.rate else "closed",
+            "concurrency": None if args.rate else args.concurrency,
+            "rate": args.rate,
+            "max_in_flight": args.max_in_flight if args.rate else None,
+            "duration_seconds": round(elapsed, 3),
+            "warmup_seconds": args.warmup,
+            "mix": mix,
+            "users": args.users,
+            "label": args.label,
+        },
+    }
+    report.update(recorder.summary(elapsed))
+    return report
+
+
+def print_report(report: dict):
+    meta = report["meta"]
+    load = f"rate={meta['rate']}/s" if meta["mode"] == "open" else f"concurrency={meta['concurrency']}"
+    print(f"\n📊 Load test ({meta['mode']} loop, {load}, {meta['duration_seconds']}s)")
+    print(f"{'endpoint':<10} {'reqs':>7} {'rps':>8} {'err%':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = list(report["endpoints"].items()) + [("overall", report["overall"])]
+    for name, stats in rows:
+        latency = stats["latency_ms"]
+        print(f"{name:<10} {stats['requests']:>7} {stats['throughput_rps']:>8.2f} {stats['error_rate'] * 100:>6.2f} "
+              f"{latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f} {latency['max']:>9.1f}")
+    if report["overall"]["dropped"]:
+        print(f"⚠️ {report['overall']['dropped']} arrivals dropped at max-in-flight (client or server saturated)")
+
+
+def compare_reports(before: dict, after: dict, threshold: float) -> Tuple[List[dict], List[str]]:
+    """
+    Per-endpoint deltas plus the list of regressions: a p50/p95/p99 rise above `threshold`
+    (relative, and at least MIN_LATENCY_DELTA_MS), a throughput drop above `threshold`, or
+    an error-rate rise of more than one percentage point.
+    """
+    rows, regressions = [], []
+    endpoints = sorted(set(before["endpoints"]) | set(after["endpoints"])) + ["overall"]
+    for name in endpoints:
+        old = before["overall"] if name == "overall" else before["endpoints"].get(name)
+        new = after["overall"] if name == "overall" else after["endpoints"].get(name)
+        if old is None or new is None:
+            rows.append({"endpoint": name, "only_in": "after" if old is None else "before"})
+            continue
+        row = {"endpoint": name}
+        for q in ("p50", "p95", "p99"):
+            a, b = old["latency_ms"][q], new["latency_ms"][q]
+            change = (b - a) / a if a else 0.0
+            row[q] = {"before": a, "after": b, "change": round(change, 4)}
+            if change > threshold and b - a >= MIN_LATENCY_DELTA_MS:
+                regressions.append(f"{name} {q} {a:.1f} -> {b:.1f} ms (+{change:.0%})")
+        a, b = old["throughput_rps"], new["throughput_rps"]
+        change = (b - a) / a if a else 0.0
+        row["throughput_rps"] = {"before": a, "after": b, "change": round(change, 4)}
+        if change < -threshold:
+            regressions.append(f"{name} throughput {a:.2f} -> {b:.2f} rps ({change:.0%})")
+        a, b = old["error_rate"], new["error_rate"]
+        row["error_rate"] = {"before": a, "after": b, "change": round(b - a, 4)}
+        if b - a > 0.01:
+            regressions.append(f"{name} error rate {a:.2%} -> {b:.2%}")
+        rows.append(row)
+    return rows, regressions
+
+
+def print_comparison(rows: List[dict], regressions: List[str]):
+    print(f"\n📊 Comparison (after vs before)")
+    print(f"{'endpoint':<10} {'p50 ms':>17} {'p95 ms':>17} {'p99 ms':>17} {'rps':>15} {'err%':>13}")
+    for row in rows:
+        if "only_in" in row:
+            print(f"{row['endpoint']:<10} only in {row['only_in']}")
+            continue
+        cells = [f"{row[q]['before']:.1f}→{row[q]['after']:.1f}" for q in ("p50", "p95", "p99")]
+        rps = f"{row['throughput_rps']['before']:.1f}→{row['throughput_rps']['after']:.1f}"
+        err = f"{row['error_rate']['before'] * 100:.1f}→{row['error_rate']['after'] * 100:.1f}"
+        print(f"{row['endpoint']:<10} {cells[0]:>17} {cells[1]:>17} {cells[2]:>17} {rps:>15} {err:>13}")
+    if regressions:
+        print("\n❌ Regressions:")
+        for regression in regressions:
+            print(f"  • {regression}")
+    else:
+        print("\n✅ No regressions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test with per-endpoint latency percentiles")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="generate load and report")
+    run.add_argument("--base-url", default="http://localhost:8000")
+    run.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted scenarios (default {DEFAULT_MIX}); also: catalog")
+    run.add_argument("--concurrency", type=int, default=10, help="closed loop: virtual users in parallel")
+    run.add_argument("--rate", type=float, default=0, help="open loop: scenario arrivals per second (overrides --concurrency)")
+    run.add_argument("--max-in-flight", type=int, default=200, help="open loop: arrivals beyond this are dropped")
+    run.add_argument("--duration", type=float, default=30, help="measured seconds")
+    run.add_argument("--warmup", type=float, default=5, help="seconds of load before measuring")
+    run.add_argument("--users", type=int, default=10, help="virtual users (mobiles) logged in at setup")
+    run.add_argument("--images", help="folder of test images for analyze (default: synthetic JPEGs)")
+    run.add_argument("--images-per-analyze", type=int, default=2, help="analyze sends 1..N images (the API accepts up to 2)")
+    run.add_argument("--timeout", type=float, default=120)
+    run.add_argument("--seed", type=int, default=None)
+    run.add_argument("--label", default="", help="free text stored in the report, e.g. a commit id")
+    run.add_argument("--out", help="write the JSON report here (default: stdout)")
+
+    compare = commands.add_parser("compare", help="diff two reports; exit 1 on regression")
+    compare.add_argument("before")
+    compare.add_argument("after")
+    compare.add_argument("--threshold", type=float, default=0.10, help="relative change treated as a regression")
+    compare.add_argument("--out", help="write the comparison JSON here")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        try:
+            report = asyncio.run(run_load(args))
+        except httpx.ConnectError:
+            raise SystemExit(f"❌ Connection error! Make sure the server is running at {args.base_url}")
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(report, f, indent=2)
+            print_report(report)
+            print(f"\n💾 Report written to {args.out}")
+        else:
+            print(json.dumps(report, indent=2))
+        return
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    rows, regressions = compare_reports(before, after, args.threshold)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"threshold": args.threshold, "endpoints": rows, "regressions": regressions}, f, indent=2)
+    print_comparison(rows, regressions)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
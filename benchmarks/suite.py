@@ -0,0 +1,417 @@
+"""
+Microbenchmark suite for the CPU-heavy matching and image code, across catalog sizes.
+
+Times the text helpers (normalize, tokenize_scientific_name, fuzzy_lookup), the catalog
+rebuild, every product search handler, and the image helpers (detect_image_type,
+optimize_image, select_best_image) on synthetic catalogs (1k..1M products) and synthetic
+phone-resolution photos. Each case reports median and interquartile range per call, plus
+the Python-heap peak of one call (tracemalloc; PIL pixel buffers live outside it).
+
+Results can be saved as a named baseline and later compared with a Mann-Whitney U test:
+a case only counts as a regression when its median moved by more than --threshold and
+the change is significant at --alpha.
+
+Baselines are committed: benchmarks/baselines/<name>.json is part of the repository, and
+main.json is the reference a PR is compared against. It is recorded with
+--sizes 1k,10k,100k,1m so the scaling of the batch search to the largest catalog is
+measured; compare with the same sizes. Timings only compare on the same
+hardware and Python, so refresh main.json (--save main on main, then commit it) whenever
+the benchmark host changes, and after merges that move the numbers on purpose.
+--compare warns when the baseline's host differs from the current one.
+
+Usage:
+    python -m benchmarks.suite [--sizes 1k,10k,100k] [--filter search] [--out results.json]
+    python -m benchmarks.suite --sizes 1k,10k,100k,1m --save main      # on main
+    python -m benchmarks.suite --sizes 1k,10k,100k,1m --compare main   # on the PR branch; exits 1 on regression
+    python -m benchmarks.suite --sizes 1k,10k,100k,1m --no-caps   # everything, slow
+"""
+import io
+import os
+import sys
+import gc
+import json
+import math
+import time
+import random
+import string
+import asyncio
+import argparse
+import logging
+import platform
+import tracemalloc
+from datetime import datetime, timezone
+from itertools import cycle
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi import HTTPException  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+from app.services import product_cache  # noqa: E402
+from app.services.match_utils import normalize, tokenize_scientific_name, fuzzy_lookup  # noqa: E402
+from app.services.image_utils import detect_image_type, optimize_image, select_best_image  # noqa: E402
+from app.services.catalog_response import CatalogResponseCache  # noqa: E402
+from app.controllers.product_controller import (  # noqa: E402
+    search_products, search_products_batch, get_products_by_scientific_name, typeahead, get_products_by_disease,
+)
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+# Phone photo sizes: 12 MP landscape / portrait, FHD, and a messenger-resized upload
+RESOLUTIONS = {"12mp": (4032, 3024), "12mp_portrait": (3024, 4032), "fhd": (1920, 1080), "messenger": (1600, 1200)}
+# Full linear scans (one fuzzy score per product) above this are skipped unless --no-caps
+LINEAR_SCAN_CAP = 100_000
+# Target wall time of one sample; fast calls are looped to reach it
+SAMPLE_SECONDS = 0.01
+MIN_SAMPLES, MAX_SAMPLES = 5, 40
+QUERIES = 16
+
+
+# ----------------------------------------------------------------------------- data
+
+def _word(rng: random.Random, low: int = 4, high: int = 10) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+
+def _scientific_name(rng: random.Random, ranks: Tuple[str, ...]) -> str:
+    """Genus species, sometimes with a rank (var., subsp., pv., f. sp.) or as "Genus spp."."""
+    genus = _word(rng, 5, 11).capitalize()
+    roll = rng.random()
+    if roll < 0.08:
+        return f"{genus} spp."
+    name = f"{genus} {_word(rng, 5, 12)}"
+    if roll < 0.25:
+        name += f" {rng.choice(ranks)} {_word(rng, 5, 10)}"
+    return name
+
+
+def make_catalog(size: int, seed: int = 7) -> Dict[str, Any]:
+    """
+    Synthetic catalog shaped like the real one: many products per disease/plant name
+    (distinct names grow sub-linearly), plus search queries with typical noise.
+    """
+    rng = random.Random(seed)
+    diseases = [_scientific_name(rng, ("pv.", "f. sp.", "subsp.")) for _ in range(max(50, min(size // 20, 50_000)))]
+    plants = [_scientific_name(rng, ("var.", "subsp.")) for _ in range(max(20, min(size // 50, 20_000)))]
+    common = [f"{_word(rng).capitalize()} {rng.choice(('blight', 'rot', 'spot', 'mildew', 'rust', 'wilt', 'mosaic'))}"
+              for _ in range(len(diseases))]
+    products = []
+    for i in range(size):
+        d = rng.randrange(len(diseases))
+        products.append({
+            "id": i + 1,
+            "name": f"{_word(rng).capitalize()} {rng.choice(('WP', 'EC', 'SC', 'WG'))} {rng.randint(5, 80)}",
+            "scientific_name": rng.choice(plants),
+            "disease": common[d],
+            "disease_scientific_name": diseases[d],
+            "product_link": f"https://example.com/p/{i}",
+            "how_to_use": " ".join(_word(rng) for _ in range(12)),
+            "product_image": f"https://example.com/img/{i}.jpg",
+        })
+
+    def noisy(name: str) -> str:
+        roll = rng.random()
+        if roll < 0.3:
+            return name.upper()
+        if roll < 0.6 and len(name) > 6:
+            i = rng.randrange(1, len(name) - 1)
+            return name[:i] + rng.choice(string.ascii_lowercase) + name[i + 1:]
+        return name
+
+    pairs = [(noisy(p["disease_scientific_name"]), noisy(p["scientific_name"])) for p in rng.sample(products, min(QUERIES, size))]
+    return {"products": products, "pairs": pairs, "diseases": diseases, "common": common}
+
+
+def make_photo(width: int, height: int, kind: str, seed: int = 7) -> bytes:
+    """Phone-like JPEG: "close_up" is a busy leaf texture, "wide_view" a smooth scene."""
+    rng = random.Random(seed)
+    if kind == "close_up":
+        image = Image.effect_noise((width, height), 60).convert("RGB")
+        draw = ImageDraw.Draw(image)
+        for _ in range(400):
+            x, y, r = rng.randrange(width), rng.randrange(height), rng.randint(4, 40)
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=(rng.randint(60, 140), rng.randint(40, 90), 20))
+    else:
+        image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((width // 4, height // 3, width * 3 // 4, height), fill=(40, 130, 50))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+# ----------------------------------------------------------------------------- measuring
+
+def measure(func: Callable[[], Any], budget: float) -> Dict[str, Any]:
+    """
+    Per-call timings: one warmup call sizes the inner loop so each sample takes about
+    SAMPLE_SECONDS, then samples are taken until `budget` seconds (MIN..MAX_SAMPLES).
+    Peak memory is taken from one extra call under tracemalloc (never timed).
+    """
+    started = time.perf_counter()
+    func()
+    first = time.perf_counter() - started
+    number = max(1, int(SAMPLE_SECONDS / max(first, 1e-9)))
+    count = min(MAX_SAMPLES, max(MIN_SAMPLES, int(budget / max(first * number, 1e-9))))
+
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(count):
+            started = time.perf_counter()
+            for _ in range(number):
+                func()
+            samples.append((time.perf_counter() - started) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    ordered = sorted(samples)
+    return {
+        "median": quantile(ordered, 0.5),
+        "p25": quantile(ordered, 0.25),
+        "p75": quantile(ordered, 0.75),
+        "loops": number,
+        "peak_bytes": peak,
+        "samples": [round(s, 9) for s in samples],
+    }
+
+
+def quantile(ordered: List[float], q: float) -> float:
+    position = (len(ordered) - 1) * q
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def mann_whitney_p(a: List[float], b: List[float]) -> float:
+    """Two-sided Mann-Whitney U p-value (normal approximation with tie correction)."""
+    n1, n2 = len(a), len(b)
+    if not n1 or not n2:
+        return 1.0
+    ranked = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    ranks = [0.0] * len(ranked)
+    ties = 0.0
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        t = j - i + 1
+        ties += t ** 3 - t
+        i = j + 1
+    r1 = sum(rank for rank, (_, group) in zip(ranks, ranked) if group == 0)
+    u = r1 - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (abs(u - n1 * n2 / 2) - 0.5) / math.sqrt(variance)
+    return math.erfc(max(z, 0.0) / math.sqrt(2))
+
+
+# ----------------------------------------------------------------------------- cases
+
+def text_cases(names: List[str]) -> List[Tuple[str, Callable[[], Any]]]:
+    """Size-independent: per-call cost over a fixed batch of 1000 raw names."""
+    batch = names[:1000]
+    choices = tuple(normalize(name) for name in names[:500])
+    queries = cycle(batch[:QUERIES])
+    return [
+        ("text.normalize[x1000]", lambda: [normalize(name) for name in batch]),
+        ("text.tokenize_scientific_name[x1000]", lambda: [tokenize_scientific_name(name) for name in batch]),
+        # The undecorated function: the lru_cache would otherwise turn every repeat into a hit
+        ("text.fuzzy_lookup[500 choices]", lambda: fuzzy_lookup.__wrapped__(normalize(next(queries)), choices)),
+    ]
+
+
+def catalog_cases(label: str, catalog: Dict[str, Any], caps: bool) -> List[Tuple[str, Callable[[], Any]]]:
+    products, pairs = catalog["products"], catalog["pairs"]
+    size = len(products)
+    pair_cycle = cycle(pairs)
+    disease_cycle = cycle(catalog["common"])
+    prefix_cycle = cycle([name[:3] for name in catalog["diseases"][:QUERIES]])
+    typo_cycle = cycle(["q" + name[1:] for name in catalog["diseases"][:QUERIES]])
+    loop = asyncio.new_event_loop()
+
+    def legacy():
+        try:
+            return loop.run_until_complete(get_products_by_scientific_name(*next(pair_cycle)))
+        except HTTPException:
+            return []
+
+    cases = [
+        (f"catalog.rebuild_indexes[{label}]", lambda: product_cache.rebuild_indexes(products)),
+        (f"catalog.serialize[{label}]", lambda: CatalogResponseCache._serialize(products, None, 0, None)),
+        (f"search.batch[{label},16 pairs]", lambda: search_products_batch(pairs)),
+        (f"search.typeahead_prefix[{label}]", lambda: typeahead(next(prefix_cycle))),
+        (f"search.typeahead_fuzzy[{label}]", lambda: typeahead(next(typo_cycle))),
+        (f"search.by_disease[{label}]", lambda: get_products_by_disease(next(disease_cycle).split()[0].lower())),
+    ]
+    if not caps or size <= LINEAR_SCAN_CAP:
+        cases += [
+            (f"search.search_products[{label}]", lambda: search_products(*next(pair_cycle))),
+            (f"search.legacy_handler[{label}]", legacy),
+        ]
+    return cases
+
+
+def image_cases(resolutions: List[str]) -> List[Tuple[str, Callable[[], Any]]]:
+    cases = []
+    for name in resolutions:
+        width, height = RESOLUTIONS[name]
+        photos = {kind: make_photo(width, height, kind) for kind in ("close_up", "wide_view")}
+        for kind, data in photos.items():
+            cases.append((f"image.detect_image_type[{name},{kind}]", lambda data=data: detect_image_type(data)))
+            cases.append((f"image.optimize_image[{name},{kind}]", lambda data=data, kind=kind: optimize_image(data, kind)))
+        pair = [photos["wide_view"], photos["close_up"]]
+        cases.append((f"image.select_best_image[{name},2 photos]", lambda pair=pair: select_best_image(pair)))
+    return cases
+
+
+# ----------------------------------------------------------------------------- reporting
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:8.1f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:8.2f} ms"
+    return f"{seconds:8.2f} s "
+
+
+# Meta fields that must match for timings to be comparable
+HOST_KEYS = ("python", "machine", "processor", "cpus")
+
+
+def compare(baseline: Dict[str, Any], results: Dict[str, Any], threshold: float, alpha: float) -> List[str]:
+    """Prints per-case change vs baseline; returns the significant regressions."""
+    regressions = []
+    meta = baseline["meta"]
+    differences = [f"{key} {meta.get(key)} vs {results['meta'].get(key)}" for key in HOST_KEYS if meta.get(key) != results["meta"].get(key)]
+    if differences:
+        print(f"\n⚠️  Baseline was recorded on another host ({', '.join(differences)}): timings may not compare, re-save it here")
+    print(f"\n📊 Versus baseline {baseline['meta'].get('name') or ''} ({baseline['meta']['created_at']})")
+    print(f"{'case':<58} {'before':>11} {'after':>11} {'change':>8} {'p':>7}  verdict")
+    for name, result in results["cases"].items():
+        old = baseline["cases"].get(name)
+        if old is None:
+            print(f"{name:<58} {'-':>11} {format_seconds(result['median'])} {'new':>8}")
+            continue
+        change = result["median"] / old["median"] - 1 if old["median"] else 0.0
+        p = mann_whitney_p(old["samples"], result["samples"])
+        verdict = ""
+        if p < alpha and change > threshold:
+            verdict = "❌ slower"
+            regressions.append(f"{name}: {format_seconds(old['median']).strip()} -> {format_seconds(result['median']).strip()} (+{change:.0%}, p={p:.3g})")
+        elif p < alpha and change < -threshold:
+            verdict = "✅ faster"
+        mem_change = result["peak_bytes"] / old["peak_bytes"] - 1 if old["peak_bytes"] else 0.0
+        if mem_change > threshold and result["peak_bytes"] - old["peak_bytes"] > 64 * 1024:
+            verdict += " ❌ memory"
+            regressions.append(f"{name}: peak {old['peak_bytes'] // 1024} -> {result['peak_bytes'] // 1024} KiB (+{mem_change:.0%})")
+        print(f"{name:<58} {format_seconds(old['median'])} {format_seconds(result['median'])} {change:>+8.1%} {p:>7.3f}  {verdict}")
+    return regressions
+
+
+def baseline_path(name: str) -> str:
+    return name if name.endswith(".json") else os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def run(args) -> Dict[str, Any]:
+    selected = lambda name: not args.filter or any(f in name for f in args.filter.split(","))  # noqa: E731
+    results: Dict[str, Any] = {}
+
+    def record(cases: List[Tuple[str, Callable[[], Any]]]):
+        for name, func in cases:
+            if not selected(name):
+                continue
+            result = measure(func, args.budget)
+            results[name] = result
+            spread = (result["p75"] - result["p25"]) / result["median"] if result["median"] else 0.0
+            print(f"{name:<58} {format_seconds(result['median'])} ±{spread:>6.1%}  peak {result['peak_bytes'] / 1024:>10.0f} KiB")
+
+    print(f"{'case':<58} {'median':>11} {'IQR':>8}  {'python heap peak':>20}")
+    sample = make_catalog(1_000)
+    record(text_cases([p["disease_scientific_name"] for p in sample["products"]]))
+    for label in args.sizes.split(","):
+        size = SIZES[label.strip().lower()]
+        started = time.perf_counter()
+        catalog = make_catalog(size)
+        product_cache.rebuild_indexes(catalog["products"])
+        print(f"— {label}: synthetic catalog of {size} products built in {time.perf_counter() - started:.1f}s")
+        record(catalog_cases(label, catalog, caps=not args.no_caps))
+        del catalog
+        product_cache.rebuild_indexes([])
+        gc.collect()
+    if args.resolutions:
+        record(image_cases([r.strip() for r in args.resolutions.split(",")]))
+
+    return {
+        "meta": {
+            "name": args.save,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+            "sizes": args.sizes,
+            "resolutions": args.resolutions,
+        },
+        "cases": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matching / image microbenchmarks with baselines")
+    parser.add_argument("--sizes", default="1k,10k,100k", help=f"catalog sizes from {', '.join(SIZES)}")
+    parser.add_argument("--resolutions", default="12mp,fhd", help=f"photo sizes from {', '.join(RESOLUTIONS)} ('' = none)")
+    parser.add_argument("--filter", default="", help="comma-separated substrings of case names to run")
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds of sampling per case")
+    parser.add_argument("--no-caps", action="store_true", help=f"also run linear-scan searches above {LINEAR_SCAN_CAP} products")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--save", help=f"store results as a named baseline in {BASELINE_DIR}")
+    parser.add_argument("--compare", help="baseline name (or .json path) to compare against; exits 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.05, help="relative median change that counts")
+    parser.add_argument("--alpha", type=float, default=0.01, help="significance level of the Mann-Whitney U test")
+    args = parser.parse_args()
+    # Search handlers log every query; keep that cost (and the noise) out of the numbers
+    logging.disable(logging.CRITICAL)
+
+    baseline = None
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)
+
+    results = run(args)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(args.save), "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"\n💾 Baseline saved to {baseline_path(args.save)}")
+    if baseline is not None:
+        regressions = compare(baseline, results, args.threshold, args.alpha)
+        if regressions:
+            print("\n❌ Significant regressions:")
+            for regression in regressions:
+                print(f"  • {regression}")
+            sys.exit(1)
+        print("\n✅ No significant regressions")
+
+
+if __name__ == "__main__":
+    main()
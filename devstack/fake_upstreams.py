@@ -0,0 +1,181 @@
+"""
+Local stand-ins for the external services, for offline end-to-end and load testing.
+
+- POST /v1/chat/completions : OpenAI-compatible chat completions (plain and stream=true)
+                              returning canned analysis JSON after a sampled latency
+- GET  /sms                 : E2A-style SMS gateway (same query params), records messages
+- GET  /sms/outbox          : most recent messages "sent"
+
+Point the API at it with:
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1
+    E2A_API_URL=http://127.0.0.1:8900/sms
+    STORAGE_BACKEND=local          (filesystem instead of S3, see app/utils/s3_uploader.py)
+
+Latency specs: "fixed:S", "uniform:LO,HI", "normal:MEAN,STD", "lognormal:MEDIAN,SIGMA" (seconds).
+
+Usage: python -m devstack.fake_upstreams [--port 8900]
+"""
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+from itertools import cycle
+from uuid import uuid4
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_OPENAI_LATENCY = os.getenv("FAKE_OPENAI_LATENCY", "lognormal:2.5,0.35")
+FAKE_OPENAI_ERROR_RATE = float(os.getenv("FAKE_OPENAI_ERROR_RATE", 0))
+# JSON file holding one canned analysis object or a list of them (served round-robin)
+FAKE_OPENAI_RESPONSE_FILE = os.getenv("FAKE_OPENAI_RESPONSE_FILE")
+FAKE_OPENAI_STREAM_CHUNKS = int(os.getenv("FAKE_OPENAI_STREAM_CHUNKS", 20))
+FAKE_SMS_LATENCY = os.getenv("FAKE_SMS_LATENCY", "lognormal:0.3,0.3")
+FAKE_SMS_ERROR_RATE = float(os.getenv("FAKE_SMS_ERROR_RATE", 0))
+
+DEFAULT_ANALYSES = [
+    {
+        "common_name": "Tomato",
+        "scientific_name": "Solanum lycopersicum",
+        "plant_confidence": "94%",
+        "disease": ["Early blight"],
+        "disease_scientific_name": ["Alternaria solani"],
+        "disease_confidence": ["88%"],
+        "symptoms": ["concentric leaf spots"],
+        "cause": ["Fungal infection favoured by warm, humid weather."],
+        "treatment": ["Remove affected leaves and apply a copper-based fungicide."],
+    },
+    {
+        "common_name": "Potato",
+        "scientific_name": "Solanum tuberosum",
+        "plant_confidence": "91%",
+        "disease": ["Late blight"],
+        "disease_scientific_name": ["Phytophthora infestans"],
+        "disease_confidence": ["85%"],
+        "symptoms": ["dark water-soaked lesions"],
+        "cause": ["Oomycete spread by wind and rain in cool, wet conditions."],
+        "treatment": ["Destroy infected plants and spray mancozeb preventively."],
+    },
+]
+
+
+def parse_latency(spec: str):
+    """"lognormal:2.5,0.35" -> zero-arg sampler returning seconds (never negative)."""
+    kind, _, args = spec.partition(":")
+    params = [float(value) for value in args.split(",") if value.strip()]
+    kind = kind.strip().lower()
+    if kind == "fixed":
+        return lambda: params[0]
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(params[0]), params[1])
+    raise ValueError(f"Unknown latency distribution: {spec!r}")
+
+
+def load_analyses():
+    if not FAKE_OPENAI_RESPONSE_FILE:
+        return DEFAULT_ANALYSES
+    with open(FAKE_OPENAI_RESPONSE_FILE) as f:
+        data = json.load(f)
+    return data if isinstance(data, list) else [data]
+
+
+openai_latency = parse_latency(FAKE_OPENAI_LATENCY)
+sms_latency = parse_latency(FAKE_SMS_LATENCY)
+analyses = cycle(load_analyses())
+outbox = deque(maxlen=100)
+counters = {"chat_completions": 0, "chat_errors": 0, "sms": 0, "sms_errors": 0}
+
+app = FastAPI(title="Fake upstreams")
+
+
+def _completion_id() -> str:
+    return f"chatcmpl-fake-{uuid4().hex[:12]}"
+
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"error": {"message": message, "type": "server_error", "code": None}})
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-4o")
+    counters["chat_completions"] += 1
+    latency = openai_latency()
+
+    if random.random() < FAKE_OPENAI_ERROR_RATE:
+        counters["chat_errors"] += 1
+        await asyncio.sleep(latency / 2)
+        return _error(503, "Fake upstream overloaded")
+
+    content = json.dumps(next(analyses))
+    completion_id = _completion_id()
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep(latency)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 850, "completion_tokens": len(content) // 4, "total_tokens": 850 + len(content) // 4},
+        }
+
+    async def events():
+        # ~30% of the latency before the first token, the rest spread over the chunks
+        await asyncio.sleep(latency * 0.3)
+        size = max(1, math.ceil(len(content) / FAKE_OPENAI_STREAM_CHUNKS))
+        pieces = [content[i:i + size] for i in range(0, len(content), size)]
+        for piece in pieces:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(latency * 0.7 / len(pieces))
+        final = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/sms")
+async def send_sms(request: Request):
+    counters["sms"] += 1
+    await asyncio.sleep(sms_latency())
+    if random.random() < FAKE_SMS_ERROR_RATE:
+        counters["sms_errors"] += 1
+        return JSONResponse(status_code=502, content={"status": "failed"})
+    params = dict(request.query_params)
+    params.pop("key", None)
+    outbox.append({**params, "sent_at": time.time()})
+    return {"status": "success", "message_id": uuid4().hex}
+
+
+@app.get("/sms/outbox")
+def sms_outbox(to: str = None):
+    messages = [m for m in outbox if to is None or m.get("to") == to]
+    return {"messages": list(reversed(messages))}
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "openai_latency": FAKE_OPENAI_LATENCY, "sms_latency": FAKE_SMS_LATENCY, **counters}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")